@@ -0,0 +1,50 @@
+from redis import Redis
+
+from settings import (
+    settings,
+    CACHE_INVALIDATION_CHANNEL,
+    CONTENT_VERSION_KEY_PREFIX,
+    DOCUMENT_CACHE_KEY_PREFIXES
+)
+
+
+class ApiCache:
+    """Кэш Async API в Redis, который устаревает при загрузке данных в ES.
+
+    Async API хранит версию индекса вместе с закэшированными результатами
+    поиска, поэтому увеличение версии делает их устаревшими. Документы
+    удаляются из Redis по ключам, а их ключи публикуются в канал, чтобы
+    каждый процесс Async API удалил их из своего локального кэша.
+    """
+
+    def __init__(self) -> None:
+        self.redis = Redis(
+            host=settings.redis_settings.redis_host,
+            port=settings.redis_settings.redis_port
+        )
+
+    def bump_content_versions(self, index_names: set) -> None:
+        """Увеличить версии содержимого индексов одним запросом."""
+        if not index_names:
+            return
+
+        pipeline = self.redis.pipeline()
+        for index_name in index_names:
+            pipeline.incr(f'{CONTENT_VERSION_KEY_PREFIX}{index_name}')
+        pipeline.execute()
+
+    def invalidate_documents(self, index_name: str, documents: list) -> None:
+        """Удалить загруженные документы индекса из кэшей Async API."""
+        keys = [
+            f'{DOCUMENT_CACHE_KEY_PREFIXES[index_name]}{document["id"]}'
+            for document in documents
+        ]
+        if not keys:
+            return
+
+        # Сначала удалить документы из Redis, чтобы процессы Async API
+        # после удаления из локального кэша не прочитали старые версии
+        pipeline = self.redis.pipeline()
+        pipeline.delete(*keys)
+        pipeline.publish(CACHE_INVALIDATION_CHANNEL, ' '.join(keys))
+        pipeline.execute()
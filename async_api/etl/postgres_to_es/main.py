@@ -24,11 +24,13 @@ from transform_data import (
     transform_person_data
 )
 from search import Search
+from api_cache import ApiCache
 
 
 if __name__ == '__main__':
     # Создать соединение с ES
     es = Search()
+    api_cache = ApiCache()
 
     with open(FILE_PATH_TO_ES_SCHEMA, 'rt') as f:
         settings_mappings_data = json.load(f)
@@ -37,8 +39,9 @@ if __name__ == '__main__':
         genres_es_index_mappings = settings_mappings_data['mappings']['genres']
         persons_es_index_mappings = settings_mappings_data['mappings']['persons']
 
+    index_names = [MOVIES_INDEX_NAME, GENRES_INDEX_NAME, PERSONS_INDEX_NAME]
     for index_name, index_mapping in zip(
-        [MOVIES_INDEX_NAME, GENRES_INDEX_NAME, PERSONS_INDEX_NAME],
+        index_names,
         [movies_es_index_mappings, genres_es_index_mappings, persons_es_index_mappings]
     ):
         # Создать индекс
@@ -51,6 +54,9 @@ if __name__ == '__main__':
         # Получить информацию об индексе
         es.get_index_information(index_name=index_name)
 
+    # Индексы созданы заново, закэшированные результаты поиска устарели
+    api_cache.bump_content_versions(set(index_names))
+
     # Создать планировщик
     scheduler = BlockingScheduler()
 
@@ -63,6 +69,8 @@ if __name__ == '__main__':
         film_works_to_es = []
         genres_to_es = []
         persons_to_es = []
+        # Индексы, данные которых изменились за время выполнения
+        changed_index_names = set()
 
         # Выгружаем состояние из хранилища
         state_storage = state.get_state()
@@ -99,6 +107,11 @@ if __name__ == '__main__':
                 index_name=MOVIES_INDEX_NAME,
                 documents=validated_film_works_to_es
             )
+            changed_index_names.add(MOVIES_INDEX_NAME)
+            api_cache.invalidate_documents(
+                MOVIES_INDEX_NAME,
+                validated_film_works_to_es
+            )
             # Установить состояние в каждом субхранилище
             # for substorage in SUBSTORAGES:
             state.set_state(
@@ -118,6 +131,11 @@ if __name__ == '__main__':
                 index_name=GENRES_INDEX_NAME,
                 documents=validated_genres_to_es
             )
+            changed_index_names.add(GENRES_INDEX_NAME)
+            api_cache.invalidate_documents(
+                GENRES_INDEX_NAME,
+                validated_genres_to_es
+            )
             # Установить состояние в хранилище
             state.set_state(
                 'genre_data', genre_substorage_states['genre_data']
@@ -135,11 +153,20 @@ if __name__ == '__main__':
                 index_name=PERSONS_INDEX_NAME,
                 documents=validated_persons_to_es
             )
+            changed_index_names.add(PERSONS_INDEX_NAME)
+            api_cache.invalidate_documents(
+                PERSONS_INDEX_NAME,
+                validated_persons_to_es
+            )
             # Установить состояние в хранилище
             state.set_state(
                 'person_data', person_substorage_states['person_data']
             )
 
+        # Версия каждого изменившегося индекса увеличивается один раз
+        # за выполнение, а не после загрузки каждой пачки
+        api_cache.bump_content_versions(changed_index_names)
+
     # Планирование задания
     scheduler.add_job(
         postgres_to_es,
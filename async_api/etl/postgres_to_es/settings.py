@@ -28,9 +28,15 @@ class ElasticsearchSettings(EnvSettings):
     elasticsearch_host: str = Field(default="http://elasticsearch:9200")
 
 
+class RedisSettings(EnvSettings):
+    redis_host: str = Field(default="redis")
+    redis_port: int = Field(default=6379)
+
+
 class Settings(BaseSettings):
     db_settings: DatabaseSettings = DatabaseSettings()
     es_settings: ElasticsearchSettings = ElasticsearchSettings()
+    redis_settings: RedisSettings = RedisSettings()
 
 
 settings = Settings()
@@ -72,6 +78,20 @@ MOVIES_INDEX_NAME = 'movies'
 GENRES_INDEX_NAME = 'genres'
 PERSONS_INDEX_NAME = 'persons'
 
+# Определить префикс ключа Redis с версией содержимого индекса ES. Версия
+# увеличивается при каждой загрузке данных в индекс, чтобы Async API
+# перестал читать закэшированные результаты поиска предыдущей версии
+CONTENT_VERSION_KEY_PREFIX = 'content_version_'
+
+# Определить префиксы ключей документов индексов ES в кэше Async API и канал
+# Redis, в который публикуются ключи загруженных документов
+DOCUMENT_CACHE_KEY_PREFIXES = {
+    MOVIES_INDEX_NAME: 'movie_',
+    GENRES_INDEX_NAME: 'genre_',
+    PERSONS_INDEX_NAME: 'person_',
+}
+CACHE_INVALIDATION_CHANNEL = 'cache_invalidation'
+
 # Определить время, через которое планировщик задач будет
 # запускать ETL-процесс, сек.
 SCHEDULER_TIME_INTERVAL = 10
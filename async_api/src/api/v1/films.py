@@ -84,7 +84,6 @@ async def films(
     background_tasks.add_task(
         send_message_task,
         request=request,
-        router=router,
         topic=AsyncAPITopics.FILM_TOPIC.value,
         partition_key=FilmTopicPartitions.GET_FILMS.value,
         query_parameters={
@@ -146,7 +145,6 @@ async def search_films(
     background_tasks.add_task(
         send_message_task,
         request=request,
-        router=router,
         topic=AsyncAPITopics.FILM_TOPIC.value,
         partition_key=FilmTopicPartitions.SEARCH_FILMS_BY_KEYWORD.value,
         query_parameters={
@@ -199,7 +197,6 @@ async def film_details(
     background_tasks.add_task(
         send_message_task,
         request=request,
-        router=router,
         topic=AsyncAPITopics.FILM_TOPIC.value,
         partition_key=FilmTopicPartitions.GET_FILM_BY_ID.value,
         query_parameters={
@@ -62,7 +62,6 @@ async def genres(
     background_tasks.add_task(
         send_message_task,
         request,
-        router,
         AsyncAPITopics.GENRE_TOPIC.value,
         GenreTopicPartitions.GET_GENRES.value,
         query_parameters={
@@ -109,7 +108,6 @@ async def genre_details(
     background_tasks.add_task(
         send_message_task,
         request,
-        router,
         AsyncAPITopics.GENRE_TOPIC.value,
         GenreTopicPartitions.GET_GENRE_BY_ID.value,
         query_parameters={
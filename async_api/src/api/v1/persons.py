@@ -66,7 +66,6 @@ async def search_persons(
     background_tasks.add_task(
         send_message_task,
         request,
-        router,
         AsyncAPITopics.PERSON_TOPIC.value,
         PersonTopicPartitions.SEARCH_PERSONS_BY_KEYWORD.value,
         query_parameters={
@@ -112,7 +111,6 @@ async def person_details(
     background_tasks.add_task(
         send_message_task,
         request,
-        router,
         AsyncAPITopics.PERSON_TOPIC.value,
         PersonTopicPartitions.GET_PERSON_BY_ID.value,
         query_parameters={
@@ -1,3 +1,4 @@
+import asyncio
 from elasticsearch import AsyncElasticsearch
 from fastapi import FastAPI
 from fastapi.responses import ORJSONResponse
@@ -6,7 +7,7 @@ from contextlib import asynccontextmanager
 
 from src.api.v1 import films, persons, genres
 from src.core.config import settings
-from src.db import elastic, redis
+from src.db import elastic, kafka, local_cache, redis
 
 
 @asynccontextmanager
@@ -21,10 +22,26 @@ async def lifespan(_: FastAPI):
             settings.es_settings.elasticsearch_host,
         ],
     )
+    # Hot documents are kept in the memory of every worker in front of Redis
+    local_cache.local_cache = local_cache.LocalCache(
+        max_size=settings.local_cache_settings.local_cache_max_size,
+        ttl_sec=settings.local_cache_settings.local_cache_ttl_sec,
+    )
+    invalidations = asyncio.create_task(
+        local_cache.listen_for_invalidations(
+            local_cache.local_cache,
+            redis.redis,
+        )
+    )
+    # One producer per worker sends the page views of all the requests
+    kafka.producer = kafka.PageViewProducer()
+    kafka.producer.start()
     yield
-    # close redis and elastic
+    # close redis, elastic and kafka
+    invalidations.cancel()
     await redis.redis.close()
     await elastic.es.close()
+    await kafka.producer.stop()
 
 
 app = FastAPI(
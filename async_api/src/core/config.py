@@ -21,6 +21,8 @@ class ProjectSettings(BaseModel):
 class AuthJWT(BaseModel):
     public_key_path: Path = BASE_DIR / "certs" / "public.pem"
     algorithm: str = "RS256"
+    # Number of the verified tokens kept until they expire
+    verified_token_cache_size: int = 4096
 
 
 class EnvSettings(BaseSettings):
@@ -34,6 +36,18 @@ class EnvSettings(BaseSettings):
 class RedisSettings(EnvSettings):
     redis_host: str = Field(default="redis")
     redis_port: int = Field(default=6379)
+    film_list_cache_expire_in_seconds: int = Field(default=60)
+    # Time the expired documents are served for while they are refreshed,
+    # 0 disables serving them
+    stale_while_revalidate_sec: int = Field(default=0)
+
+
+class LocalCacheSettings(EnvSettings):
+    # In-process cache of the documents in front of Redis
+    local_cache_max_size: int = Field(default=10_000)
+    local_cache_ttl_sec: float = Field(default=30)
+    local_cache_stats_report_interval_sec: float = Field(default=60)
+    local_cache_resubscribe_delay_sec: float = Field(default=1)
 
 
 class ElasticsearchSettings(EnvSettings):
@@ -42,11 +56,19 @@ class ElasticsearchSettings(EnvSettings):
 
 class KafkaSettings(EnvSettings):
     bootstrap_servers: str = Field(default="kafka:9092")
+    producer_linger_ms: int = Field(default=20)
+    producer_max_batch_size: int = Field(default=64 * 1024)
+    producer_compression_type: str = Field(default="gzip")
+    # Messages waiting to be sent, the ones that do not fit are dropped
+    producer_queue_size: int = Field(default=10_000)
+    producer_drain_timeout_sec: float = Field(default=5)
+    producer_reconnect_delay_sec: float = Field(default=5)
 
 
 class Settings(BaseSettings):
     project_settings: ProjectSettings = ProjectSettings()
     redis_settings: RedisSettings = RedisSettings()
+    local_cache_settings: LocalCacheSettings = LocalCacheSettings()
     es_settings: ElasticsearchSettings = ElasticsearchSettings()
     kafka_settings: KafkaSettings = KafkaSettings()
     jwt_settings: AuthJWT = AuthJWT()
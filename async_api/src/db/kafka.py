@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from contextlib import suppress
+from typing import Optional
+
+import orjson
+from aiokafka import AIOKafkaProducer
+from aiokafka.errors import KafkaError
+
+from src.core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class PageViewProducer:
+    """
+    Long-lived Kafka producer of the worker process.
+
+    The messages are put into a bounded queue and sent by a single task,
+    so when Kafka is slow or unavailable the messages that do not fit into
+    the queue are dropped instead of piling up the background tasks of the
+    requests. The producer batches and compresses the messages of all the
+    requests together.
+    """
+
+    def __init__(self):
+        self.kafka_settings = settings.kafka_settings
+        self.queue: asyncio.Queue = asyncio.Queue(
+            maxsize=self.kafka_settings.producer_queue_size
+        )
+        self.producer: Optional[AIOKafkaProducer] = None
+        self.dropped = 0
+        self._sender: Optional[asyncio.Task] = None
+
+    def start(self):
+        # Kafka is connected in the background, so the API is served
+        # even if Kafka is not available yet
+        self._sender = asyncio.create_task(self._send_queued())
+
+    async def stop(self):
+        try:
+            await asyncio.wait_for(
+                self.queue.join(),
+                timeout=self.kafka_settings.producer_drain_timeout_sec,
+            )
+        except asyncio.TimeoutError:
+            self._drop(self.queue.qsize(), 'stopped before sent')
+        # The producer is stopped after the sender task is done, so the
+        # task does not send to the stopped producer
+        self._sender.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._sender
+        if self.producer is not None:
+            # Sends the batches left in the producer
+            await self.producer.stop()
+
+    def send(self, topic: str, key: str, value: dict):
+        try:
+            self.queue.put_nowait((topic, key, value))
+        except asyncio.QueueFull:
+            self._drop(1, 'send queue is full')
+
+    def _drop(self, count: int, reason: str):
+        # Log the first dropped message and then every thousand ones, the
+        # messages dropped at once may step over a multiple of the thousand
+        total = self.dropped + count
+        if not self.dropped or total // 1000 != self.dropped // 1000:
+            logger.warning(
+                'Page view messages are dropped (%s), %d dropped in total',
+                reason,
+                total,
+            )
+        self.dropped = total
+
+    def _on_delivered(self, future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            self._drop(1, repr(future.exception()))
+
+    async def _connect(self):
+        while True:
+            producer = AIOKafkaProducer(
+                bootstrap_servers=self.kafka_settings.bootstrap_servers,
+                key_serializer=lambda k: k.encode('utf-8'),
+                value_serializer=orjson.dumps,
+                linger_ms=self.kafka_settings.producer_linger_ms,
+                max_batch_size=self.kafka_settings.producer_max_batch_size,
+                compression_type=self.kafka_settings.producer_compression_type,
+            )
+            try:
+                await producer.start()
+            except KafkaError as e:
+                await producer.stop()
+                logger.warning('Kafka is not available: %r', e)
+                await asyncio.sleep(
+                    self.kafka_settings.producer_reconnect_delay_sec
+                )
+                continue
+            self.producer = producer
+            return
+
+    async def _send_queued(self):
+        await self._connect()
+        while True:
+            topic, key, value = await self.queue.get()
+            try:
+                # Waits only when the batch of the partition is full
+                future = await self.producer.send(topic, value=value, key=key)
+            except Exception as e:
+                self._drop(1, repr(e))
+            else:
+                future.add_done_callback(self._on_delivered)
+            finally:
+                self.queue.task_done()
+
+
+producer: Optional[PageViewProducer] = None
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Optional
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Channel the ETL publishes the keys of the changed documents to
+INVALIDATION_CHANNEL = 'cache_invalidation'
+
+
+class LocalCache:
+    """
+    In-process LRU cache with TTL in front of Redis.
+
+    It keeps the parsed documents under their Redis keys, so the hot
+    documents are served without a round trip to Redis and without parsing.
+    The keys of the documents changed by the ETL are dropped on the
+    invalidation messages, so every worker sees the changes.
+    """
+
+    def __init__(self, max_size: int, ttl_sec: float):
+        self.max_size = max_size
+        self.ttl_sec = ttl_sec
+        # Key -> (expiration time, document)
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        # Entity (the key prefix, e.g. movie) -> hits, misses, evictions
+        # and invalidations
+        self.stats: dict[str, Counter] = {}
+
+    def _record(self, key: str, event: str):
+        entity = key.split('_', 1)[0]
+        self.stats.setdefault(entity, Counter())[event] += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self._record(key, 'misses')
+            return None
+
+        self._entries.move_to_end(key)
+        self._record(key, 'hits')
+        return entry[1]
+
+    def set(self, key: str, document: Any, ttl_sec: Optional[float] = None):
+        ttl_sec = min(self.ttl_sec, ttl_sec or self.ttl_sec)
+        self._entries[key] = (time.monotonic() + ttl_sec, document)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            evicted_key, _ = self._entries.popitem(last=False)
+            self._record(evicted_key, 'evictions')
+
+    def invalidate(self, keys: list[str]):
+        for key in keys:
+            if self._entries.pop(key, None) is not None:
+                self._record(key, 'invalidations')
+
+    def clear(self):
+        self._entries.clear()
+
+    def snapshot(self) -> dict:
+        return {
+            'size': len(self._entries),
+            **{entity: dict(stats) for entity, stats in self.stats.items()},
+        }
+
+
+async def listen_for_invalidations(cache: LocalCache, redis: Redis):
+    """
+    Background task dropping the invalidated documents from the local cache
+    and reporting its stats
+    """
+    cache_settings = settings.local_cache_settings
+    reported_at = time.monotonic()
+    while True:
+        pubsub = redis.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            # The invalidations published before the subscription are lost
+            cache.clear()
+            while True:
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True,
+                    timeout=1.0,
+                )
+                if message is not None:
+                    cache.invalidate(message['data'].decode().split())
+
+                if (
+                    time.monotonic() - reported_at
+                    >= cache_settings.local_cache_stats_report_interval_sec
+                ):
+                    reported_at = time.monotonic()
+                    logger.info('Local cache stats - %s', cache.snapshot())
+        except RedisError as e:
+            logger.warning('Cache invalidations are not received: %r', e)
+            await asyncio.sleep(cache_settings.local_cache_resubscribe_delay_sec)
+        finally:
+            await pubsub.close()
+
+
+local_cache: Optional[LocalCache] = None
+
+
+# Функция понадобится при внедрении зависимостей
+async def get_local_cache() -> LocalCache:
+    return local_cache
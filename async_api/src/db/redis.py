@@ -8,3 +8,15 @@ redis: Optional[Redis] = None
 # Функция понадобится при внедрении зависимостей
 async def get_redis() -> Redis:
     return redis
+
+
+async def get_with_ttl(redis: Redis, key: str) -> tuple[Optional[bytes], int]:
+    """
+    Return the value of the key with its remaining time to live in seconds
+    in one round trip
+    """
+    async with redis.pipeline(transaction=False) as pipeline:
+        pipeline.get(key)
+        pipeline.ttl(key)
+        data, ttl = await pipeline.execute()
+    return data, ttl
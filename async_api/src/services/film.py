@@ -1,22 +1,36 @@
+import hashlib
 from functools import lru_cache
 from typing import Optional
 
+import orjson
 from elasticsearch import AsyncElasticsearch, NotFoundError
 from fastapi import Depends, Response
 from redis.asyncio import Redis
 
+from src.core.config import settings
 from src.db.elastic import get_elastic
-from src.db.redis import get_redis
+from src.db.local_cache import LocalCache, get_local_cache
+from src.db.redis import get_redis, get_with_ttl
 from src.models.models import Film
+from src.utils.single_flight import single_flight
 
 
 FILM_CACHE_EXPIRE_IN_SECONDS = 60 * 5
+# Bumped by the ETL on every run that changed the movies index, the cached
+# film lists of the previous versions are not read anymore and expire
+FILMS_CONTENT_VERSION_KEY = 'content_version_movies'
 
 
 class FilmService:
-    def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
+    def __init__(
+        self,
+        redis: Redis,
+        elastic: AsyncElasticsearch,
+        local_cache: LocalCache,
+    ):
         self.redis = redis
         self.elastic = elastic
+        self.local_cache = local_cache
 
     async def get_films(
         self,
@@ -25,47 +39,59 @@ class FilmService:
         page_size: int,
         sort
     ) -> Optional[list[Film]]:
+        cache_key = self._film_list_cache_key(
+            'films',
+            query=None,
+            genre=genre,
+            page_number=page_number,
+            page_size=page_size,
+            sort=sort,
+        )
+        version, film_list = await self._film_list_from_cache(cache_key)
+        if film_list is not None:
+            return film_list or None
+
         if genre:
-            films = (await self.elastic.search(
-                index='movies',
-                body={
-                    "from": page_number,
-                    "size": page_size,
-                    "query": {
-                        "bool": {
-                            "must": [
-                                {"term": {"genre": genre}}
-                            ]
-                        }
-                    },
-                    "sort": [{
-                        "imdb_rating": sort
-                    }],
-                }
-            ))['hits']['hits']
-        else:
-            films = (await self.elastic.search(
-                    index='movies',
-                    body={
-                        "from": page_number,
-                        "size": page_size,
-                        "sort": [{
-                            "imdb_rating": sort
-                        }]
+            body = {
+                "from": page_number,
+                "size": page_size,
+                "query": {
+                    "bool": {
+                        "must": [
+                            {"term": {"genre": genre}}
+                        ]
                     }
-            ))['hits']['hits']
-        if films:
-            film_list = [film['_source'] for film in films]
-            return film_list
-        return None
+                },
+                "sort": [{
+                    "imdb_rating": sort
+                }],
+            }
+        else:
+            body = {
+                "from": page_number,
+                "size": page_size,
+                "sort": [{
+                    "imdb_rating": sort
+                }]
+            }
+        # Concurrent misses of the same list share one search
+        film_list = await single_flight.do(
+            f'{cache_key}_{version}',
+            lambda: self._search_film_list(cache_key, version, body)
+        )
+        return film_list or None
 
     async def get_film_by_id(self, film_id: str, response: Response) -> Optional[Film]:
         film = await self._film_from_cache(film_id, response)
         if not film:
-            film = await self._get_film_from_elastic(film_id)
+            # Concurrent misses of the film share one request to Elasticsearch
+            film = await single_flight.do(
+                f'movie_{film_id}',
+                lambda: self._load_film(film_id)
+            )
             if not film:
                 return None
-            await self._put_film_to_cache(film, response)
+            response.headers['X-Cache'] = 'MISS'
 
         return film
 
@@ -77,6 +103,17 @@ class FilmService:
         page_size: int,
         sort
     ) -> Optional[list[Film]]:
+        cache_key = self._film_list_cache_key(
+            'search',
+            query=query,
+            genre=genre,
+            page_number=page_number,
+            page_size=page_size,
+            sort=sort,
+        )
+        version, film_list = await self._film_list_from_cache(cache_key)
+        if film_list is not None:
+            return film_list or None
 
         body = {
             "from": page_number,
@@ -115,15 +152,32 @@ class FilmService:
                     }
                 })
 
+        film_list = await single_flight.do(
+            f'{cache_key}_{version}',
+            lambda: self._search_film_list(cache_key, version, body)
+        )
+        return film_list or None
+
+    async def _search_film_list(
+        self,
+        cache_key: str,
+        version: str,
+        body: dict,
+    ) -> list:
         films = (await self.elastic.search(
             index='movies',
             body=body
         ))['hits']['hits']
 
-        if films:
-            film_list = [film['_source'] for film in films]
-            return film_list
-        return None
+        film_list = [film['_source'] for film in films]
+        await self._put_film_list_to_cache(cache_key, version, film_list)
+        return film_list
+
+    async def _load_film(self, film_id: str) -> Optional[Film]:
+        film = await self._get_film_from_elastic(film_id)
+        if film:
+            await self._put_film_to_cache(film)
+        return film
 
     async def _get_film_from_elastic(self, film_id: str) -> Optional[Film]:
         try:
@@ -134,28 +188,107 @@ class FilmService:
         return Film(**doc['_source'])
 
     async def _film_from_cache(self, film_id: str, response: Response) -> Optional[Film]:
-        data = await self.redis.get(f'movie_{film_id}')
-        if not data:
-            return None
+        key = f'movie_{film_id}'
+        # The parsed films are kept in the local cache in front of Redis
+        film = self.local_cache.get(key)
+        if film is None:
+            data, ttl = await get_with_ttl(self.redis, key)
+            if not data:
+                return None
+            film = Film.parse_raw(data)
+            stale_sec = settings.redis_settings.stale_while_revalidate_sec
+            if stale_sec and 0 <= ttl <= stale_sec:
+                # The expired film is served while one task refreshes it
+                single_flight.start(key, lambda: self._load_film(film_id))
+                response.headers['X-Cache'] = 'STALE'
+                return film
+            # Not kept locally after it expires in Redis
+            if ttl > stale_sec:
+                self.local_cache.set(key, film, ttl - stale_sec)
 
         response.headers['Cache-Control'] = 'public' + ', ' + f'max-age={FILM_CACHE_EXPIRE_IN_SECONDS}'
         response.headers['X-Cache'] = 'HIT'
 
-        film = Film.parse_raw(data)
         return film
 
-    async def _put_film_to_cache(self, film: Film, response):
+    async def _put_film_to_cache(self, film: Film):
+        # The film is kept in Redis after it expires to be served stale
         await self.redis.set(
             f'movie_{film.id}',
             film.model_dump_json(),
             FILM_CACHE_EXPIRE_IN_SECONDS
+            + settings.redis_settings.stale_while_revalidate_sec
+        )
+        self.local_cache.set(
+            f'movie_{film.id}',
+            film,
+            FILM_CACHE_EXPIRE_IN_SECONDS
+        )
+
+    def _film_list_cache_key(
+        self,
+        kind: str,
+        query: Optional[str],
+        genre: Optional[str],
+        page_number: int,
+        page_size: int,
+        sort,
+    ) -> str:
+        """
+        Build the cache key of the film list from the hash of the normalized
+        request parameters
+        """
+        # The search by keyword is case-insensitive, the empty parameters
+        # are not used in the query
+        parameters = orjson.dumps([
+            ' '.join(query.lower().split()) if query else None,
+            genre or None,
+            page_number,
+            page_size,
+            sort,
+        ])
+        digest = hashlib.sha1(parameters).hexdigest()
+        return f'movies_{kind}_{digest}'
+
+    async def _film_list_from_cache(
+        self,
+        cache_key: str,
+    ) -> tuple[str, Optional[list]]:
+        """
+        Return the current content version of the index and the film list if
+        it is cached for this version, both are read in one round trip
+        """
+        version, data = await self.redis.mget(
+            FILMS_CONTENT_VERSION_KEY,
+            cache_key,
+        )
+        version = (version or b'0').decode()
+        if data is None:
+            return version, None
+        cached_version, film_list = orjson.loads(data)
+        if cached_version != version:
+            return version, None
+        return version, film_list
+
+    async def _put_film_list_to_cache(
+        self,
+        cache_key: str,
+        version: str,
+        film_list: list,
+    ):
+        # The empty lists are cached too, so the requests of the missing
+        # pages do not reach Elasticsearch either
+        await self.redis.set(
+            cache_key,
+            orjson.dumps([version, film_list]),
+            settings.redis_settings.film_list_cache_expire_in_seconds
         )
-        response.headers['X-Cache'] = 'MISS'
 
 
 @lru_cache()
 def get_film_service(
         redis: Redis = Depends(get_redis),
         elastic: AsyncElasticsearch = Depends(get_elastic),
+        local_cache: LocalCache = Depends(get_local_cache),
 ) -> FilmService:
-    return FilmService(redis, elastic)
+    return FilmService(redis, elastic, local_cache)
@@ -5,19 +5,28 @@ from elasticsearch import AsyncElasticsearch, NotFoundError
 from fastapi import Depends, Response
 from redis.asyncio import Redis
 
+from src.core.config import settings
 from src.db.elastic import get_elastic
-from src.db.redis import get_redis
+from src.db.local_cache import LocalCache, get_local_cache
+from src.db.redis import get_redis, get_with_ttl
 
 from src.models.models import Genre
+from src.utils.single_flight import single_flight
 
 
 GENRE_CACHE_EXPIRE_IN_SECONDS = 60 * 5
 
 
 class GenreService:
-    def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
+    def __init__(
+        self,
+        redis: Redis,
+        elastic: AsyncElasticsearch,
+        local_cache: LocalCache,
+    ):
         self.redis = redis
         self.elastic = elastic
+        self.local_cache = local_cache
 
     async def get_genres(
         self,
@@ -41,11 +50,13 @@ class GenreService:
     async def get_genre_by_id(self, genre_id: str, response: Response) -> Optional[Genre]:
         genre = await self._genre_from_cache(genre_id, response)
         if not genre:
-            genre = await self._get_genre_from_elastic(genre_id)
+            genre = await single_flight.do(
+                f'genre_{genre_id}',
+                lambda: self._load_genre(genre_id)
+            )
             if not genre:
                 return None
-
-            await self._put_genre_to_cache(genre, response)
+            response.headers['X-Cache'] = 'MISS'
 
         return genre
 
@@ -58,28 +69,50 @@ class GenreService:
         return Genre(**doc['_source'])
 
     async def _genre_from_cache(self, genre_id: str, response: Response) -> Optional[Genre]:
-        data = await self.redis.get(f'genre_{genre_id}')
-        if not data:
-            return None
+        key = f'genre_{genre_id}'
+        genre = self.local_cache.get(key)
+        if genre is None:
+            data, ttl = await get_with_ttl(self.redis, key)
+            if not data:
+                return None
+            genre = Genre.parse_raw(data)
+            stale_sec = settings.redis_settings.stale_while_revalidate_sec
+            if stale_sec and 0 <= ttl <= stale_sec:
+                single_flight.start(key, lambda: self._load_genre(genre_id))
+                response.headers['X-Cache'] = 'STALE'
+                return genre
+            if ttl > stale_sec:
+                self.local_cache.set(key, genre, ttl - stale_sec)
 
         response.headers['Cache-Control'] = 'public' + ', ' + f'max-age={GENRE_CACHE_EXPIRE_IN_SECONDS}'
         response.headers['X-Cache'] = 'HIT'
 
-        genre = Genre.parse_raw(data)
         return genre
 
-    async def _put_genre_to_cache(self, genre: Genre, response):
+    async def _load_genre(self, genre_id: str) -> Optional[Genre]:
+        genre = await self._get_genre_from_elastic(genre_id)
+        if genre:
+            await self._put_genre_to_cache(genre)
+        return genre
+
+    async def _put_genre_to_cache(self, genre: Genre):
         await self.redis.set(
             f'genre_{genre.id}',
             genre.model_dump_json(),
             GENRE_CACHE_EXPIRE_IN_SECONDS
+            + settings.redis_settings.stale_while_revalidate_sec
+        )
+        self.local_cache.set(
+            f'genre_{genre.id}',
+            genre,
+            GENRE_CACHE_EXPIRE_IN_SECONDS
         )
-        response.headers['X-Cache'] = 'MISS'
 
 
 @lru_cache()
 def get_genre_service(
         redis: Redis = Depends(get_redis),
         elastic: AsyncElasticsearch = Depends(get_elastic),
+        local_cache: LocalCache = Depends(get_local_cache),
 ) -> GenreService:
-    return GenreService(redis, elastic)
+    return GenreService(redis, elastic, local_cache)
@@ -5,27 +5,38 @@ from elasticsearch import AsyncElasticsearch, NotFoundError
 from fastapi import Depends, Response
 from redis.asyncio import Redis
 
+from src.core.config import settings
 from src.db.elastic import get_elastic
-from src.db.redis import get_redis
+from src.db.local_cache import LocalCache, get_local_cache
+from src.db.redis import get_redis, get_with_ttl
 from src.models.models import Person, Person_
+from src.utils.single_flight import single_flight
 
 
 PERSON_CACHE_EXPIRE_IN_SECONDS = 60 * 5
 
 
 class PersonService:
-    def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
+    def __init__(
+        self,
+        redis: Redis,
+        elastic: AsyncElasticsearch,
+        local_cache: LocalCache,
+    ):
         self.redis = redis
         self.elastic = elastic
+        self.local_cache = local_cache
 
     async def get_person_by_id(self, person_id: str, response: Response) -> Optional[Person]:
         person = await self._person_from_cache(person_id, response)
         if not person:
-            person = await self._get_person_from_elastic(person_id)
+            person = await single_flight.do(
+                f'person_{person_id}',
+                lambda: self._load_person(person_id)
+            )
             if not person:
                 return None
-
-            await self._put_person_to_cache(person, response)
+            response.headers['X-Cache'] = 'MISS'
 
         # Найти все фильмы, в которых принял участие person,
         # независимо от его роли
@@ -241,29 +252,50 @@ class PersonService:
         return Person_(**doc['_source'])
 
     async def _person_from_cache(self, person_id: str, response: Response):
-        data = await self.redis.get(f'person_{person_id}')
-        if not data:
-            return None
+        key = f'person_{person_id}'
+        person = self.local_cache.get(key)
+        if person is None:
+            data, ttl = await get_with_ttl(self.redis, key)
+            if not data:
+                return None
+            person = Person_.parse_raw(data)
+            stale_sec = settings.redis_settings.stale_while_revalidate_sec
+            if stale_sec and 0 <= ttl <= stale_sec:
+                single_flight.start(key, lambda: self._load_person(person_id))
+                response.headers['X-Cache'] = 'STALE'
+                return person
+            if ttl > stale_sec:
+                self.local_cache.set(key, person, ttl - stale_sec)
 
         response.headers['Cache-Control'] = 'public' + ', ' + f'max-age={PERSON_CACHE_EXPIRE_IN_SECONDS}'
         response.headers['X-Cache'] = 'HIT'
 
-        person = Person_.parse_raw(data)
+        return person
 
+    async def _load_person(self, person_id: str) -> Optional[Person_]:
+        person = await self._get_person_from_elastic(person_id)
+        if person:
+            await self._put_person_to_cache(person)
         return person
 
-    async def _put_person_to_cache(self, person: Person_, response):
+    async def _put_person_to_cache(self, person: Person_):
         await self.redis.set(
             f'person_{person.id}',
             person.model_dump_json(),
             PERSON_CACHE_EXPIRE_IN_SECONDS
+            + settings.redis_settings.stale_while_revalidate_sec
+        )
+        self.local_cache.set(
+            f'person_{person.id}',
+            person,
+            PERSON_CACHE_EXPIRE_IN_SECONDS
         )
-        response.headers['X-Cache'] = 'MISS'
 
 
 @lru_cache()
 def get_person_service(
         redis: Redis = Depends(get_redis),
         elastic: AsyncElasticsearch = Depends(get_elastic),
+        local_cache: LocalCache = Depends(get_local_cache),
 ) -> PersonService:
-    return PersonService(redis, elastic)
+    return PersonService(redis, elastic, local_cache)
@@ -1,10 +1,18 @@
 import pytest_asyncio
 from elasticsearch import AsyncElasticsearch
 from elasticsearch.helpers import async_bulk
+from redis.asyncio import Redis
 
 from src.tests.functional.settings import test_settings
 
 
+DOCUMENT_CACHE_KEY_PREFIXES = {
+    'movies': 'movie_',
+    'genres': 'genre_',
+    'persons': 'person_',
+}
+
+
 @pytest_asyncio.fixture(name='es_client', scope='session')
 async def es_client():
     es_client = AsyncElasticsearch(
@@ -16,7 +24,7 @@ async def es_client():
 
 
 @pytest_asyncio.fixture(name='es_write_data')
-def es_write_data(es_client: AsyncElasticsearch):
+def es_write_data(es_client: AsyncElasticsearch, redis_client: Redis):
     async def inner(
         es_test_settings,
         data: list[dict],
@@ -49,4 +57,16 @@ def es_write_data(es_client: AsyncElasticsearch):
         if errors:
             raise Exception('Ошибка записи данных в Elasticsearch')
 
+        # Как и ETL, сделать устаревшими закэшированные результаты поиска
+        # и удалить записанные документы из кэшей Async API
+        await redis_client.incr(
+            f'content_version_{es_test_settings.es_index}'
+        )
+        keys = [
+            f'{DOCUMENT_CACHE_KEY_PREFIXES[es_test_settings.es_index]}{row["_id"]}'
+            for row in bulk_query
+        ]
+        await redis_client.delete(*keys)
+        await redis_client.publish('cache_invalidation', ' '.join(keys))
+
     return inner
@@ -1,3 +1,4 @@
+import asyncio
 import uuid
 import pytest
 from http import HTTPStatus
@@ -318,6 +319,228 @@ async def test_redis_cache_movie_details(
     assert headers['Cache-Control'] == 'public, max-age=300'
 
 
+@pytest.mark.asyncio
+async def test_redis_cache_film_search(
+    redis_client,
+    es_client,
+    es_write_data,
+    make_get_request,
+):
+    """Проверить кэширование результатов поиска фильмов в Redis."""
+
+    es_data = [{
+        'id': str(uuid.uuid4()),
+        'imdb_rating': 7.0,
+        'genre': ['Drama'],
+        'title': 'The Star',
+        'description': 'New World',
+        'actors_names': ['Ann'],
+        'writers_names': ['Ben'],
+        'directors_names': ['Quentin'],
+        'actors': [
+            {'id': 'ef86b8ff-3c82-4d31-ad8e-72b69f4e3f95', 'name': 'Ann'}
+        ],
+        'writers': [
+            {'id': 'caf76c67-c0fe-477e-8766-3ab3ff2574b5', 'name': 'Ben'}
+        ],
+        'directors': [
+            {'id': '8c10ae99-80df-4dcb-929f-2f8dcf15f994', 'name': 'Quentin'}
+        ]
+    } for _ in range(5)]
+
+    await es_write_data(
+        movie_test_settings,
+        es_data
+    )
+
+    body, headers, status = await make_get_request(
+        movie_test_settings.service_url + 'api/v1/films/search',
+        {'query': 'The Star', 'page_size': 100}
+    )
+
+    assert status == HTTPStatus.OK
+    assert len(body) == 5
+
+    # Фильм, добавленный без изменения версии содержимого индекса,
+    # не виден до ее изменения
+    new_film = dict(es_data[0], id=str(uuid.uuid4()))
+    await es_client.index(
+        index=movie_test_settings.es_index,
+        id=new_film['id'],
+        document=new_film,
+        refresh='wait_for'
+    )
+
+    body, headers, status = await make_get_request(
+        movie_test_settings.service_url + 'api/v1/films/search',
+        {'query': '  the   STAR ', 'page_size': 100}
+    )
+
+    assert status == HTTPStatus.OK
+    assert len(body) == 5
+
+    await redis_client.incr(f'content_version_{movie_test_settings.es_index}')
+
+    body, headers, status = await make_get_request(
+        movie_test_settings.service_url + 'api/v1/films/search',
+        {'query': 'The Star', 'page_size': 100}
+    )
+
+    assert status == HTTPStatus.OK
+    assert len(body) == 6
+
+
+def make_film(title: str) -> dict:
+    return {
+        'id': str(uuid.uuid4()),
+        'imdb_rating': 7.5,
+        'genre': ['Drama'],
+        'title': title,
+        'description': 'New World',
+        'actors_names': ['Ann'],
+        'writers_names': ['Ben'],
+        'directors_names': ['Quentin'],
+        'actors': [
+            {'id': 'ef86b8ff-3c82-4d31-ad8e-72b69f4e3f95', 'name': 'Ann'}
+        ],
+        'writers': [
+            {'id': 'caf76c67-c0fe-477e-8766-3ab3ff2574b5', 'name': 'Ben'}
+        ],
+        'directors': [
+            {'id': '8c10ae99-80df-4dcb-929f-2f8dcf15f994', 'name': 'Quentin'}
+        ]
+    }
+
+
+async def count_es_get_requests(es_client) -> int:
+    stats = await es_client.indices.stats(
+        index=movie_test_settings.es_index,
+        metric='get'
+    )
+    return stats['_all']['primaries']['get']['total']
+
+
+@pytest.mark.asyncio
+async def test_redis_cache_single_flight(
+    es_client,
+    es_write_data,
+    make_get_request,
+):
+    """Проверить, что одновременные промахи кэша делают один запрос в Elasticsearch."""
+
+    film = make_film('Crowd')
+    await es_write_data(
+        movie_test_settings,
+        [film]
+    )
+    es_get_requests = await count_es_get_requests(es_client)
+
+    responses = await asyncio.gather(*[
+        make_get_request(
+            movie_test_settings.service_url + f'api/v1/films/{film["id"]}'
+        )
+        for _ in range(20)
+    ])
+
+    for body, headers, status in responses:
+        assert status == HTTPStatus.OK
+        assert body['id'] == film['id']
+    assert await count_es_get_requests(es_client) == es_get_requests + 1
+
+
+@pytest.mark.asyncio
+async def test_redis_cache_stale_while_revalidate(
+    redis_client,
+    es_client,
+    es_write_data,
+    make_get_request,
+):
+    """Проверить отдачу устаревшего фильма из Redis с его обновлением в фоне."""
+
+    film = make_film('Old Title')
+    await es_write_data(
+        movie_test_settings,
+        [film]
+    )
+    url = movie_test_settings.service_url + f'api/v1/films/{film["id"]}'
+
+    body, headers, status = await make_get_request(url)
+
+    assert headers['X-Cache'] == 'MISS'
+
+    await es_client.index(
+        index=movie_test_settings.es_index,
+        id=film['id'],
+        document=dict(film, title='New Title'),
+        refresh='wait_for'
+    )
+    # Истекший в Redis фильм хранится еще STALE_WHILE_REVALIDATE_SEC
+    # (60 секунд у тестового сервиса), его оставшееся время попадает в это
+    # окно. Фильм удаляется только из локального кэша сервиса
+    key = f'movie_{film["id"]}'
+    await redis_client.expire(key, 5)
+    await redis_client.publish('cache_invalidation', key)
+    await asyncio.sleep(0.5)
+
+    body, headers, status = await make_get_request(url)
+
+    assert status == HTTPStatus.OK
+    assert body['title'] == 'Old Title'
+    assert headers['X-Cache'] == 'STALE'
+
+    await asyncio.sleep(0.5)
+    body, headers, status = await make_get_request(url)
+
+    assert body['title'] == 'New Title'
+    assert headers['X-Cache'] == 'HIT'
+    assert await redis_client.ttl(key) > 5
+
+
+@pytest.mark.asyncio
+async def test_local_cache_invalidation(
+    redis_client,
+    es_client,
+    es_write_data,
+    make_get_request,
+):
+    """Проверить локальный кэш фильмов и его инвалидацию через Redis pub/sub."""
+
+    film = make_film('Old Title')
+    await es_write_data(
+        movie_test_settings,
+        [film]
+    )
+    url = movie_test_settings.service_url + f'api/v1/films/{film["id"]}'
+    key = f'movie_{film["id"]}'
+
+    body, headers, status = await make_get_request(url)
+
+    assert headers['X-Cache'] == 'MISS'
+
+    # Фильм отдается из локального кэша и без Redis
+    await redis_client.delete(key)
+    body, headers, status = await make_get_request(url)
+
+    assert body['title'] == 'Old Title'
+    assert headers['X-Cache'] == 'HIT'
+
+    # Как и ETL, удалить измененный фильм из Redis и из локальных кэшей
+    await es_client.index(
+        index=movie_test_settings.es_index,
+        id=film['id'],
+        document=dict(film, title='New Title'),
+        refresh='wait_for'
+    )
+    await redis_client.delete(key)
+    await redis_client.publish('cache_invalidation', key)
+    await asyncio.sleep(0.5)
+
+    body, headers, status = await make_get_request(url)
+
+    assert body['title'] == 'New Title'
+    assert headers['X-Cache'] == 'MISS'
+
+
 @pytest.mark.parametrize(
     'query_data, expected_answer',
     [
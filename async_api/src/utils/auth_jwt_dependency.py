@@ -1,3 +1,7 @@
+import hashlib
+import time
+from collections import OrderedDict
+
 import jwt
 from fastapi import (
     status,
@@ -22,6 +26,45 @@ def decode_jwt(
     return decoded_jwt
 
 
+class VerifiedTokenCache:
+    """
+    LRU cache of the payloads of the verified tokens keyed by the token
+    hash, so the signature of a token is checked once until it expires
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._payloads: OrderedDict[bytes, dict] = OrderedDict()
+
+    @staticmethod
+    def _key(jwt_token: str) -> bytes:
+        return hashlib.sha256(jwt_token.encode('utf-8')).digest()
+
+    def get(self, jwt_token: str) -> dict | None:
+        key = self._key(jwt_token)
+        payload = self._payloads.get(key)
+        if payload is None:
+            return None
+        if payload['exp'] <= time.time():
+            del self._payloads[key]
+            return None
+        self._payloads.move_to_end(key)
+        return payload
+
+    def put(self, jwt_token: str, payload: dict):
+        # Tokens without the expiration time are verified every time
+        if 'exp' not in payload:
+            return
+        self._payloads[self._key(jwt_token)] = payload
+        if len(self._payloads) > self.maxsize:
+            self._payloads.popitem(last=False)
+
+
+verified_tokens = VerifiedTokenCache(
+    settings.jwt_settings.verified_token_cache_size
+)
+
+
 class JWTBearer(HTTPBearer):
     def __init__(self, auto_error: bool = True):
         super().__init__(auto_error=auto_error)
@@ -48,11 +91,18 @@ class JWTBearer(HTTPBearer):
                 detail='Invalid or expired token.'
             )
 
+        # Reused by the tracking tasks of the request
+        request.state.decoded_token = decoded_token
         return decoded_token
 
     @staticmethod
     def parse_token(jwt_token: str) -> dict | None:
-        return decode_jwt(jwt_token)
+        decoded_token = verified_tokens.get(jwt_token)
+        if decoded_token is None:
+            decoded_token = decode_jwt(jwt_token)
+            if decoded_token:
+                verified_tokens.put(jwt_token, decoded_token)
+        return decoded_token
 
 
 security_jwt = JWTBearer()
\ No newline at end of file
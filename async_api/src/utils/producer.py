@@ -1,14 +1,9 @@
-import json
 from datetime import datetime, timezone
 from enum import Enum
 
-from fastapi import (
-    Request,
-    APIRouter
-)
-from aiokafka import AIOKafkaProducer
+from fastapi import Request
 
-from src.core.config import settings
+from src.db import kafka
 
 
 class AsyncAPITopics(Enum):
@@ -34,39 +29,18 @@ class PersonTopicPartitions(Enum):
     SEARCH_PERSONS_BY_KEYWORD = 'search_persons_by_keyword'
 
 
-async def send_one_message_to_kafka(topic: str, partition_key: str, body: dict):
-    producer = AIOKafkaProducer(
-        bootstrap_servers=settings.kafka_settings.bootstrap_servers,
-        key_serializer=lambda k: k.encode('utf-8'),
-        value_serializer=lambda v: json.dumps(v).encode('utf-8')
-    )
-    await producer.start()
-    try:
-        await producer.send_and_wait(
-            topic,
-            value=body,
-            partition=None,
-            key=partition_key
-        )
-    finally:
-        await producer.stop()
-
-
 async def send_message_task(
     request: Request,
-    router: APIRouter,
     topic: str,
     partition_key: str,
     query_parameters: dict
 ):
-    decoded_token_from_http_header = await router.dependencies[0].dependency(request)
+    # The token is already verified by the JWTBearer dependency of the router
+    decoded_token = request.state.decoded_token
     message_data = {
-        'user_id': decoded_token_from_http_header['user_id'],
+        'user_id': decoded_token['user_id'],
         'query_parameters': query_parameters,
         'visited_at': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S %z')
     }
-    await send_one_message_to_kafka(
-        topic,
-        partition_key=partition_key,
-        body=message_data
-    )
\ No newline at end of file
+    # Only queued, the shared producer sends the messages in batches
+    kafka.producer.send(topic, key=partition_key, value=message_data)
\ No newline at end of file
@@ -0,0 +1,45 @@
+import asyncio
+from typing import Awaitable, Callable, TypeVar
+
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    """
+    Coalesces the concurrent calls with the same key: the first call starts
+    the coroutine and the others wait for its result instead of making the
+    same request to Elasticsearch again
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Future] = {}
+
+    def start(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[T]],
+    ) -> asyncio.Future:
+        """
+        Return the call in flight for the key, starting it if there is none
+        """
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+        return future
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        # A cancelled request does not cancel the call the others wait for
+        return await asyncio.shield(self.start(key, func))
+
+    def _finish(self, key: str, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        # The error is raised in the waiting requests, if there are any
+        if not future.cancelled():
+            future.exception()
+
+
+single_flight = SingleFlight()
@@ -2,74 +2,86 @@ from flask import Blueprint, request, jsonify
 
 from flask_jwt_extended import (
     jwt_required,
-    # get_jwt
+    get_jwt,
 )
 
-from producer import send_message_to_kafka
-from settings import ClickTrackingTopics
+from handlers import (
+    RequestRejected,
+    batch_messages,
+    event_messages,
+    not_sent,
+    sent,
+)
+from producer import send_messages_to_kafka
+from settings import ClickEventTypes, SESSION_ID_COOKIE
 
 
 api = Blueprint('api', __name__, )
 
 
+def get_partition_key() -> str | None:
+    '''
+    Return the ID of the user from the JWT or, for anonymous users, the ID
+    of the viewing session, so all the events of one user land in one
+    partition in the order they were sent
+    '''
+    return get_jwt().get('user_id') or request.cookies.get(SESSION_ID_COOKIE)
+
+
+def send_events(messages: list[tuple[str, dict]], **success_fields):
+    try:
+        send_messages_to_kafka(messages, key=get_partition_key())
+    except Exception as e:
+        body, status = not_sent(e)
+        return jsonify(body), status
+    body, status = sent(**success_fields)
+    return jsonify(body), status
+
+
+def send_event(event_type: str):
+    try:
+        messages = event_messages(
+            event_type,
+            request.get_json(silent=True),
+            get_jwt().get('user_id'),
+        )
+    except RequestRejected as e:
+        body, status = e.response
+        return jsonify(body), status
+    return send_events(messages)
+
+
 @api.route('/quality-change', methods=['POST'])
 @jwt_required(optional=True)
 def quality_change():
-    try:
-        data = request.get_json()
-        send_message_to_kafka(
-            ClickTrackingTopics.QUALITY_CHANGE_CLICK.value,
-            body=data
-        )
-        return jsonify(
-            {'status': 'success'}
-        ), 200
-    except Exception as e:
-        return jsonify(
-            {
-                'status': 'error',
-                'message': str(e)
-            }
-        ), 500
+    return send_event(ClickEventTypes.QUALITY_CHANGE.value)
 
 
 @api.route('/pause', methods=['POST'])
 @jwt_required(optional=True)
 def pause():
-    try:
-        data = request.get_json()
-        send_message_to_kafka(
-            ClickTrackingTopics.PAUSE_CLICK.value,
-            body=data
-        )
-        return jsonify(
-            {'status': 'success'}
-        ), 200
-    except Exception as e:
-        return jsonify(
-            {
-                'status': 'error',
-                'message': str(e)
-            }
-        ), 500
+    return send_event(ClickEventTypes.PAUSE.value)
 
 
 @api.route('/full-view', methods=['POST'])
 @jwt_required(optional=True)
 def full_view():
+    return send_event(ClickEventTypes.FULL_VIEW.value)
+
+
+@api.route('/events/batch', methods=['POST'])
+@jwt_required(optional=True)
+def events_batch():
+    '''
+    Accept an array of mixed typed events buffered by the video player and
+    send them to their topics with a single producer flush
+    '''
     try:
-        data = request.get_json()
-        send_message_to_kafka(
-            ClickTrackingTopics.FULL_VIEW.value,
-            body=data
+        messages = batch_messages(
+            request.get_json(silent=True),
+            get_jwt().get('user_id'),
         )
-        return jsonify(
-            {'status': 'success'}
-        ), 200
-    except Exception as e:
-        return jsonify(
-            {
-                'status': 'error',
-                'message': str(e)
-            }
-        ), 500
+    except RequestRejected as e:
+        body, status = e.response
+        return jsonify(body), status
+    return send_events(messages, accepted=len(messages))
@@ -0,0 +1,174 @@
+'''
+ASGI ingestion service with the same /api/* contract as the Flask app, the
+requests are validated by the handlers shared with it. Requests are handled
+on the event loop with the asynchronous Kafka producer, so a process is not
+blocked by the clients waiting for the delivery of their events
+'''
+from contextlib import asynccontextmanager
+from uuid import UUID
+
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import ORJSONResponse
+from fastapi.staticfiles import StaticFiles
+from fastapi.templating import Jinja2Templates
+
+from async_producer import AsyncEventProducer
+from handlers import (
+    RequestRejected,
+    batch_messages,
+    event_messages,
+    not_sent,
+    sent,
+)
+from jwt_auth import InvalidJWT, decode_optional_jwt
+from settings import (
+    BASE_DIR,
+    ClickEventTypes,
+    DEMO_FILM_ID,
+    SESSION_ID_COOKIE,
+)
+
+
+event_producer = AsyncEventProducer()
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    await event_producer.start()
+    yield
+    await event_producer.stop()
+
+
+app = FastAPI(
+    title='UGC Click Tracking Service',
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+)
+app.mount('/static', StaticFiles(directory=BASE_DIR / 'static'), name='static')
+templates = Jinja2Templates(directory=BASE_DIR / 'templates')
+
+
+@app.exception_handler(InvalidJWT)
+async def invalid_jwt_handler(_: Request, e: InvalidJWT):
+    # The same response as the one of flask_jwt_extended
+    return ORJSONResponse({'msg': e.message}, status_code=e.status_code)
+
+
+async def optional_jwt(request: Request) -> dict:
+    return decode_optional_jwt(request.headers.get('Authorization'))
+
+
+def get_partition_key(request: Request, claims: dict) -> str | None:
+    '''
+    Return the ID of the user from the JWT or, for anonymous users, the ID
+    of the viewing session, so all the events of one user land in one
+    partition in the order they were sent
+    '''
+    return claims.get('user_id') or request.cookies.get(SESSION_ID_COOKIE)
+
+
+@app.exception_handler(RequestRejected)
+async def request_rejected_handler(_: Request, e: RequestRejected):
+    body, status = e.response
+    return ORJSONResponse(body, status_code=status)
+
+
+async def request_json(request: Request):
+    # Not a JSON body is rejected by the validation as in the Flask app
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def send_events(
+    request: Request,
+    claims: dict,
+    messages: list[tuple[str, dict]],
+    **success_fields,
+) -> ORJSONResponse:
+    try:
+        await event_producer.send_messages(
+            messages,
+            key=get_partition_key(request, claims),
+        )
+    except Exception as e:
+        body, status = not_sent(e)
+    else:
+        body, status = sent(**success_fields)
+    return ORJSONResponse(body, status_code=status)
+
+
+async def send_event(
+    request: Request,
+    claims: dict,
+    event_type: str,
+) -> ORJSONResponse:
+    messages = event_messages(
+        event_type,
+        await request_json(request),
+        claims.get('user_id'),
+    )
+    return await send_events(request, claims, messages)
+
+
+@app.get('/')
+async def index(
+    request: Request,
+    film_id: UUID = DEMO_FILM_ID,
+    _: dict = Depends(optional_jwt),
+):
+    return templates.TemplateResponse(
+        request,
+        'index.html',
+        {'film_id': film_id},
+    )
+
+
+@app.post('/api/quality-change')
+async def quality_change(
+    request: Request,
+    claims: dict = Depends(optional_jwt),
+):
+    return await send_event(
+        request,
+        claims,
+        ClickEventTypes.QUALITY_CHANGE.value,
+    )
+
+
+@app.post('/api/pause')
+async def pause(request: Request, claims: dict = Depends(optional_jwt)):
+    return await send_event(
+        request,
+        claims,
+        ClickEventTypes.PAUSE.value,
+    )
+
+
+@app.post('/api/full-view')
+async def full_view(request: Request, claims: dict = Depends(optional_jwt)):
+    return await send_event(
+        request,
+        claims,
+        ClickEventTypes.FULL_VIEW.value,
+    )
+
+
+@app.post('/api/events/batch')
+async def events_batch(request: Request, claims: dict = Depends(optional_jwt)):
+    '''
+    Accept an array of mixed typed events buffered by the video player and
+    send them to their topics
+    '''
+    messages = batch_messages(
+        await request_json(request),
+        claims.get('user_id'),
+    )
+    return await send_events(request, claims, messages, accepted=len(messages))
+
+
+@app.get('/metrics/producer')
+async def producer_metrics():
+    # Per-topic delivery counters and latencies of the Kafka producer
+    return event_producer.get_delivery_stats()
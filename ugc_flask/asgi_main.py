@@ -0,0 +1,12 @@
+import uvicorn
+
+from settings import ASGI_WORKERS
+
+
+if __name__ == '__main__':
+    uvicorn.run(
+        'asgi_app:app',
+        host='0.0.0.0',
+        port=5000,
+        workers=ASGI_WORKERS,
+    )
@@ -0,0 +1,113 @@
+'''
+Module has the asynchronous Kafka producer of the ASGI ingestion service,
+it has the same delivery guarantees as the producer of the Flask app
+'''
+import asyncio
+from functools import partial
+
+from aiokafka import AIOKafkaProducer
+from aiokafka.errors import KafkaError
+
+from delivery import DeliveryFailed, DeliveryTracker
+from events import serialize_event, serialize_key
+from settings import (
+    BOOTSTRAP_SERVERS,
+    PRODUCER_ACKS,
+    PRODUCER_BATCH_SIZE,
+    PRODUCER_COMPRESSION_TYPE,
+    PRODUCER_DELIVERY_TIMEOUT_SEC,
+    PRODUCER_LINGER_MS,
+    PRODUCER_MAX_IN_FLIGHT,
+)
+
+
+class AsyncEventProducer:
+    def __init__(self):
+        self.producer: AIOKafkaProducer | None = None
+        self.delivery_tracker = DeliveryTracker(PRODUCER_MAX_IN_FLIGHT)
+
+    async def start(self):
+        self.producer = AIOKafkaProducer(
+            bootstrap_servers=BOOTSTRAP_SERVERS,
+            key_serializer=serialize_key,
+            acks=PRODUCER_ACKS if PRODUCER_ACKS == 'all' else int(PRODUCER_ACKS),
+            linger_ms=PRODUCER_LINGER_MS,
+            max_batch_size=PRODUCER_BATCH_SIZE,
+            compression_type=PRODUCER_COMPRESSION_TYPE,
+        )
+        await self.producer.start()
+
+    async def stop(self):
+        await self.producer.stop()
+
+    def _on_done(self, topic: str, sent_at: float, future: asyncio.Future):
+        if future.cancelled():
+            self.delivery_tracker.failed(topic, asyncio.CancelledError())
+        elif future.exception() is not None:
+            self.delivery_tracker.failed(topic, future.exception())
+        else:
+            self.delivery_tracker.delivered(topic, sent_at)
+
+    async def _send(
+        self,
+        topic: str,
+        body: dict,
+        key: str | None,
+    ) -> asyncio.Future:
+        try:
+            value, headers = serialize_event(topic, body)
+            future = await self.producer.send(
+                topic,
+                value=value,
+                key=key,
+                headers=headers,
+            )
+        except KafkaError as e:
+            self.delivery_tracker.release(1)
+            raise DeliveryFailed(
+                f'Message is not delivered to Kafka: {e!r}'
+            ) from e
+        except Exception:
+            self.delivery_tracker.release(1)
+            raise
+
+        sent_at = self.delivery_tracker.sent(topic)
+        future.add_done_callback(partial(self._on_done, topic, sent_at))
+        return future
+
+    async def send_messages(
+        self,
+        messages: list[tuple[str, dict]],
+        key: str | None = None,
+    ):
+        '''
+        Send the messages and wait for the broker to acknowledge all of
+        them, the batches of the concurrent requests are sent together
+        '''
+        self.delivery_tracker.reserve(len(messages))
+        futures = []
+        try:
+            for topic, body in messages:
+                futures.append(await self._send(topic, body, key))
+        except Exception:
+            # Release the room reserved for the messages that were not sent
+            self.delivery_tracker.release(len(messages) - len(futures) - 1)
+            raise
+
+        # asyncio.wait does not cancel the records on timeout, they are
+        # still counted by the delivery callbacks
+        done, pending = await asyncio.wait(
+            futures,
+            timeout=PRODUCER_DELIVERY_TIMEOUT_SEC,
+        )
+        if pending:
+            raise DeliveryFailed('Message is not delivered to Kafka in time')
+        for future in done:
+            if future.exception() is not None:
+                raise DeliveryFailed(
+                    f'Message is not delivered to Kafka: '
+                    f'{future.exception()!r}'
+                ) from future.exception()
+
+    def get_delivery_stats(self) -> dict:
+        return self.delivery_tracker.snapshot()
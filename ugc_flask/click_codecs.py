@@ -0,0 +1,157 @@
+'''
+Module has the compact binary encoding of the click tracking events.
+
+Field names are not written: the fields of a schema follow each other in
+a fixed order, numbers as little-endian float64/int64, UUIDs as their 16
+bytes and strings as their uint8 length followed by the utf-8 bytes. The
+schema is identified by the ID in the schema_id header of the message,
+messages without the header are JSON. The module is mirrored in
+ugc_flask/etl/click_codecs.py, the schemas must be kept the same in both
+of them and the published ones must not be changed
+'''
+import struct
+from uuid import UUID
+
+
+SCHEMA_ID_HEADER = 'schema_id'
+
+_FIXED_FORMATS = {'float': 'd', 'int': 'q', 'uuid': '16s'}
+_STRING_LENGTH = struct.Struct('<B')
+
+
+class BinarySchema:
+    def __init__(self, schema_id: int, fields: dict[str, str]):
+        self.schema_id = schema_id
+        self.header_value = str(schema_id).encode('utf-8')
+        self.fields = tuple(fields)
+        self._types = tuple(fields.values())
+        self._uuid_indexes = tuple(
+            index for index, t in enumerate(self._types) if t == 'uuid'
+        )
+        # Schemas without strings are packed with a single struct
+        self._struct = (
+            None if 'str' in self._types
+            else struct.Struct(
+                '<' + ''.join(_FIXED_FORMATS[t] for t in self._types)
+            )
+        )
+        self._field_structs = tuple(
+            None if t == 'str' else struct.Struct('<' + _FIXED_FORMATS[t])
+            for t in self._types
+        )
+
+    def encode(self, body: dict) -> bytes:
+        values = [body[field] for field in self.fields]
+        for index in self._uuid_indexes:
+            values[index] = UUID(values[index]).bytes
+        if self._struct is not None:
+            return self._struct.pack(*values)
+
+        chunks = []
+        for value, field_struct in zip(values, self._field_structs):
+            if field_struct is None:
+                value = value.encode('utf-8')
+                chunks.append(_STRING_LENGTH.pack(len(value)))
+                chunks.append(value)
+            else:
+                chunks.append(field_struct.pack(value))
+        return b''.join(chunks)
+
+    def decode(self, value: bytes) -> tuple:
+        if self._struct is not None:
+            values = self._struct.unpack(value)
+        else:
+            values = []
+            offset = 0
+            for field_struct in self._field_structs:
+                if field_struct is None:
+                    length, = _STRING_LENGTH.unpack_from(value, offset)
+                    offset += _STRING_LENGTH.size
+                    values.append(
+                        value[offset:offset + length].decode('utf-8')
+                    )
+                    offset += length
+                else:
+                    values.append(field_struct.unpack_from(value, offset)[0])
+                    offset += field_struct.size
+            if offset != len(value):
+                raise struct.error(
+                    f'Value does not match the length of schema '
+                    f'{self.schema_id}'
+                )
+
+        if not self._uuid_indexes:
+            return tuple(values)
+        values = list(values)
+        for index in self._uuid_indexes:
+            values[index] = UUID(bytes=values[index])
+        return tuple(values)
+
+
+QUALITY_CHANGE_V1 = BinarySchema(
+    1,
+    {
+        'quality_before': 'str',
+        'quality_after': 'str',
+        'changed_at': 'float',
+        'timestamp': 'int',
+    },
+)
+PAUSE_V1 = BinarySchema(
+    2,
+    {
+        'pause_at': 'float',
+        'timestamp': 'int',
+    },
+)
+FULL_VIEW_V1 = BinarySchema(
+    3,
+    {
+        'timestamp': 'int',
+    },
+)
+
+# Events enriched with the user, the film and the server receive time
+QUALITY_CHANGE_V2 = BinarySchema(
+    4,
+    {
+        'quality_before': 'str',
+        'quality_after': 'str',
+        'changed_at': 'float',
+        'timestamp': 'int',
+        'user_id': 'uuid',
+        'film_id': 'uuid',
+        'received_at': 'int',
+    },
+)
+PAUSE_V2 = BinarySchema(
+    5,
+    {
+        'pause_at': 'float',
+        'timestamp': 'int',
+        'user_id': 'uuid',
+        'film_id': 'uuid',
+        'received_at': 'int',
+    },
+)
+FULL_VIEW_V2 = BinarySchema(
+    6,
+    {
+        'timestamp': 'int',
+        'user_id': 'uuid',
+        'film_id': 'uuid',
+        'received_at': 'int',
+    },
+)
+
+SCHEMAS = {
+    schema.schema_id: schema
+    for schema in (
+        QUALITY_CHANGE_V1,
+        PAUSE_V1,
+        FULL_VIEW_V1,
+        QUALITY_CHANGE_V2,
+        PAUSE_V2,
+        FULL_VIEW_V2,
+    )
+}
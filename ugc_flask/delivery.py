@@ -0,0 +1,91 @@
+'''
+Module has the delivery tracking shared by the Kafka producers: the bounded
+window of records waiting for the broker acknowledgement and the per-topic
+delivery counters and latencies
+'''
+import threading
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+
+
+class ProducerBufferFull(Exception):
+    pass
+
+
+class DeliveryFailed(Exception):
+    pass
+
+
+@dataclass
+class TopicDeliveryStats:
+    sent: int = 0
+    delivered: int = 0
+    errors: int = 0
+    latency_sum_sec: float = 0.0
+    latency_max_sec: float = 0.0
+
+
+class DeliveryTracker:
+    '''
+    Delivery callbacks of kafka-python are called from the producer's I/O
+    thread, so the state is guarded by a lock
+    '''
+
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._stats = defaultdict(TopicDeliveryStats)
+        self._lock = threading.Lock()
+
+    def reserve(self, records: int):
+        '''
+        Reserve room for the records in the bounded in-flight window, so the
+        requests are rejected instead of piling up when the broker is slow
+        '''
+        with self._lock:
+            if self.in_flight + records > self.max_in_flight:
+                raise ProducerBufferFull(
+                    'Too many events are waiting for delivery, try again later'
+                )
+            self.in_flight += records
+
+    def release(self, records: int):
+        with self._lock:
+            self.in_flight -= records
+
+    def sent(self, topic: str) -> float:
+        with self._lock:
+            self._stats[topic].sent += 1
+        return time.monotonic()
+
+    def delivered(self, topic: str, sent_at: float):
+        latency = time.monotonic() - sent_at
+        with self._lock:
+            self.in_flight -= 1
+            stats = self._stats[topic]
+            stats.delivered += 1
+            stats.latency_sum_sec += latency
+            stats.latency_max_sec = max(stats.latency_max_sec, latency)
+
+    def failed(self, topic: str, exception: BaseException):
+        with self._lock:
+            self.in_flight -= 1
+            self._stats[topic].errors += 1
+        print(f"Failed to deliver a message to {topic}: {exception!r}")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'in_flight': self.in_flight,
+                'topics': {
+                    topic: {
+                        **asdict(stats),
+                        'latency_avg_sec': (
+                            stats.latency_sum_sec / stats.delivered
+                            if stats.delivered else 0.0
+                        ),
+                    }
+                    for topic, stats in self._stats.items()
+                },
+            }
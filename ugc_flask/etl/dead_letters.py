@@ -0,0 +1,83 @@
+'''
+Module has the dead letter path of the messages that can not be routed or
+decoded into ClickHouse rows, so a single bad client can not stall the
+ingestion of all the tables
+'''
+from __future__ import annotations
+from collections import Counter
+from datetime import datetime, timezone
+from enum import Enum
+from typing import TYPE_CHECKING
+
+import struct
+
+import orjson
+
+import settings
+from decoders import UnknownSchema
+from metrics import DEAD_LETTERS
+
+
+if TYPE_CHECKING:
+    from aiokafka import AIOKafkaProducer
+    from aiokafka.structs import ConsumerRecord
+
+
+class DeadLetterReason(Enum):
+    UNKNOWN_ROUTE = 'unknown_route'
+    UNDECODABLE = 'undecodable'
+    UNKNOWN_SCHEMA = 'unknown_schema'
+    MISSING_FIELD = 'missing_field'
+    INVALID_VALUE = 'invalid_value'
+
+
+class DeadLetterNotSent(Exception):
+    pass
+
+
+# Number of dead letters per (source topic, reason)
+dead_letter_counts = Counter()
+
+
+def classify_decode_error(error: Exception) -> DeadLetterReason:
+    if isinstance(
+        error,
+        (orjson.JSONDecodeError, UnicodeDecodeError, struct.error),
+    ):
+        return DeadLetterReason.UNDECODABLE
+    if isinstance(error, UnknownSchema):
+        return DeadLetterReason.UNKNOWN_SCHEMA
+    if isinstance(error, KeyError):
+        return DeadLetterReason.MISSING_FIELD
+    return DeadLetterReason.INVALID_VALUE
+
+
+async def send_to_dead_letter_topic(
+    producer: AIOKafkaProducer,
+    message: ConsumerRecord,
+    reason: DeadLetterReason,
+    error: Exception | None = None,
+):
+    '''
+    Send the message as is to the dead letter topic of its source topic,
+    the error metadata is passed in the headers
+    '''
+    headers = [
+        ('error_reason', reason.value.encode('utf-8')),
+        ('error_message', repr(error).encode('utf-8')),
+        ('source_topic', message.topic.encode('utf-8')),
+        ('source_partition', str(message.partition).encode('utf-8')),
+        ('source_offset', str(message.offset).encode('utf-8')),
+        (
+            'failed_at',
+            datetime.now(timezone.utc).isoformat().encode('utf-8'),
+        ),
+    ]
+    await producer.send_and_wait(
+        f'{message.topic}{settings.DEAD_LETTER_TOPIC_SUFFIX}',
+        value=message.value,
+        key=message.key,
+        headers=headers,
+    )
+    dead_letter_counts[(message.topic, reason.value)] += 1
+    DEAD_LETTERS.labels(message.topic, reason.value).inc()
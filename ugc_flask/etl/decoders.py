@@ -0,0 +1,181 @@
+'''
+Module has the schema-aware decoders of Kafka messages into ClickHouse rows.
+
+Fields are taken by name with getters built once per schema, so a producer
+reordering the fields of its messages can not shift the columns, and the
+column names of every schema are checked against the insert query when the
+routing table is built. Every field is converted to its column type, so a
+message violating the schema fails to decode instead of failing the whole
+batch insert.
+
+Click tracking events may be encoded with the compact binary schemas of
+click_codecs.py instead of JSON, the schema is chosen by the ID in the
+schema_id header of the message.
+'''
+from __future__ import annotations
+import re
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from operator import itemgetter
+from typing import Callable, Iterable
+from uuid import UUID
+
+import orjson
+
+from click_codecs import SCHEMA_ID_HEADER, BinarySchema
+
+
+class UnknownSchema(Exception):
+    pass
+
+
+def fields_getter(fields: tuple[str, ...]) -> Callable[[dict], tuple]:
+    if len(fields) == 1:
+        field, = fields
+        return lambda payload: (payload[field],)
+    return itemgetter(*fields)
+
+
+def convert_fields(
+    converters: tuple[Callable, ...],
+    values: tuple,
+) -> tuple:
+    return tuple(
+        convert(value) for convert, value in zip(converters, values)
+    )
+
+
+@lru_cache(maxsize=None)
+def parse_utc_offset(offset: str) -> timezone:
+    '''
+    Parse the UTC offset in the ±HHMM form, there are only a few of them,
+    so the timezones are cached
+    '''
+    sign = -1 if offset[0] == '-' else 1
+    return timezone(
+        sign * timedelta(hours=int(offset[1:3]), minutes=int(offset[3:5]))
+    )
+
+
+def parse_visited_at(value: str) -> datetime:
+    '''
+    Parse the time in the "%Y-%m-%d %H:%M:%S %z" format used by the Async
+    API Service without datetime.strptime, which is several times slower
+    '''
+    return datetime.fromisoformat(value[:19]).replace(
+        tzinfo=parse_utc_offset(value[20:])
+    )
+
+
+class PageViewDecoder:
+    '''
+    Decoder of the Async API Service page views:
+    {"user_id": ..., "query_parameters": {...}, "visited_at": ...}
+    '''
+
+    def __init__(self, query_parameters: dict[str, Callable]):
+        self.columns = (
+            'user_id',
+            *(f'{name}_query_param' for name in query_parameters),
+            'visited_at',
+        )
+        self._get_query_parameters = fields_getter(tuple(query_parameters))
+        self._converters = tuple(query_parameters.values())
+
+    def __call__(
+        self,
+        value: bytes,
+        headers: tuple[tuple[str, bytes], ...] = (),
+    ) -> tuple:
+        payload = orjson.loads(value)
+        return (
+            UUID(payload['user_id']),
+            *convert_fields(
+                self._converters,
+                self._get_query_parameters(payload['query_parameters']),
+            ),
+            parse_visited_at(payload['visited_at']),
+        )
+
+
+class VideoEventDecoder:
+    '''
+    Decoder of the click tracking events with flat fields named as the
+    table columns, either in JSON or in one of the binary schemas.
+    The fields missing in the events of the earlier schema versions take
+    the default values
+    '''
+
+    def __init__(
+        self,
+        fields: dict[str, Callable],
+        binary_schemas: Iterable[BinarySchema] = (),
+        defaults: dict | None = None,
+    ):
+        self.columns = tuple(fields)
+        self._get_fields = fields_getter(self.columns)
+        self._converters = tuple(fields.values())
+        self.defaults = defaults or {}
+        self.binary_schemas = {
+            schema.header_value: schema for schema in binary_schemas
+        }
+        # Schema -> (index of the value or None, converted default) for
+        # every column, for the schemas without some of the columns
+        self._binary_layouts = {
+            schema.header_value: tuple(
+                (schema.fields.index(column), None)
+                if column in schema.fields
+                else (None, fields[column](self.defaults[column]))
+                for column in self.columns
+            )
+            for schema in binary_schemas
+            if schema.fields != self.columns
+            and set(self.columns) - set(schema.fields) <= set(self.defaults)
+        }
+
+    def _get_fields_with_defaults(self, payload: dict) -> tuple:
+        return tuple(
+            payload.get(column, self.defaults[column])
+            if column in self.defaults
+            else payload[column]
+            for column in self.columns
+        )
+
+    def __call__(
+        self,
+        value: bytes,
+        headers: tuple[tuple[str, bytes], ...] = (),
+    ) -> tuple:
+        for name, header_value in headers:
+            if name == SCHEMA_ID_HEADER:
+                schema = self.binary_schemas.get(header_value)
+                if schema is None:
+                    raise UnknownSchema(
+                        f"Unknown schema ID: {header_value!r}"
+                    )
+                # The binary values already have the column types
+                values = schema.decode(value)
+                layout = self._binary_layouts.get(header_value)
+                if layout is None:
+                    return values
+                return tuple(
+                    values[index] if index is not None else default
+                    for index, default in layout
+                )
+
+        payload = orjson.loads(value)
+        try:
+            values = self._get_fields(payload)
+        except KeyError:
+            if not self.defaults:
+                raise
+            values = self._get_fields_with_defaults(payload)
+        return convert_fields(self._converters, values)
+
+
+def insert_query_columns(insert_query: str) -> tuple[str, ...]:
+    '''
+    Return the column names listed in the "INSERT INTO table (...)" query
+    '''
+    columns = re.search(r'\((.*?)\)', insert_query, re.DOTALL).group(1)
+    return tuple(column.strip() for column in columns.split(','))
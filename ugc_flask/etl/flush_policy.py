@@ -0,0 +1,98 @@
+'''
+Module has the flush policy and the flush metrics of ClickHouse batch inserts
+'''
+from __future__ import annotations
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from enum import Enum
+
+import settings
+
+
+class FlushReason(Enum):
+    MAX_ROWS = 'max_rows'
+    MAX_BYTES = 'max_bytes'
+    MAX_LINGER = 'max_linger'
+    REBALANCE = 'rebalance'
+
+
+@dataclass(frozen=True)
+class FlushPolicy:
+    max_rows: int
+    max_bytes: int
+    max_linger_sec: float
+
+    @classmethod
+    def for_table(cls, table: str) -> FlushPolicy:
+        '''
+        Build the policy from the global settings, taking into account
+        the overrides set for the table, e.g. <TABLE>_FLUSH_MAX_ROWS
+        '''
+        prefix = table.upper()
+        return cls(
+            max_rows=int(
+                os.getenv(f'{prefix}_FLUSH_MAX_ROWS', settings.FLUSH_MAX_ROWS)
+            ),
+            max_bytes=int(
+                os.getenv(f'{prefix}_FLUSH_MAX_BYTES', settings.FLUSH_MAX_BYTES)
+            ),
+            max_linger_sec=float(
+                os.getenv(
+                    f'{prefix}_FLUSH_MAX_LINGER_SEC',
+                    settings.FLUSH_MAX_LINGER_SEC,
+                )
+            ),
+        )
+
+    def reason_to_flush(
+        self,
+        rows: int,
+        size_bytes: int,
+        linger_sec: float,
+    ) -> FlushReason | None:
+        if not rows:
+            return None
+        if rows >= self.max_rows:
+            return FlushReason.MAX_ROWS
+        if size_bytes >= self.max_bytes:
+            return FlushReason.MAX_BYTES
+        if linger_sec >= self.max_linger_sec:
+            return FlushReason.MAX_LINGER
+        return None
+
+
+@dataclass
+class FlushStats:
+    flushes: int = 0
+    rows: int = 0
+    bytes: int = 0
+    duration_sec: float = 0.0
+    reasons: Counter = field(default_factory=Counter)
+
+    def record(
+        self,
+        rows: int,
+        size_bytes: int,
+        duration_sec: float,
+        reason: FlushReason,
+    ):
+        self.flushes += 1
+        self.rows += rows
+        self.bytes += size_bytes
+        self.duration_sec += duration_sec
+        self.reasons[reason.value] += 1
+
+    def report(self, table: str) -> str:
+        if not self.flushes:
+            return f'{table}: no flushes'
+        reasons = ', '.join(
+            f'{reason}={count}' for reason, count in self.reasons.items()
+        )
+        return (
+            f'{table}: {self.flushes} flushes, '
+            f'{self.rows // self.flushes} rows/flush, '
+            f'{self.bytes // self.flushes} bytes/flush, '
+            f'{self.duration_sec / self.flushes:.3f} sec/flush '
+            f'({reasons})'
+        )
@@ -1,168 +1,240 @@
+import argparse
 import asyncio
-from aiohttp import ClientSession
+import multiprocessing
+import time
+from datetime import datetime
+from multiprocessing.connection import wait
+from aiohttp import ClientSession, TCPConnector
 
 # from clickhouse_driver import Client
-from aiokafka import AIOKafkaConsumer
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
+from aiokafka.coordinator.assignors.range import RangePartitionAssignor
 from aiochclient import ChClient
 
 
 import settings
-import queries
+from metrics import start_metrics_server, track_buffers
+from migrations import apply_migrations
+from replay import replay_topic
+from offsets import OffsetTracker
+from routing import build_routing_table
+from sessionization import Sessionizer, check_co_partitioning
 from utils import (
-    load_data_to_clickhouse_from_async_api_kafka_topics,
-    load_data_to_clickhouse_from_video_events_kafka_topics
+    FlushOnRebalance,
+    flush_on_timer,
+    load_data_to_clickhouse,
 )
 
 
-async def main():
+async def migrate_schema():
     async with ClientSession() as session:
         client = ChClient(
             session=session,
             url=settings.CLICKHOUSE_HOST,
         )
-        await client.execute(queries.drop_database)
-        await client.execute(queries.create_database)
+        # Only the migrations that are not applied yet are executed,
+        # the stored data is kept between restarts
+        await apply_migrations(client)
 
-        # Table creating
-        async def create_tables():
-            for query in queries.table_creation_queries:
-                await client.execute(query)
 
-        await create_tables()
+async def consume_to_clickhouse(worker_id: int):
+    # Every worker process keeps its own pool of ClickHouse connections
+    connector = TCPConnector(limit=settings.CLICKHOUSE_POOL_SIZE)
+    async with ClientSession(connector=connector) as session:
+        client = ChClient(
+            session=session,
+            url=settings.CLICKHOUSE_HOST,
+        )
 
         consumer = AIOKafkaConsumer(
-            *settings.TOPIC_NAMES,
             bootstrap_servers=settings.BOOTSTRAP_SERVERS,
             auto_offset_reset="earliest",
-            group_id='consumer_for_clickhouse',
+            group_id=settings.KAFKA_GROUP_ID,
+            client_id=f'{settings.KAFKA_GROUP_ID}_{worker_id}',
             enable_auto_commit=False,
+            # The same partitions of all the click tracking topics are
+            # assigned to one worker process, so it consumes all the events
+            # of a viewer for the sessionization
+            partition_assignment_strategy=(RangePartitionAssignor,),
         )
 
+        # Every (topic, key) pair is routed to its own ClickHouse sink
+        # holding the rows accumulated for the batch insert
+        routing_table = build_routing_table()
+        # Click tracking events are also grouped into watch sessions
+        sessionizer = Sessionizer(routing_table)
+        track_buffers([*routing_table.values(), sessionizer.sink])
+        # Offsets are committed only up to the lowest one not yet inserted
+        # across all the sinks
+        offset_tracker = OffsetTracker()
+
+        consumer.subscribe(
+            settings.TOPIC_NAMES,
+            listener=FlushOnRebalance(
+                routing_table,
+                consumer,
+                client,
+                offset_tracker,
+                sessionizer,
+            ),
+        )
+        # Messages that can not be routed or decoded are sent to the dead
+        # letter topics instead of stalling the ingestion
+        dead_letter_producer = AIOKafkaProducer(
+            bootstrap_servers=settings.BOOTSTRAP_SERVERS,
+            acks='all',
+        )
+        await dead_letter_producer.start()
         await consumer.start()
+        await check_co_partitioning(consumer)
+
+        async def consume():
+            async for message in consumer:
+                await load_data_to_clickhouse(
+                    message,
+                    routing_table.route(message.topic, message.key),
+                    consumer,
+                    client,
+                    offset_tracker,
+                    dead_letter_producer,
+                    sessionizer,
+                )
+
+        tasks = [
+            asyncio.create_task(consume()),
+            asyncio.create_task(
+                flush_on_timer(
+                    routing_table,
+                    consumer,
+                    client,
+                    offset_tracker,
+                    sessionizer,
+                )
+            ),
+        ]
+        try:
+            # A failed insert that ran out of retries stops both tasks, the
+            # uncommitted messages are consumed again after the restart
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await consumer.stop()
+            await dead_letter_producer.stop()
+
+
+async def replay(args: argparse.Namespace):
+    async with ClientSession() as session:
+        client = ChClient(
+            session=session,
+            url=settings.CLICKHOUSE_HOST,
+        )
+        await apply_migrations(client)
+        await replay_topic(
+            client,
+            args.topic,
+            start_offset=args.start_offset,
+            since=args.since,
+            until=args.until,
+        )
+
 
-        # Temporal storage for accumulating rows to make batch insert
-        # into ClickHouse tables
-        video_quality_change_clicks_batch_data = []
-        video_pause_clicks_batch_data = []
-        video_full_views_batch_data = []
+def run_worker(worker_id: int):
+    start_metrics_server(worker_id)
+    try:
+        asyncio.run(consume_to_clickhouse(worker_id))
+    except KeyboardInterrupt:
+        pass
 
-        get_films_page_views_batch_data = []
-        get_film_by_id_page_views_batch_data = []
-        search_films_by_keyword_page_views_batch_data = []
 
-        get_genres_page_views_batch_data = []
-        get_genre_by_id_page_views_batch_data = []
+def main():
+    '''
+    Migrate the schema once and supervise ETL_WORKERS consumer processes of
+    the same consumer group, restarting the ones that exit with an error
+    '''
+    asyncio.run(migrate_schema())
 
-        get_person_by_id_page_views_batch_data = []
-        search_persons_by_keyword_page_views_batch_data = []
+    context = multiprocessing.get_context('spawn')
 
+    def start_worker(worker_id: int):
+        process = context.Process(
+            target=run_worker,
+            args=(worker_id,),
+            name=f'etl_worker_{worker_id}',
+        )
+        process.start()
+        return process
+
+    workers = {
+        worker_id: start_worker(worker_id)
+        for worker_id in range(settings.ETL_WORKERS)
+    }
+    try:
         while True:
-            try:
-                async for message in consumer:
-                    if message.topic == settings.AsyncAPITopics.FILM_TOPIC.value:
-
-                        if message.key.decode("utf-8") == settings.FilmTopicPartitions.GET_FILMS.value:
-                            await load_data_to_clickhouse_from_async_api_kafka_topics(
-                                message,
-                                get_films_page_views_batch_data,
-                                consumer,
-                                client,
-                                queries.insert_into_get_films_page_views_table
-                            )
-
-                        elif message.key.decode("utf-8") == settings.FilmTopicPartitions.GET_FILM_BY_ID.value:
-                            await load_data_to_clickhouse_from_async_api_kafka_topics(
-                                message,
-                                get_film_by_id_page_views_batch_data,
-                                consumer,
-                                client,
-                                queries.insert_into_get_film_by_id_page_views_table
-                            )
-
-                        elif message.key.decode("utf-8") == settings.FilmTopicPartitions.SEARCH_FILMS_BY_KEYWORD.value:
-                            await load_data_to_clickhouse_from_async_api_kafka_topics(
-                                message,
-                                search_films_by_keyword_page_views_batch_data,
-                                consumer,
-                                client,
-                                queries.insert_into_search_films_by_keyword_page_views_table
-                            )
-
-                    elif message.topic == settings.AsyncAPITopics.GENRE_TOPIC.value:
-
-                        if message.key.decode("utf-8") == settings.GenreTopicPartitions.GET_GENRES.value:
-                            await load_data_to_clickhouse_from_async_api_kafka_topics(
-                                message,
-                                get_genres_page_views_batch_data,
-                                consumer,
-                                client,
-                                queries.insert_into_get_genres_page_views_table
-                            )
-
-                        elif message.key.decode("utf-8") == settings.GenreTopicPartitions.GET_GENRE_BY_ID.value:
-                            await load_data_to_clickhouse_from_async_api_kafka_topics(
-                                message,
-                                get_genre_by_id_page_views_batch_data,
-                                consumer,
-                                client,
-                                queries.insert_into_get_genre_by_id_page_views_table
-                            )
-
-                    elif message.topic == settings.AsyncAPITopics.PERSON_TOPIC.value:
-
-                        if message.key.decode("utf-8") == settings.PersonTopicPartitions.GET_PERSON_BY_ID.value:
-                            await load_data_to_clickhouse_from_async_api_kafka_topics(
-                                message,
-                                get_person_by_id_page_views_batch_data,
-                                consumer,
-                                client,
-                                queries.insert_into_get_person_by_id_page_views_table
-                            )
-
-                        elif message.key.decode("utf-8") == settings.PersonTopicPartitions.SEARCH_PERSONS_BY_KEYWORD.value:
-                            await load_data_to_clickhouse_from_async_api_kafka_topics(
-                                message,
-                                search_persons_by_keyword_page_views_batch_data,
-                                consumer,
-                                client,
-                                queries.insert_into_search_persons_by_keyword_page_views_table
-                            )
-
-                    elif message.topic == settings.ClickTrackingTopics.QUALITY_CHANGE_CLICK.value:
-
-                        await load_data_to_clickhouse_from_video_events_kafka_topics(
-                            message,
-                            video_quality_change_clicks_batch_data,
-                            consumer,
-                            client,
-                            queries.insert_into_video_quality_change_clicks_table
-                        )
-
-                    elif message.topic == settings.ClickTrackingTopics.PAUSE_CLICK.value:
-
-                        await load_data_to_clickhouse_from_video_events_kafka_topics(
-                            message,
-                            video_pause_clicks_batch_data,
-                            consumer,
-                            client,
-                            queries.insert_into_video_pause_clicks_table
-                        )
-
-                    elif message.topic == settings.ClickTrackingTopics.FULL_VIEW.value:
-
-                        await load_data_to_clickhouse_from_video_events_kafka_topics(
-                            message,
-                            video_full_views_batch_data,
-                            consumer,
-                            client,
-                            queries.insert_into_video_full_views_table
-                        )
-
-            except KeyboardInterrupt:
-                print("Exit using the keyboard")
-            finally:
-                await consumer.stop()
+            wait([process.sentinel for process in workers.values()])
+            for worker_id, process in list(workers.items()):
+                if process.is_alive():
+                    continue
+
+                print(
+                    f"Worker {process.name} exited with code "
+                    f"{process.exitcode}"
+                )
+                if process.exitcode == 0:
+                    del workers[worker_id]
+                    continue
+                time.sleep(settings.WORKER_RESTART_DELAY_SEC)
+                workers[worker_id] = start_worker(worker_id)
+
+            if not workers:
+                break
+    except KeyboardInterrupt:
+        print("Exit using the keyboard")
+    finally:
+        for process in workers.values():
+            process.terminate()
+        for process in workers.values():
+            process.join()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='ETL of the tracked events from Kafka to ClickHouse',
+    )
+    subparsers = parser.add_subparsers(dest='mode')
+    replay_parser = subparsers.add_parser(
+        'replay',
+        help=(
+            'Rebuild the tables of the topic from the given offset or time '
+            'range and swap them with the live ones'
+        ),
+    )
+    replay_parser.add_argument('--topic', required=True)
+    start = replay_parser.add_mutually_exclusive_group()
+    start.add_argument(
+        '--start-offset',
+        type=int,
+        help='Offset to start from in every partition',
+    )
+    start.add_argument(
+        '--since',
+        type=datetime.fromisoformat,
+        help='Time to start from, e.g. 2024-11-01T00:00:00+00:00',
+    )
+    replay_parser.add_argument(
+        '--until',
+        type=datetime.fromisoformat,
+        help=(
+            'Time to stop at, by default the replay catches up with '
+            'the live consumers'
+        ),
+    )
+    return parser.parse_args()
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    args = parse_args()
+    if args.mode == 'replay':
+        asyncio.run(replay(args))
+    else:
+        main()
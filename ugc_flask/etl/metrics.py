@@ -0,0 +1,107 @@
+'''
+Module has the Prometheus metrics of the ETL consumer. Every worker process
+serves its own metrics on the port ETL_METRICS_PORT + the worker ID, so the
+workers are scraped as separate targets
+'''
+from __future__ import annotations
+from typing import TYPE_CHECKING, Iterable
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+import settings
+
+
+if TYPE_CHECKING:
+    from aiokafka import AIOKafkaConsumer
+
+    from routing import Sink
+
+
+CONSUMER_LAG = Gauge(
+    'etl_consumer_lag_messages',
+    'Messages of the partition not consumed yet',
+    ['topic', 'partition'],
+)
+MESSAGES_DECODED = Counter(
+    'etl_messages_decoded_total',
+    'Messages decoded into the rows of the table',
+    ['table'],
+)
+DEAD_LETTERS = Counter(
+    'etl_dead_letters_total',
+    'Messages sent to the dead letter topics',
+    ['topic', 'reason'],
+)
+ROWS_PER_INSERT = Histogram(
+    'etl_rows_per_insert',
+    'Rows inserted into the table with one batch insert',
+    ['table'],
+    buckets=(1, 10, 100, 1_000, 10_000, 50_000, 100_000, 200_000, 500_000),
+)
+INSERT_DURATION = Histogram(
+    'etl_insert_duration_seconds',
+    'Duration of the batch inserts into the table, including the retries',
+    ['table'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+BUFFER_ROWS = Gauge(
+    'etl_buffer_rows',
+    'Rows buffered for the batch insert into the table',
+    ['table'],
+)
+BUFFER_BYTES = Gauge(
+    'etl_buffer_bytes',
+    'Size of the messages buffered for the batch insert into the table',
+    ['table'],
+)
+COMMIT_DURATION = Histogram(
+    'etl_commit_duration_seconds',
+    'Duration of the Kafka offset commits',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+COMMIT_FAILURES = Counter(
+    'etl_commit_failures_total',
+    'Kafka offset commits failed and left to the next commit',
+)
+RETRIES = Counter(
+    'etl_retries_total',
+    'Retries made by the functions with the backoff',
+    ['function'],
+)
+
+
+def start_metrics_server(worker_id: int):
+    start_http_server(settings.ETL_METRICS_PORT + worker_id)
+
+
+def track_buffers(sinks: Iterable[Sink]):
+    '''
+    Read the buffer occupancy of the sinks on scrape instead of updating
+    the gauges on every message
+    '''
+    for sink in sinks:
+        BUFFER_ROWS.labels(sink.table).set_function(
+            lambda sink=sink: len(sink.buffer)
+        )
+        BUFFER_BYTES.labels(sink.table).set_function(
+            lambda sink=sink: sink.buffer_bytes
+        )
+
+
+async def update_consumer_lag(kafka_consumer: AIOKafkaConsumer):
+    '''
+    Set the lag of every assigned partition as the difference between its
+    high watermark known from the last fetch and the consumer position
+    '''
+    lags = {}
+    for tp in kafka_consumer.assignment():
+        highwater = kafka_consumer.highwater(tp)
+        if highwater is None:
+            continue
+        position = await kafka_consumer.position(tp)
+        lags[(tp.topic, str(tp.partition))] = max(highwater - position, 0)
+
+    # The partitions revoked by a rebalance are removed
+    CONSUMER_LAG.clear()
+    for labels, lag in lags.items():
+        CONSUMER_LAG.labels(*labels).set(lag)
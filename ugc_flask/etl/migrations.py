@@ -0,0 +1,204 @@
+'''
+Module has the versioned schema migrations of the ClickHouse database.
+
+Every migration is a list of steps applied in order. An applied step is
+recorded in the schema migrations table and is never executed again, so
+the ETL can be restarted at any time without touching the stored data.
+New schema changes are added as a new migration at the end of MIGRATIONS,
+the applied migrations must not be edited.
+'''
+from __future__ import annotations
+from dataclasses import dataclass
+from functools import partial
+from typing import TYPE_CHECKING, Awaitable, Callable, Union
+
+import queries
+
+
+if TYPE_CHECKING:
+    from aiochclient import ChClient
+
+
+# A step is a query or a tuple of queries that are always executed
+# together, so a step interrupted halfway is safe to run again, or an
+# async function of the ClickHouse client for the steps that have to check
+# the state of the database to be safe to run again
+Step = Union[str, tuple[str, ...], Callable[['ChClient'], Awaitable[None]]]
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    steps: list[Step]
+
+
+async def exchange_rebuilt_table(
+    table: str,
+    schema: str,
+    clickhouse_client: ChClient,
+):
+    '''
+    Swap the table with the rebuilt one unless they are already swapped:
+    when the exchange is interrupted before the step is recorded, running
+    it again would put the old table back, and the next step would drop
+    the rebuilt one. The rebuilt table is recognized by comparing it with
+    an empty table created with the same schema
+    '''
+    new_table = f'{table}__rebuild'
+    probe_table = f'{table}__rebuild_probe'
+    await clickhouse_client.execute(queries.drop_table(probe_table))
+    await clickhouse_client.execute(queries.create_table(probe_table, schema))
+    structures = {
+        # The queries are compared without the table names
+        record['name']: record['create_table_query'].replace(
+            f'.{record["name"]} ', ' ', 1
+        )
+        for record in await clickhouse_client.fetch(
+            queries.select_create_table_queries((new_table, probe_table))
+        )
+    }
+    await clickhouse_client.execute(queries.drop_table(probe_table))
+
+    if structures.get(new_table) == structures[probe_table]:
+        await clickhouse_client.execute(
+            queries.exchange_tables(table, new_table)
+        )
+    else:
+        print(f"Table {table} is already swapped with {new_table}")
+
+
+def rebuild_table_steps(table: str, schema: str) -> list[Step]:
+    '''
+    Steps copying the table into a new one with the given schema and
+    swapping them atomically (requires the Atomic database engine)
+    '''
+    new_table = f'{table}__rebuild'
+    return [
+        queries.create_table(new_table, schema),
+        (
+            queries.truncate_table(new_table),
+            queries.copy_table(table, new_table),
+        ),
+        partial(exchange_rebuilt_table, table, schema),
+        queries.drop_table(new_table),
+    ]
+
+
+MIGRATIONS = [
+    Migration(
+        version=1,
+        description='Create click tracking and page views tables',
+        steps=queries.table_creation_queries,
+    ),
+    Migration(
+        version=2,
+        description=(
+            'Partition tables by month, compress columns, '
+            'sort by dashboard keys and add TTL'
+        ),
+        steps=[
+            step
+            for table, schema in queries.table_schemas_v2.items()
+            for step in rebuild_table_steps(table, schema)
+        ],
+    ),
+    Migration(
+        version=3,
+        description=(
+            'Add materialized views with film views, unique viewers '
+            'and full views per hour'
+        ),
+        steps=[
+            queries.create_film_views_hourly_table,
+            queries.create_film_views_hourly_mv,
+            # Aggregate the rows inserted before the view was created
+            (
+                queries.truncate_table(queries.FILM_VIEWS_HOURLY),
+                queries.fill_table(
+                    queries.FILM_VIEWS_HOURLY,
+                    queries.select_for_film_views_hourly_table,
+                ),
+            ),
+            queries.create_full_views_hourly_table,
+            queries.create_full_views_hourly_mv,
+            (
+                queries.truncate_table(queries.FULL_VIEWS_HOURLY),
+                queries.fill_table(
+                    queries.FULL_VIEWS_HOURLY,
+                    queries.select_for_full_views_hourly_table,
+                ),
+            ),
+        ],
+    ),
+    Migration(
+        version=4,
+        description=(
+            'Add the user, the film and the receive time '
+            'to the click tracking tables'
+        ),
+        steps=[
+            queries.add_click_event_enrichment_columns(table)
+            for table in (
+                queries.VIDEO_QUALITY_CHANGE_CLICKS,
+                queries.VIDEO_PAUSE_CLICKS,
+                queries.VIDEO_FULL_VIEWS,
+            )
+        ],
+    ),
+    Migration(
+        version=5,
+        description='Create watch sessions table',
+        steps=[queries.create_watch_sessions_table],
+    ),
+    Migration(
+        version=6,
+        description='Aggregate full views per hour by film',
+        steps=[
+            queries.drop_view(queries.FULL_VIEWS_HOURLY_MV),
+            queries.drop_table(queries.FULL_VIEWS_HOURLY),
+            queries.create_full_views_hourly_table_v2,
+            queries.create_full_views_hourly_mv_v2,
+            (
+                queries.truncate_table(queries.FULL_VIEWS_HOURLY),
+                queries.fill_table(
+                    queries.FULL_VIEWS_HOURLY,
+                    queries.select_for_full_views_hourly_table_v2,
+                ),
+            ),
+        ],
+    ),
+]
+
+
+async def apply_migrations(clickhouse_client: ChClient):
+    await clickhouse_client.execute(queries.create_database)
+    await clickhouse_client.execute(queries.create_schema_migrations_table)
+
+    applied_steps = {
+        (record['version'], record['step'])
+        for record in await clickhouse_client.fetch(
+            queries.select_from_schema_migrations_table
+        )
+    }
+
+    for migration in MIGRATIONS:
+        for step, step_queries in enumerate(migration.steps):
+            if (migration.version, step) in applied_steps:
+                continue
+
+            print(
+                f"Applying migration {migration.version} "
+                f"step {step}: {migration.description}"
+            )
+            if callable(step_queries):
+                await step_queries(clickhouse_client)
+            else:
+                if isinstance(step_queries, str):
+                    step_queries = (step_queries,)
+                for query in step_queries:
+                    await clickhouse_client.execute(query)
+            await clickhouse_client.execute(
+                queries.insert_into_schema_migrations_table,
+                (migration.version, step, migration.description),
+            )
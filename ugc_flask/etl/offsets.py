@@ -0,0 +1,122 @@
+'''
+Module has the per-partition offset tracking of the messages buffered for
+ClickHouse batch inserts
+'''
+from __future__ import annotations
+from collections import Counter, deque
+from typing import TYPE_CHECKING, Iterable
+
+from aiokafka.errors import KafkaError
+
+from metrics import COMMIT_DURATION, COMMIT_FAILURES
+
+
+if TYPE_CHECKING:
+    from aiokafka import AIOKafkaConsumer
+    from aiokafka.structs import TopicPartition
+
+
+class OffsetsCommitHalted(Exception):
+    pass
+
+
+class OffsetTracker:
+    '''
+    Tracks the offsets of the buffered messages for every partition, so
+    the committed offset never passes a message that is not durably
+    inserted into ClickHouse yet, whatever sink it is buffered in. A message
+    the rows of several sinks are built from, e.g. a click event and the
+    watch session it belongs to, is consumed once for every row
+    '''
+
+    def __init__(self):
+        # Offsets of the buffered messages in the order they were consumed
+        self._pending: dict[TopicPartition, deque[int]] = {}
+        # Buffered offsets that are already inserted into ClickHouse, with
+        # the number of their inserted rows
+        self._inserted: dict[TopicPartition, Counter[int]] = {}
+        # Offset following the last consumed message
+        self._consumed: dict[TopicPartition, int] = {}
+        self._committed: dict[TopicPartition, int] = {}
+        # Error that made the rows unrecoverable, no offsets are committed
+        # after it
+        self.halted_by: Exception | None = None
+
+    def consumed(self, tp: TopicPartition, offset: int):
+        self._pending.setdefault(tp, deque()).append(offset)
+        self._consumed[tp] = offset + 1
+
+    def inserted(self, offsets: Iterable[tuple[TopicPartition, int]]):
+        for tp, offset in offsets:
+            # The partition is forgotten after it was revoked, its messages
+            # are consumed again by the consumer it is assigned to
+            if tp in self._consumed:
+                self._inserted.setdefault(tp, Counter())[offset] += 1
+
+    def committable(self) -> dict[TopicPartition, int]:
+        '''
+        Return the offsets that can be committed and have changed since
+        the last commit: the lowest offset not inserted yet or, when
+        nothing is pending, the offset following the last consumed message
+        '''
+        if self.halted_by is not None:
+            raise OffsetsCommitHalted(
+                "Offsets are not committed after the failed insert"
+            ) from self.halted_by
+
+        offsets = {}
+        for tp, next_offset in self._consumed.items():
+            pending = self._pending.get(tp)
+            inserted = self._inserted.setdefault(tp, Counter())
+            while pending and inserted[pending[0]]:
+                offset = pending.popleft()
+                inserted[offset] -= 1
+                if not inserted[offset]:
+                    del inserted[offset]
+
+            offset = pending[0] if pending else next_offset
+            if self._committed.get(tp) != offset:
+                offsets[tp] = offset
+        return offsets
+
+    def mark_committed(self, offsets: dict[TopicPartition, int]):
+        self._committed.update(offsets)
+
+    def halt(self, error: Exception):
+        self.halted_by = error
+
+    def forget(self, partitions: Iterable[TopicPartition]):
+        for tp in partitions:
+            self._pending.pop(tp, None)
+            self._inserted.pop(tp, None)
+            self._consumed.pop(tp, None)
+            self._committed.pop(tp, None)
+
+
+async def commit_offsets(
+    kafka_consumer: AIOKafkaConsumer,
+    offset_tracker: OffsetTracker,
+):
+    '''
+    Commit the offsets of the inserted messages. A failed commit, e.g. when
+    the group is rebalancing, leaves the offsets uncommitted, so they are
+    committed again on the next flush tick or by the revoke handler
+    '''
+    # The partitions revoked while their messages were being processed
+    # can not be committed by this consumer anymore
+    assignment = kafka_consumer.assignment()
+    offsets = {
+        tp: offset
+        for tp, offset in offset_tracker.committable().items()
+        if tp in assignment
+    }
+    if not offsets:
+        return
+    try:
+        with COMMIT_DURATION.time():
+            await kafka_consumer.commit(offsets)
+    except KafkaError as e:
+        COMMIT_FAILURES.inc()
+        print(f"Offsets are not committed: {e!r}")
+        return
+    offset_tracker.mark_committed(offsets)
@@ -0,0 +1,81 @@
+'''
+Module has queries for film popularity dashboards reading the materialized
+views with pre-aggregated views per hour and the watch sessions instead of
+the raw tables
+'''
+from __future__ import annotations
+from datetime import datetime
+from typing import TYPE_CHECKING
+from uuid import UUID
+
+import queries
+
+
+if TYPE_CHECKING:
+    from aiochclient import ChClient, Record
+
+
+async def get_film_views_per_hour(
+    clickhouse_client: ChClient,
+    film_id: UUID,
+    since: datetime,
+    until: datetime,
+) -> list[Record]:
+    '''
+    Return the views and the unique viewers of the film page per hour
+    '''
+    return await clickhouse_client.fetch(
+        queries.select_film_views_per_hour,
+        params={'film_id': film_id, 'since': since, 'until': until},
+    )
+
+
+async def get_top_films_by_views(
+    clickhouse_client: ChClient,
+    since: datetime,
+    until: datetime,
+    limit: int = 10,
+) -> list[Record]:
+    '''
+    Return the most viewed films with their views and unique viewers
+    '''
+    return await clickhouse_client.fetch(
+        queries.select_top_films_by_views,
+        params={'since': since, 'until': until, 'limit': limit},
+    )
+
+
+async def get_full_view_completion_rate_per_hour(
+    clickhouse_client: ChClient,
+    film_id: UUID,
+    since: datetime,
+    until: datetime,
+) -> list[Record]:
+    '''
+    Return the ratio of the full views of the film to its page views
+    per hour
+    '''
+    return await clickhouse_client.fetch(
+        queries.select_full_view_completion_rate_per_hour,
+        params={'film_id': film_id, 'since': since, 'until': until},
+    )
+
+
+async def get_watch_session_stats_of_film(
+    clickhouse_client: ChClient,
+    film_id: UUID,
+    since: datetime,
+    until: datetime,
+) -> Record:
+    '''
+    Return the number of the watch sessions of the film, their average
+    duration, pauses and quality changes and the share of full views
+    '''
+    return await clickhouse_client.fetchrow(
+        queries.select_watch_session_stats_of_film,
+        params={
+            'film_id': film_id,
+            'since': int(since.timestamp() * 1000),
+            'until': int(until.timestamp() * 1000),
+        },
+    )
@@ -3,15 +3,28 @@ Module has queries for creating ClickHouse database and tables
 '''
 from settings import (
     CLICKHOUSE_DATABASE_NAME,
-    CLICKHOUSE_CLUSTER
+    CLICKHOUSE_CLUSTER,
+    CLICKHOUSE_TTL_DAYS,
 )
 
 # ClickHouse Table names
+# Table for the applied schema migrations
+SCHEMA_MIGRATIONS = 'schema_migrations'
+
 # Tables for Click Tracking Kafka Topic Messages
 VIDEO_QUALITY_CHANGE_CLICKS = 'video_quality_change_clicks'
 VIDEO_PAUSE_CLICKS = 'clicks_on_video_pauses'
 VIDEO_FULL_VIEWS = 'clicks_on_video_full_views'
 
+# Tables and materialized views with pre-aggregated film popularity
+FILM_VIEWS_HOURLY = 'film_views_hourly'
+FILM_VIEWS_HOURLY_MV = 'film_views_hourly_mv'
+FULL_VIEWS_HOURLY = 'full_views_hourly'
+FULL_VIEWS_HOURLY_MV = 'full_views_hourly_mv'
+
+# Table for the watch sessions built from the click tracking events
+WATCH_SESSIONS = 'watch_sessions'
+
 # Tables for AsyncAPI Service page views
 # Film Enitity
 GET_FILMS_PAGE_VIEWS = 'get_films_page_views'
@@ -27,16 +40,44 @@ GET_PERSON_BY_ID_PAGE_VIEWS = 'get_person_by_id_page_views'
 SEARCH_PERSONS_BY_KEYWORD_PAGE_VIEWS = 'search_persons_by_keyword_page_views'
 
 
-drop_database = (
+create_database = (
     f'''
-    DROP DATABASE IF EXISTS {CLICKHOUSE_DATABASE_NAME}
+    CREATE DATABASE IF NOT EXISTS {CLICKHOUSE_DATABASE_NAME}
+    ON CLUSTER {CLICKHOUSE_CLUSTER}
     '''
 )
 
-create_database = (
+# Schema Migrations Table
+create_schema_migrations_table = (
     f'''
-    CREATE DATABASE IF NOT EXISTS {CLICKHOUSE_DATABASE_NAME}
-    ON CLUSTER {CLICKHOUSE_CLUSTER}
+    CREATE TABLE IF NOT EXISTS {CLICKHOUSE_DATABASE_NAME}.{SCHEMA_MIGRATIONS}
+    (
+        version             UInt32,
+        step                UInt32,
+        description         String,
+        applied_at          DateTime DEFAULT now()
+    )
+    ENGINE = MergeTree()
+    ORDER BY (version, step)
+    '''
+)
+
+insert_into_schema_migrations_table = (
+    f'''
+    INSERT INTO {CLICKHOUSE_DATABASE_NAME}.{SCHEMA_MIGRATIONS}
+    (
+        version,
+        step,
+        description
+    )
+    VALUES
+    '''
+)
+
+select_from_schema_migrations_table = (
+    f'''
+    SELECT version, step
+    FROM {CLICKHOUSE_DATABASE_NAME}.{SCHEMA_MIGRATIONS}
     '''
 )
 
@@ -62,7 +103,10 @@ insert_into_video_quality_change_clicks_table = (
         quality_before,
         quality_after,
         changed_at,
-        timestamp
+        timestamp,
+        user_id,
+        film_id,
+        received_at
     )
     VALUES
     '''
@@ -94,7 +138,10 @@ insert_into_video_pause_clicks_table = (
     INSERT INTO {CLICKHOUSE_DATABASE_NAME}.{VIDEO_PAUSE_CLICKS}
     (
         pause_at,
-        timestamp
+        timestamp,
+        user_id,
+        film_id,
+        received_at
     )
     VALUES
     '''
@@ -123,7 +170,10 @@ insert_into_video_full_views_table = (
     f'''
     INSERT INTO {CLICKHOUSE_DATABASE_NAME}.{VIDEO_FULL_VIEWS}
     (
-        timestamp
+        timestamp,
+        user_id,
+        film_id,
+        received_at
     )
     VALUES
     '''
@@ -402,3 +452,644 @@ table_creation_queries = [
     create_get_person_by_id_page_views_table,
     create_search_persons_by_keyword_page_views_table
 ]
+
+
+# Schema v2 of the tables: monthly partitions, LowCardinality and
+# codec-compressed columns, sort keys matching the dashboard queries and
+# TTL-based retention. Tables are rebuilt into it by migration 2
+CLICK_EVENT_DATE = 'toDateTime(intDiv(timestamp, 1000))'
+
+video_quality_change_clicks_schema_v2 = (
+    f'''
+    (
+        quality_before      LowCardinality(String),
+        quality_after       LowCardinality(String),
+        changed_at          Float32 CODEC(Gorilla, ZSTD(1)),
+        timestamp           Int64 CODEC(Delta, ZSTD(1))
+    )
+    ENGINE = MergeTree()
+    PARTITION BY toYYYYMM({CLICK_EVENT_DATE})
+    ORDER BY timestamp
+    TTL {CLICK_EVENT_DATE} + INTERVAL {CLICKHOUSE_TTL_DAYS} DAY
+    '''
+)
+
+video_pause_clicks_schema_v2 = (
+    f'''
+    (
+        pause_at            Float32 CODEC(Gorilla, ZSTD(1)),
+        timestamp           Int64 CODEC(Delta, ZSTD(1))
+    )
+    ENGINE = MergeTree()
+    PARTITION BY toYYYYMM({CLICK_EVENT_DATE})
+    ORDER BY timestamp
+    TTL {CLICK_EVENT_DATE} + INTERVAL {CLICKHOUSE_TTL_DAYS} DAY
+    '''
+)
+
+video_full_views_schema_v2 = (
+    f'''
+    (
+        timestamp           Int64 CODEC(Delta, ZSTD(1))
+    )
+    ENGINE = MergeTree()
+    PARTITION BY toYYYYMM({CLICK_EVENT_DATE})
+    ORDER BY timestamp
+    TTL {CLICK_EVENT_DATE} + INTERVAL {CLICKHOUSE_TTL_DAYS} DAY
+    '''
+)
+
+get_films_page_views_schema_v2 = (
+    f'''
+    (
+        user_id                     UUID,
+        genre_query_param           LowCardinality(String),
+        sort_query_param            LowCardinality(String),
+        page_number_query_param     Int32 CODEC(T64, ZSTD(1)),
+        page_size_query_param       Int32 CODEC(T64, ZSTD(1)),
+        visited_at                  DateTime CODEC(Delta, ZSTD(1))
+    )
+    ENGINE = MergeTree()
+    PARTITION BY toYYYYMM(visited_at)
+    ORDER BY (genre_query_param, visited_at)
+    TTL visited_at + INTERVAL {CLICKHOUSE_TTL_DAYS} DAY
+    '''
+)
+
+get_film_by_id_page_views_schema_v2 = (
+    f'''
+    (
+        user_id                 UUID,
+        film_id_query_param     UUID,
+        visited_at              DateTime CODEC(Delta, ZSTD(1))
+    )
+    ENGINE = MergeTree()
+    PARTITION BY toYYYYMM(visited_at)
+    ORDER BY (film_id_query_param, visited_at)
+    TTL visited_at + INTERVAL {CLICKHOUSE_TTL_DAYS} DAY
+    '''
+)
+
+search_films_by_keyword_page_views_schema_v2 = (
+    f'''
+    (
+        user_id                         UUID,
+        keyword_to_search_query_param   String CODEC(ZSTD(3)),
+        genre_query_param               LowCardinality(String),
+        sort_query_param                LowCardinality(String),
+        page_number_query_param         Int32 CODEC(T64, ZSTD(1)),
+        page_size_query_param           Int32 CODEC(T64, ZSTD(1)),
+        visited_at                      DateTime CODEC(Delta, ZSTD(1))
+    )
+    ENGINE = MergeTree()
+    PARTITION BY toYYYYMM(visited_at)
+    ORDER BY (visited_at, user_id)
+    TTL visited_at + INTERVAL {CLICKHOUSE_TTL_DAYS} DAY
+    '''
+)
+
+get_genres_page_views_schema_v2 = (
+    f'''
+    (
+        user_id                     UUID,
+        page_number_query_param     Int32 CODEC(T64, ZSTD(1)),
+        page_size_query_param       Int32 CODEC(T64, ZSTD(1)),
+        visited_at                  DateTime CODEC(Delta, ZSTD(1))
+    )
+    ENGINE = MergeTree()
+    PARTITION BY toYYYYMM(visited_at)
+    ORDER BY (visited_at, user_id)
+    TTL visited_at + INTERVAL {CLICKHOUSE_TTL_DAYS} DAY
+    '''
+)
+
+get_genre_by_id_page_views_schema_v2 = (
+    f'''
+    (
+        user_id                 UUID,
+        genre_id_query_param    UUID,
+        visited_at              DateTime CODEC(Delta, ZSTD(1))
+    )
+    ENGINE = MergeTree()
+    PARTITION BY toYYYYMM(visited_at)
+    ORDER BY (genre_id_query_param, visited_at)
+    TTL visited_at + INTERVAL {CLICKHOUSE_TTL_DAYS} DAY
+    '''
+)
+
+get_person_by_id_page_views_schema_v2 = (
+    f'''
+    (
+        user_id                 UUID,
+        person_id_query_param   UUID,
+        visited_at              DateTime CODEC(Delta, ZSTD(1))
+    )
+    ENGINE = MergeTree()
+    PARTITION BY toYYYYMM(visited_at)
+    ORDER BY (person_id_query_param, visited_at)
+    TTL visited_at + INTERVAL {CLICKHOUSE_TTL_DAYS} DAY
+    '''
+)
+
+search_persons_by_keyword_page_views_schema_v2 = (
+    f'''
+    (
+        user_id                         UUID,
+        keyword_to_search_query_param   String CODEC(ZSTD(3)),
+        page_number_query_param         Int32 CODEC(T64, ZSTD(1)),
+        page_size_query_param           Int32 CODEC(T64, ZSTD(1)),
+        visited_at                      DateTime CODEC(Delta, ZSTD(1))
+    )
+    ENGINE = MergeTree()
+    PARTITION BY toYYYYMM(visited_at)
+    ORDER BY (visited_at, user_id)
+    TTL visited_at + INTERVAL {CLICKHOUSE_TTL_DAYS} DAY
+    '''
+)
+
+table_schemas_v2 = {
+    VIDEO_QUALITY_CHANGE_CLICKS: video_quality_change_clicks_schema_v2,
+    VIDEO_PAUSE_CLICKS: video_pause_clicks_schema_v2,
+    VIDEO_FULL_VIEWS: video_full_views_schema_v2,
+
+    GET_FILMS_PAGE_VIEWS: get_films_page_views_schema_v2,
+    GET_FILM_BY_ID_PAGE_VIEWS: get_film_by_id_page_views_schema_v2,
+    SEARCH_FILMS_BY_KEYWORD_PAGE_VIEWS: (
+        search_films_by_keyword_page_views_schema_v2
+    ),
+
+    GET_GENRES_PAGE_VIEWS: get_genres_page_views_schema_v2,
+    GET_GENRE_BY_ID_PAGE_VIEWS: get_genre_by_id_page_views_schema_v2,
+
+    GET_PERSON_BY_ID_PAGE_VIEWS: get_person_by_id_page_views_schema_v2,
+    SEARCH_PERSONS_BY_KEYWORD_PAGE_VIEWS: (
+        search_persons_by_keyword_page_views_schema_v2
+    ),
+}
+
+
+# Film Views Per Hour: views and unique viewers (HyperLogLog state)
+# of the film pages aggregated on insert into get_film_by_id_page_views
+create_film_views_hourly_table = (
+    f'''
+    CREATE TABLE IF NOT EXISTS {CLICKHOUSE_DATABASE_NAME}.{FILM_VIEWS_HOURLY}
+    (
+        film_id             UUID,
+        hour                DateTime,
+        views               AggregateFunction(count),
+        viewers             AggregateFunction(uniqHLL12, UUID)
+    )
+    ENGINE = AggregatingMergeTree()
+    PARTITION BY toYYYYMM(hour)
+    ORDER BY (film_id, hour)
+    TTL hour + INTERVAL {CLICKHOUSE_TTL_DAYS} DAY
+    '''
+)
+
+select_for_film_views_hourly_table = (
+    f'''
+    SELECT
+        film_id_query_param AS film_id,
+        toStartOfHour(visited_at) AS hour,
+        countState() AS views,
+        uniqHLL12State(user_id) AS viewers
+    FROM {CLICKHOUSE_DATABASE_NAME}.{GET_FILM_BY_ID_PAGE_VIEWS}
+    GROUP BY film_id, hour
+    '''
+)
+
+create_film_views_hourly_mv = (
+    f'''
+    CREATE MATERIALIZED VIEW IF NOT EXISTS
+    {CLICKHOUSE_DATABASE_NAME}.{FILM_VIEWS_HOURLY_MV}
+    TO {CLICKHOUSE_DATABASE_NAME}.{FILM_VIEWS_HOURLY}
+    AS {select_for_film_views_hourly_table}
+    '''
+)
+
+select_film_views_per_hour = (
+    f'''
+    SELECT
+        hour,
+        countMerge(views) AS views,
+        uniqHLL12Merge(viewers) AS unique_viewers
+    FROM {CLICKHOUSE_DATABASE_NAME}.{FILM_VIEWS_HOURLY}
+    WHERE film_id = {{film_id}}
+        AND hour BETWEEN {{since}} AND {{until}}
+    GROUP BY hour
+    ORDER BY hour
+    '''
+)
+
+select_top_films_by_views = (
+    f'''
+    SELECT
+        film_id,
+        countMerge(views) AS views,
+        uniqHLL12Merge(viewers) AS unique_viewers
+    FROM {CLICKHOUSE_DATABASE_NAME}.{FILM_VIEWS_HOURLY}
+    WHERE hour BETWEEN {{since}} AND {{until}}
+    GROUP BY film_id
+    ORDER BY views DESC
+    LIMIT {{limit}}
+    '''
+)
+
+# Full Views Per Hour: full views of all the films aggregated on insert
+# into clicks_on_video_full_views, replaced by the v2 below
+create_full_views_hourly_table = (
+    f'''
+    CREATE TABLE IF NOT EXISTS {CLICKHOUSE_DATABASE_NAME}.{FULL_VIEWS_HOURLY}
+    (
+        hour                DateTime,
+        full_views          AggregateFunction(count)
+    )
+    ENGINE = AggregatingMergeTree()
+    PARTITION BY toYYYYMM(hour)
+    ORDER BY hour
+    TTL hour + INTERVAL {CLICKHOUSE_TTL_DAYS} DAY
+    '''
+)
+
+select_for_full_views_hourly_table = (
+    f'''
+    SELECT
+        toStartOfHour({CLICK_EVENT_DATE}) AS hour,
+        countState() AS full_views
+    FROM {CLICKHOUSE_DATABASE_NAME}.{VIDEO_FULL_VIEWS}
+    GROUP BY hour
+    '''
+)
+
+create_full_views_hourly_mv = (
+    f'''
+    CREATE MATERIALIZED VIEW IF NOT EXISTS
+    {CLICKHOUSE_DATABASE_NAME}.{FULL_VIEWS_HOURLY_MV}
+    TO {CLICKHOUSE_DATABASE_NAME}.{FULL_VIEWS_HOURLY}
+    AS {select_for_full_views_hourly_table}
+    '''
+)
+
+# Full Views Per Hour v2: full views of every film aggregated on insert into
+# clicks_on_video_full_views, the completion rate of the film is the ratio
+# of them to the page views of the film in the same hour. The table is
+# rebuilt into it by migration 6, the full views of the click events of the
+# version 1 are counted under the nil film ID
+create_full_views_hourly_table_v2 = (
+    f'''
+    CREATE TABLE IF NOT EXISTS {CLICKHOUSE_DATABASE_NAME}.{FULL_VIEWS_HOURLY}
+    (
+        film_id             UUID,
+        hour                DateTime,
+        full_views          AggregateFunction(count)
+    )
+    ENGINE = AggregatingMergeTree()
+    PARTITION BY toYYYYMM(hour)
+    ORDER BY (film_id, hour)
+    TTL hour + INTERVAL {CLICKHOUSE_TTL_DAYS} DAY
+    '''
+)
+
+select_for_full_views_hourly_table_v2 = (
+    f'''
+    SELECT
+        film_id,
+        toStartOfHour({CLICK_EVENT_DATE}) AS hour,
+        countState() AS full_views
+    FROM {CLICKHOUSE_DATABASE_NAME}.{VIDEO_FULL_VIEWS}
+    GROUP BY film_id, hour
+    '''
+)
+
+create_full_views_hourly_mv_v2 = (
+    f'''
+    CREATE MATERIALIZED VIEW IF NOT EXISTS
+    {CLICKHOUSE_DATABASE_NAME}.{FULL_VIEWS_HOURLY_MV}
+    TO {CLICKHOUSE_DATABASE_NAME}.{FULL_VIEWS_HOURLY}
+    AS {select_for_full_views_hourly_table_v2}
+    '''
+)
+
+select_full_view_completion_rate_per_hour = (
+    f'''
+    SELECT
+        hour,
+        views,
+        full_views,
+        if(views = 0, 0, full_views / views) AS completion_rate
+    FROM
+    (
+        SELECT hour, countMerge(views) AS views
+        FROM {CLICKHOUSE_DATABASE_NAME}.{FILM_VIEWS_HOURLY}
+        WHERE film_id = {{film_id}}
+            AND hour BETWEEN {{since}} AND {{until}}
+        GROUP BY hour
+    ) AS film_views
+    FULL OUTER JOIN
+    (
+        SELECT hour, countMerge(full_views) AS full_views
+        FROM {CLICKHOUSE_DATABASE_NAME}.{FULL_VIEWS_HOURLY}
+        WHERE film_id = {{film_id}}
+            AND hour BETWEEN {{since}} AND {{until}}
+        GROUP BY hour
+    ) AS completed_views
+    USING hour
+    ORDER BY hour
+    '''
+)
+
+
+# Columns of the click tracking events enriched on ingest: the user (nil
+# UUID for anonymous users), the film and the server receive time in ms.
+# The bloom filter indexes let the rows of a user or a film be selected
+# without reading the whole partitions
+def add_click_event_enrichment_columns(table: str) -> str:
+    return (
+        f'''
+        ALTER TABLE {CLICKHOUSE_DATABASE_NAME}.{table}
+        ADD COLUMN IF NOT EXISTS user_id UUID,
+        ADD COLUMN IF NOT EXISTS film_id UUID,
+        ADD COLUMN IF NOT EXISTS received_at Int64 CODEC(Delta, ZSTD(1)),
+        ADD INDEX IF NOT EXISTS user_id_idx user_id
+            TYPE bloom_filter GRANULARITY 4,
+        ADD INDEX IF NOT EXISTS film_id_idx film_id
+            TYPE bloom_filter GRANULARITY 4
+        '''
+    )
+
+
+# Watch Sessions Table: one row per session of a viewer (the user or the
+# viewing session of an anonymous user) watching a film. The open sessions
+# are written as checkpoints replaced by the later rows of the session
+create_watch_sessions_table = (
+    f'''
+    CREATE TABLE IF NOT EXISTS {CLICKHOUSE_DATABASE_NAME}.{WATCH_SESSIONS}
+    (
+        session_id          UUID,
+        viewer_id           String,
+        user_id             UUID,
+        film_id             UUID,
+        started_at          Int64 CODEC(Delta, ZSTD(1)),
+        ended_at            Int64 CODEC(Delta, ZSTD(1)),
+        events              UInt32 CODEC(T64, ZSTD(1)),
+        pauses              UInt32 CODEC(T64, ZSTD(1)),
+        pause_time_ms       UInt64 CODEC(T64, ZSTD(1)),
+        quality_changes     UInt32 CODEC(T64, ZSTD(1)),
+        full_views          UInt32 CODEC(T64, ZSTD(1)),
+        is_closed           UInt8,
+        opened_at           DateTime,
+        updated_at          DateTime64(3)
+    )
+    ENGINE = ReplacingMergeTree(updated_at)
+    PARTITION BY toYYYYMM(opened_at)
+    ORDER BY (film_id, viewer_id, session_id)
+    TTL opened_at + INTERVAL {CLICKHOUSE_TTL_DAYS} DAY
+    '''
+)
+
+insert_into_watch_sessions_table = (
+    f'''
+    INSERT INTO {CLICKHOUSE_DATABASE_NAME}.{WATCH_SESSIONS}
+    (
+        session_id,
+        viewer_id,
+        user_id,
+        film_id,
+        started_at,
+        ended_at,
+        events,
+        pauses,
+        pause_time_ms,
+        quality_changes,
+        full_views,
+        is_closed,
+        opened_at,
+        updated_at
+    )
+    VALUES
+    '''
+)
+
+select_watch_session_stats_of_film = (
+    f'''
+    SELECT
+        count() AS sessions,
+        uniqExact(viewer_id) AS viewers,
+        avg(ended_at - started_at) / 1000 AS avg_duration_sec,
+        avg(pauses) AS avg_pauses,
+        avg(pause_time_ms) / 1000 AS avg_pause_time_sec,
+        avg(quality_changes) AS avg_quality_changes,
+        countIf(full_views > 0) / count() AS completion_rate
+    FROM {CLICKHOUSE_DATABASE_NAME}.{WATCH_SESSIONS} FINAL
+    WHERE film_id = {{film_id}}
+        AND started_at BETWEEN {{since}} AND {{until}}
+    '''
+)
+
+
+# Queries for rebuilding a table into a new schema
+def create_table(table: str, schema: str) -> str:
+    return (
+        f'''
+        CREATE TABLE IF NOT EXISTS {CLICKHOUSE_DATABASE_NAME}.{table}
+        {schema}
+        '''
+    )
+
+
+def create_table_like(table: str, like_table: str) -> str:
+    return (
+        f'''
+        CREATE TABLE IF NOT EXISTS {CLICKHOUSE_DATABASE_NAME}.{table}
+        AS {CLICKHOUSE_DATABASE_NAME}.{like_table}
+        '''
+    )
+
+
+def insert_into_table(table: str, columns: tuple[str, ...]) -> str:
+    return (
+        f'''
+        INSERT INTO {CLICKHOUSE_DATABASE_NAME}.{table}
+        ({', '.join(columns)})
+        VALUES
+        '''
+    )
+
+
+def fill_table(target_table: str, select_query: str) -> str:
+    return (
+        f'''
+        INSERT INTO {CLICKHOUSE_DATABASE_NAME}.{target_table}
+        {select_query}
+        '''
+    )
+
+
+def truncate_table(table: str) -> str:
+    return (
+        f'''
+        TRUNCATE TABLE IF EXISTS {CLICKHOUSE_DATABASE_NAME}.{table}
+        '''
+    )
+
+
+def copy_table(source_table: str, target_table: str) -> str:
+    return (
+        f'''
+        INSERT INTO {CLICKHOUSE_DATABASE_NAME}.{target_table}
+        SELECT *
+        FROM {CLICKHOUSE_DATABASE_NAME}.{source_table}
+        '''
+    )
+
+
+def exchange_tables(table: str, other_table: str) -> str:
+    return (
+        f'''
+        EXCHANGE TABLES {CLICKHOUSE_DATABASE_NAME}.{table}
+        AND {CLICKHOUSE_DATABASE_NAME}.{other_table}
+        '''
+    )
+
+
+def select_create_table_queries(tables: tuple[str, ...]) -> str:
+    names = ', '.join(f"'{table}'" for table in tables)
+    return (
+        f'''
+        SELECT name, create_table_query
+        FROM system.tables
+        WHERE database = '{CLICKHOUSE_DATABASE_NAME}' AND name IN ({names})
+        '''
+    )
+
+
+def drop_view(view: str) -> str:
+    return (
+        f'''
+        DROP VIEW IF EXISTS {CLICKHOUSE_DATABASE_NAME}.{view}
+        '''
+    )
+
+
+def drop_table(table: str) -> str:
+    return (
+        f'''
+        DROP TABLE IF EXISTS {CLICKHOUSE_DATABASE_NAME}.{table}
+        '''
+    )
+
+
+# Queries for replacing the replayed rows of a table partition by partition.
+# The replayed rows are selected by their time in ms, comparable with the
+# timestamps of the Kafka messages; the rows of the click events of the
+# version 1 have no receive time and are selected by the player timestamp
+CLICK_EVENT_TIME_MS = 'if(received_at = 0, timestamp, received_at)'
+PAGE_VIEW_TIME_MS = 'toUnixTimestamp(visited_at) * 1000'
+
+row_times_ms = {
+    VIDEO_QUALITY_CHANGE_CLICKS: CLICK_EVENT_TIME_MS,
+    VIDEO_PAUSE_CLICKS: CLICK_EVENT_TIME_MS,
+    VIDEO_FULL_VIEWS: CLICK_EVENT_TIME_MS,
+
+    GET_FILMS_PAGE_VIEWS: PAGE_VIEW_TIME_MS,
+    GET_FILM_BY_ID_PAGE_VIEWS: PAGE_VIEW_TIME_MS,
+    SEARCH_FILMS_BY_KEYWORD_PAGE_VIEWS: PAGE_VIEW_TIME_MS,
+
+    GET_GENRES_PAGE_VIEWS: PAGE_VIEW_TIME_MS,
+    GET_GENRE_BY_ID_PAGE_VIEWS: PAGE_VIEW_TIME_MS,
+
+    GET_PERSON_BY_ID_PAGE_VIEWS: PAGE_VIEW_TIME_MS,
+    SEARCH_PERSONS_BY_KEYWORD_PAGE_VIEWS: PAGE_VIEW_TIME_MS,
+}
+
+# Table -> (hourly table filled by a materialized view on insert into the
+# table, query aggregating the rows of the table into it)
+hourly_aggregate_tables = {
+    GET_FILM_BY_ID_PAGE_VIEWS: (
+        FILM_VIEWS_HOURLY,
+        select_for_film_views_hourly_table,
+    ),
+    VIDEO_FULL_VIEWS: (
+        FULL_VIEWS_HOURLY,
+        select_for_full_views_hourly_table_v2,
+    ),
+}
+
+
+def select_partitions(table: str, where: str) -> str:
+    return (
+        f'''
+        SELECT DISTINCT _partition_id AS partition_id
+        FROM {CLICKHOUSE_DATABASE_NAME}.{table}
+        WHERE {where}
+        '''
+    )
+
+
+def copy_partition_rows(
+    source_table: str,
+    target_table: str,
+    partition_id: str,
+    where: str,
+) -> str:
+    return (
+        f'''
+        INSERT INTO {CLICKHOUSE_DATABASE_NAME}.{target_table}
+        SELECT *
+        FROM {CLICKHOUSE_DATABASE_NAME}.{source_table}
+        WHERE _partition_id = '{partition_id}' AND ({where})
+        '''
+    )
+
+
+def fill_hourly_partition(
+    target_table: str,
+    select_query: str,
+    partition_id: str,
+    where: str,
+) -> str:
+    # The hourly tables are partitioned by toYYYYMM(hour)
+    return (
+        f'''
+        INSERT INTO {CLICKHOUSE_DATABASE_NAME}.{target_table}
+        SELECT *
+        FROM ({select_query})
+        WHERE toYYYYMM(hour) = {partition_id} AND ({where})
+        '''
+    )
+
+
+def delete_partition_rows(table: str, partition_id: str, where: str) -> str:
+    return (
+        f'''
+        ALTER TABLE {CLICKHOUSE_DATABASE_NAME}.{table}
+        DELETE IN PARTITION ID '{partition_id}'
+        WHERE {where}
+        '''
+    )
+
+
+def attach_partition(
+    table: str,
+    partition_id: str,
+    source_table: str,
+) -> str:
+    return (
+        f'''
+        ALTER TABLE {CLICKHOUSE_DATABASE_NAME}.{table}
+        ATTACH PARTITION ID '{partition_id}'
+        FROM {CLICKHOUSE_DATABASE_NAME}.{source_table}
+        '''
+    )
+
+
+def select_unfinished_mutations(table: str) -> str:
+    return (
+        f'''
+        SELECT
+            countIf(NOT is_done) AS unfinished,
+            anyIf(latest_fail_reason, NOT is_done) AS fail_reason
+        FROM system.mutations
+        WHERE database = '{CLICKHOUSE_DATABASE_NAME}' AND table = '{table}'
+        '''
+    )
@@ -0,0 +1,490 @@
+'''
+Module has the replay mode of the ETL rebuilding the tables of a topic from
+Kafka, e.g. after a change of their decoders or columns.
+
+The messages of the given offset or time range are consumed by a separate
+consumer group from manually assigned partitions, so the live consumers are
+not rebalanced. They are decoded into the shadow tables with the structure
+of the live ones in very large batches.
+
+Without the end of the range the replay catches up with the offsets
+committed by the live consumer group. When the replay is done, the rows of
+the live tables within the time window replayed in every partition of the
+topic are replaced with the replayed ones partition by partition: they are
+deleted by a mutation and the replayed rows are attached to the partition.
+The other rows, i.e. the older ones and the ones inserted by the live
+consumers past the replayed offsets, are never copied or rewritten, so the
+live consumers keep inserting while the rows are replaced. The rows of the
+window are not visible between the mutation and the attach. The hourly
+aggregate tables are rebuilt in the same way up to the hour the window
+ends at, the later hours are kept updated by their materialized views.
+'''
+from __future__ import annotations
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+from aiokafka import AIOKafkaConsumer
+from aiokafka.structs import TopicPartition
+
+import queries
+import settings
+from decoders import insert_query_columns
+from routing import build_routing_table
+from utils import insert_rows
+
+
+if TYPE_CHECKING:
+    from aiochclient import ChClient
+
+    from routing import RoutingTable
+
+
+@dataclass
+class ShadowTable:
+    table: str
+    shadow_table: str
+    insert_query: str
+    rows: list = field(default_factory=list)
+    inserted: int = 0
+
+
+async def flush_shadow_table(
+    clickhouse_client: ChClient,
+    shadow_table: ShadowTable,
+):
+    if not shadow_table.rows:
+        return
+    await insert_rows(
+        clickhouse_client,
+        shadow_table.insert_query,
+        shadow_table.rows,
+    )
+    shadow_table.inserted += len(shadow_table.rows)
+    shadow_table.rows = []
+
+
+async def get_offset_range(
+    consumer: AIOKafkaConsumer,
+    partitions: list[TopicPartition],
+    start_offset: int | None,
+    since: datetime | None,
+    until: datetime | None,
+) -> tuple[dict[TopicPartition, int], dict[TopicPartition, int] | None]:
+    '''
+    Return the first offset to replay and the offset to stop at for every
+    partition, the end is None when the replay catches up with the live
+    consumer group
+    '''
+    end_offsets = await consumer.end_offsets(partitions)
+
+    if since is not None:
+        found = await consumer.offsets_for_times(
+            {tp: int(since.timestamp() * 1000) for tp in partitions}
+        )
+        # None means there are no messages since the time
+        start = {
+            tp: found[tp].offset if found[tp] else end_offsets[tp]
+            for tp in partitions
+        }
+    elif start_offset is not None:
+        start = {tp: start_offset for tp in partitions}
+    else:
+        start = await consumer.beginning_offsets(partitions)
+
+    if until is None:
+        return start, None
+    found = await consumer.offsets_for_times(
+        {tp: int(until.timestamp() * 1000) for tp in partitions}
+    )
+    return start, {
+        tp: found[tp].offset if found[tp] else end_offsets[tp]
+        for tp in partitions
+    }
+
+
+async def get_live_offsets(
+    live_consumer: AIOKafkaConsumer,
+    partitions: list[TopicPartition],
+) -> dict[TopicPartition, int]:
+    '''
+    Return the offsets committed by the live consumer group, the ones of
+    the partitions without commits are the end offsets
+    '''
+    end_offsets = await live_consumer.end_offsets(partitions)
+    offsets = {}
+    for tp in partitions:
+        committed = await live_consumer.committed(tp)
+        offsets[tp] = committed if committed is not None else end_offsets[tp]
+    return offsets
+
+
+async def get_message_timestamps(
+    consumer: AIOKafkaConsumer,
+    offsets: dict[TopicPartition, int],
+) -> list[int]:
+    '''
+    Return the timestamps of the messages at the offsets, the partitions
+    without a message at the offset yet are skipped
+    '''
+    end_offsets = await consumer.end_offsets(list(offsets))
+    timestamps = []
+    for tp, offset in offsets.items():
+        if offset >= end_offsets[tp]:
+            continue
+        consumer.seek(tp, offset)
+        consumer.resume(tp)
+        messages = []
+        while not messages:
+            batches = await consumer.getmany(
+                tp,
+                timeout_ms=1000,
+                max_records=1,
+            )
+            messages = batches.get(tp, [])
+        consumer.pause(tp)
+        timestamps.append(messages[0].timestamp)
+    return timestamps
+
+
+async def wait_for_mutations(clickhouse_client: ChClient, table: str):
+    '''
+    Wait until the mutations of the table are done. The failed mutations
+    are retried by ClickHouse, the rows are attached only after the old
+    ones are deleted
+    '''
+    while True:
+        record = await clickhouse_client.fetchrow(
+            queries.select_unfinished_mutations(table)
+        )
+        if not record['unfinished']:
+            return
+        if record['fail_reason']:
+            print(f"Mutation of {table} is retried: {record['fail_reason']}")
+        await asyncio.sleep(1)
+
+
+async def swap_partition_rows(
+    clickhouse_client: ChClient,
+    table: str,
+    partition_id: str,
+    where: str,
+    partition_table: str,
+):
+    '''
+    Delete the rows of the partition matching the condition and attach the
+    rows of the partition table in their place. The other rows of the
+    partition are not touched, so the rows the live consumers insert
+    meanwhile are kept: the mutation deletes only from the parts existing
+    when it is created, and the attached parts are added to the partition
+    '''
+    await clickhouse_client.execute(
+        queries.delete_partition_rows(table, partition_id, where)
+    )
+    await wait_for_mutations(clickhouse_client, table)
+    await clickhouse_client.execute(
+        queries.attach_partition(table, partition_id, partition_table)
+    )
+
+
+async def replace_replayed_partitions(
+    clickhouse_client: ChClient,
+    shadow_table: ShadowTable,
+    window_start: int,
+    window_end: int,
+) -> list[str]:
+    '''
+    Replace the rows of the live table with the time in ms within the window
+    with the replayed ones, return the IDs of the replaced partitions
+    '''
+    row_time = queries.row_times_ms[shadow_table.table]
+    in_window = f'{row_time} >= {window_start} AND {row_time} < {window_end}'
+    partitions = set()
+    for table in (shadow_table.table, shadow_table.shadow_table):
+        for record in await clickhouse_client.fetch(
+            queries.select_partitions(table, in_window)
+        ):
+            partitions.add(record['partition_id'])
+
+    partition_table = f'{shadow_table.table}__replay_partition'
+    await clickhouse_client.execute(queries.drop_table(partition_table))
+    await clickhouse_client.execute(
+        queries.create_table_like(partition_table, shadow_table.table)
+    )
+    for partition_id in sorted(partitions):
+        await clickhouse_client.execute(
+            queries.truncate_table(partition_table)
+        )
+        # The replayed rows outside the window are already in the live
+        # table, or are not consumed by the live consumers yet
+        await clickhouse_client.execute(
+            queries.copy_partition_rows(
+                shadow_table.shadow_table,
+                partition_table,
+                partition_id,
+                in_window,
+            )
+        )
+        await swap_partition_rows(
+            clickhouse_client,
+            shadow_table.table,
+            partition_id,
+            in_window,
+            partition_table,
+        )
+    await clickhouse_client.execute(queries.drop_table(partition_table))
+    return sorted(partitions)
+
+
+async def rebuild_hourly_partitions(
+    clickhouse_client: ChClient,
+    table: str,
+    partitions: list[str],
+    window_end: int,
+):
+    '''
+    Aggregate the replaced partitions of the table into its hourly table,
+    the rows attached to the replaced partitions do not trigger the
+    materialized view
+    '''
+    if table not in queries.hourly_aggregate_tables:
+        return
+    hourly_table, select_query = queries.hourly_aggregate_tables[table]
+
+    # The hours since the end of the window are still updated by the
+    # materialized view on the inserts of the live consumers
+    rebuilt_hours = (
+        f'hour < toStartOfHour(toDateTime(intDiv({window_end}, 1000)))'
+    )
+    partition_table = f'{hourly_table}__replay_partition'
+    await clickhouse_client.execute(queries.drop_table(partition_table))
+    await clickhouse_client.execute(
+        queries.create_table_like(partition_table, hourly_table)
+    )
+    for partition_id in partitions:
+        await clickhouse_client.execute(
+            queries.truncate_table(partition_table)
+        )
+        await clickhouse_client.execute(
+            queries.fill_hourly_partition(
+                partition_table,
+                select_query,
+                partition_id,
+                rebuilt_hours,
+            )
+        )
+        await swap_partition_rows(
+            clickhouse_client,
+            hourly_table,
+            partition_id,
+            rebuilt_hours,
+            partition_table,
+        )
+    await clickhouse_client.execute(queries.drop_table(partition_table))
+    print(f"Table {hourly_table} is rebuilt in partitions {partitions}")
+
+
+async def replay_range(
+    consumer: AIOKafkaConsumer,
+    clickhouse_client: ChClient,
+    shadow_tables: dict[str, ShadowTable],
+    routing_table: RoutingTable,
+    start: dict[TopicPartition, int],
+    end: dict[TopicPartition, int],
+) -> tuple[int, int]:
+    '''
+    Decode the messages of the range into the shadow tables, return the
+    number of the skipped messages that can not be routed or decoded (they
+    are already sent to the dead letter topics by the live consumers) and
+    the number of the replayed ones
+    '''
+    remaining = []
+    for tp in start:
+        if start[tp] < end[tp]:
+            consumer.seek(tp, start[tp])
+            remaining.append(tp)
+    consumer.resume(*remaining)
+
+    replayed = skipped = 0
+    while remaining:
+        batches = await consumer.getmany(
+            *remaining,
+            timeout_ms=1000,
+            max_records=settings.REPLAY_FETCH_MAX_RECORDS,
+        )
+        for tp, messages in batches.items():
+            for message in messages:
+                if message.offset >= end[tp]:
+                    break
+                sink = routing_table.route(message.topic, message.key)
+                if sink is None:
+                    skipped += 1
+                    continue
+                try:
+                    row = sink.decode_row(message.value, message.headers)
+                except Exception:
+                    skipped += 1
+                    continue
+
+                shadow_table = shadow_tables[sink.table]
+                shadow_table.rows.append(row)
+                replayed += 1
+                if len(shadow_table.rows) >= settings.REPLAY_BATCH_MAX_ROWS:
+                    await flush_shadow_table(clickhouse_client, shadow_table)
+
+        for tp in list(remaining):
+            if await consumer.position(tp) >= end[tp]:
+                consumer.pause(tp)
+                remaining.remove(tp)
+
+    return skipped, replayed
+
+
+async def replay_topic(
+    clickhouse_client: ChClient,
+    topic: str,
+    start_offset: int | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+):
+    routing_table = build_routing_table()
+    shadow_tables = {
+        sink.table: ShadowTable(
+            table=sink.table,
+            shadow_table=f'{sink.table}__replay',
+            insert_query=queries.insert_into_table(
+                f'{sink.table}__replay',
+                insert_query_columns(sink.insert_query),
+            ),
+        )
+        for (sink_topic, _), sink in routing_table.items()
+        if sink_topic == topic
+    }
+    if not shadow_tables:
+        raise ValueError(f"Topic {topic} is not routed to any table")
+
+    # The shadow tables left by an interrupted replay are recreated
+    for shadow_table in shadow_tables.values():
+        await clickhouse_client.execute(
+            queries.drop_table(shadow_table.shadow_table)
+        )
+        await clickhouse_client.execute(
+            queries.create_table_like(
+                shadow_table.shadow_table,
+                shadow_table.table,
+            )
+        )
+
+    consumer = AIOKafkaConsumer(
+        bootstrap_servers=settings.BOOTSTRAP_SERVERS,
+        group_id=settings.REPLAY_GROUP_ID,
+        enable_auto_commit=False,
+        auto_offset_reset='earliest',
+    )
+    # Only reads the offsets committed by the live consumer group, it does
+    # not join the group
+    live_consumer = AIOKafkaConsumer(
+        bootstrap_servers=settings.BOOTSTRAP_SERVERS,
+        group_id=settings.KAFKA_GROUP_ID,
+        enable_auto_commit=False,
+    )
+    await consumer.start()
+    await live_consumer.start()
+    try:
+        await consumer.topics()
+        partitions = [
+            TopicPartition(topic, partition)
+            for partition in sorted(consumer.partitions_for_topic(topic) or ())
+        ]
+        if not partitions:
+            raise ValueError(f"Topic {topic} does not exist")
+        consumer.assign(partitions)
+
+        # Time the end offsets are taken at, the messages sent later are not
+        # replayed
+        offsets_taken_at = int(time.time() * 1000)
+        start, end = await get_offset_range(
+            consumer,
+            partitions,
+            start_offset,
+            since,
+            until,
+        )
+        # The time window replayed in every partition starts at the latest
+        # of the first replayed messages of the partitions
+        if since is not None:
+            window_start = int(since.timestamp() * 1000)
+        else:
+            window_start = max(
+                await get_message_timestamps(consumer, start),
+                default=None,
+            )
+
+        skipped = replayed = 0
+        while True:
+            if end is None:
+                offsets_taken_at = int(time.time() * 1000)
+                range_end = await get_live_offsets(live_consumer, partitions)
+            else:
+                range_end = end
+            # Catch up with the live consumers until the rest of the messages
+            # is small enough to be replayed right before the replacement
+            last_pass = end is not None or sum(
+                max(range_end[tp] - start[tp], 0) for tp in partitions
+            ) <= settings.REPLAY_CATCH_UP_MAX_LAG
+
+            print(f"Replaying {topic} from {start} to {range_end}")
+            range_skipped, range_replayed = await replay_range(
+                consumer,
+                clickhouse_client,
+                shadow_tables,
+                routing_table,
+                start,
+                range_end,
+            )
+            skipped += range_skipped
+            replayed += range_replayed
+            start = {tp: max(start[tp], range_end[tp]) for tp in partitions}
+            if last_pass:
+                break
+
+        # ... and ends at the earliest of the first messages not replayed
+        window_end = min(
+            offsets_taken_at,
+            *await get_message_timestamps(consumer, range_end),
+        )
+        if until is not None:
+            window_end = min(window_end, int(until.timestamp() * 1000))
+
+        for shadow_table in shadow_tables.values():
+            await flush_shadow_table(clickhouse_client, shadow_table)
+            if window_start is not None and window_start < window_end:
+                partitions_replaced = await replace_replayed_partitions(
+                    clickhouse_client,
+                    shadow_table,
+                    window_start,
+                    window_end,
+                )
+                await rebuild_hourly_partitions(
+                    clickhouse_client,
+                    shadow_table.table,
+                    partitions_replaced,
+                    window_end,
+                )
+                print(
+                    f"Table {shadow_table.table} is replaced in partitions "
+                    f"{partitions_replaced} with the replayed rows from "
+                    f"{window_start} to {window_end} ms"
+                )
+            await clickhouse_client.execute(
+                queries.drop_table(shadow_table.shadow_table)
+            )
+        print(
+            f"Replay of {topic} is done: {replayed} messages replayed, "
+            f"{skipped} skipped"
+        )
+    finally:
+        await consumer.stop()
+        await live_consumer.stop()
@@ -0,0 +1,275 @@
+'''
+Module has the routing table that maps Kafka messages to ClickHouse sinks
+'''
+from __future__ import annotations
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Iterable, Optional, Union
+from uuid import UUID
+
+import queries
+import settings
+from click_codecs import (
+    FULL_VIEW_V1,
+    FULL_VIEW_V2,
+    PAUSE_V1,
+    PAUSE_V2,
+    QUALITY_CHANGE_V1,
+    QUALITY_CHANGE_V2,
+)
+from decoders import PageViewDecoder, VideoEventDecoder, insert_query_columns
+from flush_policy import FlushPolicy, FlushReason, FlushStats
+
+
+if TYPE_CHECKING:
+    from aiokafka.structs import TopicPartition
+
+
+@dataclass
+class Sink:
+    '''
+    ClickHouse table with its insert query, row decoder and the buffer
+    accumulating rows for the batch insert. The sinks of the rows derived
+    from many messages, e.g. the watch sessions, have no decoder
+    '''
+    table: str
+    insert_query: str
+    decode_row: Optional[Union[PageViewDecoder, VideoEventDecoder]]
+    policy: FlushPolicy
+    buffer: list = field(default_factory=list)
+    buffer_bytes: int = 0
+    # (partition, offset) of the messages the buffered rows are decoded from
+    buffer_offsets: list = field(default_factory=list)
+    # Monotonic time the oldest buffered row was appended at
+    first_row_at: float = 0.0
+    stats: FlushStats = field(default_factory=FlushStats)
+    # Serializes the flushes made by the consumer loop and the linger timer
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    def append(
+        self,
+        row: tuple,
+        size_bytes: int,
+        tp: Optional[TopicPartition] = None,
+        offset: Optional[int] = None,
+        offsets: Iterable[tuple[TopicPartition, int]] = (),
+    ):
+        '''
+        Append the row decoded from the message at the offset or built from
+        the messages at the offsets
+        '''
+        if not self.buffer:
+            self.first_row_at = time.monotonic()
+        self.buffer.append(row)
+        self.buffer_bytes += size_bytes
+        if tp is not None:
+            self.buffer_offsets.append((tp, offset))
+        self.buffer_offsets.extend(offsets)
+
+    def reason_to_flush(self) -> Optional[FlushReason]:
+        return self.policy.reason_to_flush(
+            len(self.buffer),
+            self.buffer_bytes,
+            time.monotonic() - self.first_row_at,
+        )
+
+    def take_batch(self) -> tuple[list, int, list]:
+        '''
+        Detach the buffered rows, so the consumer can keep appending
+        while the batch is being inserted
+        '''
+        batch = self.buffer, self.buffer_bytes, self.buffer_offsets
+        self.buffer = []
+        self.buffer_bytes = 0
+        self.buffer_offsets = []
+        return batch
+
+
+# Fields added to the click tracking events on ingest since the schema
+# version 2, the events of the version 1 are inserted with the defaults
+CLICK_EVENT_ENRICHMENT_FIELDS = {
+    'user_id': UUID,
+    'film_id': UUID,
+    'received_at': int,
+}
+CLICK_EVENT_ENRICHMENT_DEFAULTS = {
+    'user_id': str(UUID(int=0)),
+    'film_id': str(UUID(int=0)),
+    'received_at': 0,
+}
+
+# (topic, message key) -> (table, insert query, row decoder with the types
+# of the fields).
+# Click tracking messages are keyed by the user or the viewing session for
+# partitioning, so their topics are routed regardless of the key (None).
+ROUTES = {
+    # Tracking clicks on the video
+    (settings.ClickTrackingTopics.QUALITY_CHANGE_CLICK.value, None): (
+        queries.VIDEO_QUALITY_CHANGE_CLICKS,
+        queries.insert_into_video_quality_change_clicks_table,
+        VideoEventDecoder(
+            {
+                'quality_before': str,
+                'quality_after': str,
+                'changed_at': float,
+                'timestamp': int,
+                **CLICK_EVENT_ENRICHMENT_FIELDS,
+            },
+            binary_schemas=[QUALITY_CHANGE_V1, QUALITY_CHANGE_V2],
+            defaults=CLICK_EVENT_ENRICHMENT_DEFAULTS,
+        ),
+    ),
+    (settings.ClickTrackingTopics.PAUSE_CLICK.value, None): (
+        queries.VIDEO_PAUSE_CLICKS,
+        queries.insert_into_video_pause_clicks_table,
+        VideoEventDecoder(
+            {
+                'pause_at': float,
+                'timestamp': int,
+                **CLICK_EVENT_ENRICHMENT_FIELDS,
+            },
+            binary_schemas=[PAUSE_V1, PAUSE_V2],
+            defaults=CLICK_EVENT_ENRICHMENT_DEFAULTS,
+        ),
+    ),
+    (settings.ClickTrackingTopics.FULL_VIEW.value, None): (
+        queries.VIDEO_FULL_VIEWS,
+        queries.insert_into_video_full_views_table,
+        VideoEventDecoder(
+            {
+                'timestamp': int,
+                **CLICK_EVENT_ENRICHMENT_FIELDS,
+            },
+            binary_schemas=[FULL_VIEW_V1, FULL_VIEW_V2],
+            defaults=CLICK_EVENT_ENRICHMENT_DEFAULTS,
+        ),
+    ),
+
+    # Tracking Async API Service page views
+    (
+        settings.AsyncAPITopics.FILM_TOPIC.value,
+        settings.FilmTopicPartitions.GET_FILMS.value,
+    ): (
+        queries.GET_FILMS_PAGE_VIEWS,
+        queries.insert_into_get_films_page_views_table,
+        PageViewDecoder({
+            'genre': str,
+            'sort': str,
+            'page_number': int,
+            'page_size': int,
+        }),
+    ),
+    (
+        settings.AsyncAPITopics.FILM_TOPIC.value,
+        settings.FilmTopicPartitions.GET_FILM_BY_ID.value,
+    ): (
+        queries.GET_FILM_BY_ID_PAGE_VIEWS,
+        queries.insert_into_get_film_by_id_page_views_table,
+        PageViewDecoder({'film_id': UUID}),
+    ),
+    (
+        settings.AsyncAPITopics.FILM_TOPIC.value,
+        settings.FilmTopicPartitions.SEARCH_FILMS_BY_KEYWORD.value,
+    ): (
+        queries.SEARCH_FILMS_BY_KEYWORD_PAGE_VIEWS,
+        queries.insert_into_search_films_by_keyword_page_views_table,
+        PageViewDecoder({
+            'keyword_to_search': str,
+            'genre': str,
+            'sort': str,
+            'page_number': int,
+            'page_size': int,
+        }),
+    ),
+    (
+        settings.AsyncAPITopics.GENRE_TOPIC.value,
+        settings.GenreTopicPartitions.GET_GENRES.value,
+    ): (
+        queries.GET_GENRES_PAGE_VIEWS,
+        queries.insert_into_get_genres_page_views_table,
+        PageViewDecoder({'page_number': int, 'page_size': int}),
+    ),
+    (
+        settings.AsyncAPITopics.GENRE_TOPIC.value,
+        settings.GenreTopicPartitions.GET_GENRE_BY_ID.value,
+    ): (
+        queries.GET_GENRE_BY_ID_PAGE_VIEWS,
+        queries.insert_into_get_genre_by_id_page_views_table,
+        PageViewDecoder({'genre_id': UUID}),
+    ),
+    (
+        settings.AsyncAPITopics.PERSON_TOPIC.value,
+        settings.PersonTopicPartitions.GET_PERSON_BY_ID.value,
+    ): (
+        queries.GET_PERSON_BY_ID_PAGE_VIEWS,
+        queries.insert_into_get_person_by_id_page_views_table,
+        PageViewDecoder({'person_id': UUID}),
+    ),
+    (
+        settings.AsyncAPITopics.PERSON_TOPIC.value,
+        settings.PersonTopicPartitions.SEARCH_PERSONS_BY_KEYWORD.value,
+    ): (
+        queries.SEARCH_PERSONS_BY_KEYWORD_PAGE_VIEWS,
+        queries.insert_into_search_persons_by_keyword_page_views_table,
+        PageViewDecoder({
+            'keyword_to_search': str,
+            'page_number': int,
+            'page_size': int,
+        }),
+    ),
+}
+
+
+class RoutingTable(dict):
+    '''
+    Dispatch table keyed by the topic and the raw message key, so a message
+    is routed with a single dict lookup and its key is never decoded.
+    The key is ignored for the topics routed regardless of it
+    '''
+
+    def __init__(self, routes: dict[tuple[str, Optional[bytes]], Sink]):
+        super().__init__(routes)
+        self.topics_routed_by_key = {
+            topic for topic, key in routes if key is not None
+        }
+
+    def route(self, topic: str, key: Optional[bytes]) -> Optional[Sink]:
+        if topic not in self.topics_routed_by_key:
+            key = None
+        return self.get((topic, key))
+
+
+def build_routing_table() -> RoutingTable:
+    '''
+    Build the routing table, the columns of every decoder and its binary
+    schemas are checked against the insert query once here instead of for
+    every message
+    '''
+    routes = {}
+    for (topic, key), (table, insert_query, decode_row) in ROUTES.items():
+        if decode_row.columns != insert_query_columns(insert_query):
+            raise ValueError(
+                f"Columns {decode_row.columns} of the {topic} decoder "
+                f"do not match the columns of the {table} table"
+            )
+        for schema in getattr(decode_row, 'binary_schemas', {}).values():
+            missing_columns = set(decode_row.columns) - set(schema.fields)
+            if (
+                not set(schema.fields) <= set(decode_row.columns)
+                or not missing_columns <= set(decode_row.defaults)
+            ):
+                raise ValueError(
+                    f"Fields {schema.fields} of the binary schema "
+                    f"{schema.schema_id} do not match the columns "
+                    f"of the {table} table"
+                )
+        routes[
+            (topic, key.encode("utf-8") if key is not None else None)
+        ] = Sink(
+            table=table,
+            insert_query=insert_query,
+            decode_row=decode_row,
+            policy=FlushPolicy.for_table(table),
+        )
+    return RoutingTable(routes)
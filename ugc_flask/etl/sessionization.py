@@ -0,0 +1,261 @@
+'''
+Module has the sessionization of the click tracking events into watch
+sessions.
+
+The events of a viewer (the message key: the user or, for anonymous users,
+the viewing session) and a film belong to one session while they are less
+than the inactivity gap apart by their timestamps. A session is closed when
+no events of it are consumed for the inactivity gap. The events of one
+viewer come from the same partition of every click topic, but the topics
+are consumed independently, so the events of a session are ordered by
+their timestamps when the row is built.
+
+The sessionization requires the click topics to be co-partitioned: they
+must have the same number of partitions, and the same partitions of all
+of them must be assigned to one consumer, which the range assignor does.
+Otherwise the events of a viewer are split between the consumers, and
+every consumer writes its own partial session.
+
+The open sessions are written as checkpoints into the ReplacingMergeTree
+table and replaced by the later rows of the same session. The offsets of
+the events are committed only after the row of their session is inserted,
+so the commits lag behind by up to the checkpoint interval, and after a
+crash the events since the last inserted checkpoint are consumed again and
+continue as a new session. The sessions of the revoked partitions are
+closed, the consumer the partitions are assigned to continues them as new
+sessions
+'''
+from __future__ import annotations
+import bisect
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Iterable
+from uuid import UUID, uuid4
+
+import queries
+import settings
+from flush_policy import FlushPolicy
+from routing import Sink
+
+
+if TYPE_CHECKING:
+    from aiokafka import AIOKafkaConsumer
+    from aiokafka.structs import TopicPartition
+
+    from routing import RoutingTable
+
+
+PAUSE = 'pause'
+QUALITY_CHANGE = 'quality_change'
+FULL_VIEW = 'full_view'
+
+# Click tracking table -> kind of its events
+EVENT_KINDS = {
+    queries.VIDEO_PAUSE_CLICKS: PAUSE,
+    queries.VIDEO_QUALITY_CHANGE_CLICKS: QUALITY_CHANGE,
+    queries.VIDEO_FULL_VIEWS: FULL_VIEW,
+}
+
+CLICK_TOPICS = tuple(topic.value for topic in settings.ClickTrackingTopics)
+
+# Approximate size of a session row for the flush policy
+SESSION_ROW_SIZE_BYTES = 128
+
+
+@dataclass
+class WatchSession:
+    viewer_id: str
+    user_id: UUID
+    film_id: UUID
+    session_id: UUID = field(default_factory=uuid4)
+    opened_at: datetime = field(
+        default_factory=lambda: datetime.now(timezone.utc).replace(
+            microsecond=0
+        )
+    )
+    # (timestamp, kind) of the events
+    events: list = field(default_factory=list)
+    partitions: set = field(default_factory=set)
+    # (partition, offset) of the events that are not in an inserted row yet
+    offsets: list = field(default_factory=list)
+    # Monotonic time the last event of the session was consumed at
+    last_consumed_at: float = 0.0
+    changed: bool = False
+
+    @property
+    def started_at(self) -> int:
+        return self.events[0][0]
+
+    @property
+    def ended_at(self) -> int:
+        return self.events[-1][0]
+
+    def add(
+        self,
+        timestamp: int,
+        kind: str,
+        tp: TopicPartition,
+        offset: int,
+    ):
+        # Events come almost in order, so the insertion is cheap
+        bisect.insort(self.events, (timestamp, kind))
+        self.partitions.add(tp)
+        self.offsets.append((tp, offset))
+        self.last_consumed_at = time.monotonic()
+        self.changed = True
+
+    def to_row(self, is_closed: bool) -> tuple:
+        '''
+        Build the row of the session, the pause time is the time from
+        every pause to the next event of the session
+        '''
+        counts = {PAUSE: 0, QUALITY_CHANGE: 0, FULL_VIEW: 0}
+        pause_time_ms = 0
+        for index, (timestamp, kind) in enumerate(self.events):
+            counts[kind] += 1
+            if kind == PAUSE and index + 1 < len(self.events):
+                pause_time_ms += self.events[index + 1][0] - timestamp
+
+        return (
+            self.session_id,
+            self.viewer_id,
+            self.user_id,
+            self.film_id,
+            self.started_at,
+            self.ended_at,
+            len(self.events),
+            counts[PAUSE],
+            pause_time_ms,
+            counts[QUALITY_CHANGE],
+            counts[FULL_VIEW],
+            int(is_closed),
+            self.opened_at,
+            datetime.now(timezone.utc),
+        )
+
+
+class Sessionizer:
+    '''
+    Groups the rows decoded from the click tracking messages into watch
+    sessions and appends the session rows to the watch sessions sink
+    '''
+
+    def __init__(self, routing_table: RoutingTable):
+        self.sink = Sink(
+            table=queries.WATCH_SESSIONS,
+            insert_query=queries.insert_into_watch_sessions_table,
+            decode_row=None,
+            policy=FlushPolicy.for_table(queries.WATCH_SESSIONS),
+        )
+        self.gap_ms = int(settings.SESSION_INACTIVITY_GAP_SEC * 1000)
+        self.sessions: dict[tuple[str, UUID], WatchSession] = {}
+        self.checkpointed_at = time.monotonic()
+        # Table -> indexes of the timestamp, the user and the film columns
+        self._columns = {
+            sink.table: (
+                sink.decode_row.columns.index('timestamp'),
+                sink.decode_row.columns.index('user_id'),
+                sink.decode_row.columns.index('film_id'),
+            )
+            for sink in routing_table.values()
+            if sink.table in EVENT_KINDS
+        }
+
+    def add(
+        self,
+        table: str,
+        row: tuple,
+        key: bytes | None,
+        tp: TopicPartition,
+        offset: int,
+    ) -> bool:
+        '''
+        Add the event to the session of its viewer and film, return whether
+        the event is added, so its offset waits for the session row
+        '''
+        columns = self._columns.get(table)
+        # The messages without a key can not be attributed to a viewer
+        if columns is None or key is None:
+            return False
+
+        timestamp_index, user_id_index, film_id_index = columns
+        timestamp = row[timestamp_index]
+        viewer_id = key.decode('utf-8', errors='replace')
+        session_key = (viewer_id, row[film_id_index])
+
+        session = self.sessions.get(session_key)
+        if session is not None and not (
+            session.started_at - self.gap_ms
+            <= timestamp
+            <= session.ended_at + self.gap_ms
+        ):
+            self._emit(session, is_closed=True)
+            session = None
+        if session is None:
+            session = self.sessions[session_key] = WatchSession(
+                viewer_id=viewer_id,
+                user_id=row[user_id_index],
+                film_id=row[film_id_index],
+            )
+        session.add(timestamp, EVENT_KINDS[table], tp, offset)
+        return True
+
+    def _emit(self, session: WatchSession, is_closed: bool):
+        self.sink.append(
+            session.to_row(is_closed),
+            SESSION_ROW_SIZE_BYTES,
+            offsets=session.offsets,
+        )
+        session.offsets = []
+        session.changed = False
+        if is_closed:
+            del self.sessions[(session.viewer_id, session.film_id)]
+
+    def tick(self):
+        '''
+        Close the sessions without events for the inactivity gap and write
+        the checkpoints of the changed open sessions once in the interval
+        '''
+        now = time.monotonic()
+        checkpoint = (
+            now - self.checkpointed_at
+            >= settings.SESSION_CHECKPOINT_INTERVAL_SEC
+        )
+        if checkpoint:
+            self.checkpointed_at = now
+
+        for session in list(self.sessions.values()):
+            if (
+                now - session.last_consumed_at
+                >= settings.SESSION_INACTIVITY_GAP_SEC
+            ):
+                self._emit(session, is_closed=True)
+            elif checkpoint and session.changed:
+                self._emit(session, is_closed=False)
+
+    def revoke(self, partitions: Iterable[TopicPartition]):
+        '''
+        Close the sessions with the events of the revoked partitions
+        '''
+        partitions = set(partitions)
+        for session in list(self.sessions.values()):
+            if session.partitions & partitions:
+                self._emit(session, is_closed=True)
+
+
+async def check_co_partitioning(consumer: AIOKafkaConsumer):
+    '''
+    Warn when the click topics have different numbers of partitions, so the
+    events of a viewer are split between the consumers
+    '''
+    await consumer.topics()
+    counts = {
+        topic: len(consumer.partitions_for_topic(topic) or ())
+        for topic in CLICK_TOPICS
+    }
+    if len(set(counts.values())) > 1:
+        print(
+            f"Click topics are not co-partitioned, the watch sessions are "
+            f"split between the consumers: {counts}"
+        )
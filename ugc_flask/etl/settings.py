@@ -51,5 +51,67 @@ TOPIC_NAMES = [
     AsyncAPITopics.PERSON_TOPIC.value
 ]
 
+# Messages that can not be routed or decoded are sent to the dead letter
+# topic named as the source topic with the suffix, e.g.
+# tracking.clicks_on_video.pauses.dlq
+DEAD_LETTER_TOPIC_SUFFIX = '.dlq'
+
 # ClickHouse settings
 CLICKHOUSE_DATABASE_NAME = 'tracking_user_events'
+# Retention of the tracked events, older rows are removed by TTL
+CLICKHOUSE_TTL_DAYS = int(os.getenv('CLICKHOUSE_TTL_DAYS', 365))
+
+# Batch insert flush policy. A buffer is flushed into ClickHouse when it
+# reaches the max number of rows or bytes, or when its oldest row waits
+# longer than the max linger time. Every limit can be overridden for a single
+# table with the table name prefix, e.g. GET_GENRE_BY_ID_PAGE_VIEWS_FLUSH_MAX_ROWS
+FLUSH_MAX_ROWS = int(os.getenv('FLUSH_MAX_ROWS', 200_000))
+FLUSH_MAX_BYTES = int(os.getenv('FLUSH_MAX_BYTES', 64 * 1024 * 1024))
+FLUSH_MAX_LINGER_SEC = float(os.getenv('FLUSH_MAX_LINGER_SEC', 10))
+
+# How often the background timer checks the linger time of the buffers
+FLUSH_CHECK_INTERVAL_SEC = float(os.getenv('FLUSH_CHECK_INTERVAL_SEC', 1))
+# How often the per-table flush metrics are reported
+FLUSH_STATS_REPORT_INTERVAL_SEC = float(
+    os.getenv('FLUSH_STATS_REPORT_INTERVAL_SEC', 60)
+)
+
+# Sessionization of the click events: the events of a viewer and a film
+# more than the inactivity gap apart belong to different watch sessions,
+# the open sessions are written as checkpoints with the interval
+SESSION_INACTIVITY_GAP_SEC = float(
+    os.getenv('SESSION_INACTIVITY_GAP_SEC', 30 * 60)
+)
+SESSION_CHECKPOINT_INTERVAL_SEC = float(
+    os.getenv('SESSION_CHECKPOINT_INTERVAL_SEC', 60)
+)
+
+# Retry policy of ClickHouse inserts: jittered exponential backoff. When all
+# the attempts fail, offsets are no longer committed and the consumer stops
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', 10))
+RETRY_START_SLEEP_TIME_SEC = float(os.getenv('RETRY_START_SLEEP_TIME_SEC', 0.1))
+RETRY_BORDER_SLEEP_TIME_SEC = float(
+    os.getenv('RETRY_BORDER_SLEEP_TIME_SEC', 30)
+)
+
+# Kafka consumer group shared by all the ETL worker processes
+KAFKA_GROUP_ID = 'consumer_for_clickhouse'
+
+# Number of consumer processes, the partitions of the topics are assigned
+# across them by the consumer group
+ETL_WORKERS = int(os.getenv('ETL_WORKERS', os.cpu_count() or 1))
+# Max number of ClickHouse connections kept by every worker process
+CLICKHOUSE_POOL_SIZE = int(os.getenv('CLICKHOUSE_POOL_SIZE', 10))
+# Delay before restarting a worker process that exited with an error
+WORKER_RESTART_DELAY_SEC = float(os.getenv('WORKER_RESTART_DELAY_SEC', 5))
+# Every worker serves its Prometheus metrics on this port + the worker ID
+ETL_METRICS_PORT = int(os.getenv('ETL_METRICS_PORT', 9100))
+
+# Replay mode rebuilding the tables of a topic from Kafka: the consumer
+# group of the replay, the rows per insert into the shadow tables, the
+# records per fetch and the lag behind the live consumer group at which
+# the replayed rows replace the ones of the live tables
+REPLAY_GROUP_ID = os.getenv('REPLAY_GROUP_ID', f'{KAFKA_GROUP_ID}_replay')
+REPLAY_BATCH_MAX_ROWS = int(os.getenv('REPLAY_BATCH_MAX_ROWS', 1_000_000))
+REPLAY_FETCH_MAX_RECORDS = int(os.getenv('REPLAY_FETCH_MAX_RECORDS', 50_000))
+REPLAY_CATCH_UP_MAX_LAG = int(os.getenv('REPLAY_CATCH_UP_MAX_LAG', 1_000))
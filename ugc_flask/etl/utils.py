@@ -1,75 +1,278 @@
 from __future__ import annotations
-import json
+import asyncio
+import random
 import time
-from datetime import datetime
+from collections import Counter
 from functools import wraps
 from typing import TYPE_CHECKING
 
+from aiokafka import ConsumerRebalanceListener
+from aiokafka.structs import TopicPartition
+
+import settings
+from dead_letters import (
+    DeadLetterNotSent,
+    DeadLetterReason,
+    classify_decode_error,
+    dead_letter_counts,
+    send_to_dead_letter_topic,
+)
+from flush_policy import FlushReason
+from metrics import (
+    INSERT_DURATION,
+    MESSAGES_DECODED,
+    RETRIES,
+    ROWS_PER_INSERT,
+    update_consumer_lag,
+)
+from offsets import OffsetTracker, commit_offsets
+
 
 if TYPE_CHECKING:
-    from aiokafka import AIOKafkaConsumer
+    from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
     from aiokafka.structs import ConsumerRecord
     from aiochclient import ChClient
 
+    from routing import RoutingTable, Sink
+    from sessionization import Sessionizer
+
+
+# Number of retries made by every function decorated with backoff
+retry_counts = Counter()
+
+
+class RetryLimitExceeded(Exception):
+    pass
+
 
 def backoff(
-    start_sleep_time_sec=0.1,
+    start_sleep_time_sec=settings.RETRY_START_SLEEP_TIME_SEC,
     factor=2,
-    border_sleep_time_sec=100,
+    border_sleep_time_sec=settings.RETRY_BORDER_SLEEP_TIME_SEC,
+    max_attempts=settings.RETRY_MAX_ATTEMPTS,
 ):
+    '''
+    Retry the coroutine with the exponential backoff and the full jitter,
+    sleeping without blocking the event loop, so the Kafka heartbeats keep
+    going. RetryLimitExceeded is raised when all the attempts fail
+    '''
     def func_wrapper(func):
         @wraps(func)
         async def inner(*args, **kwargs):
-            t = start_sleep_time_sec * (factor**2)
-            while t < border_sleep_time_sec:
+            for attempt in range(1, max_attempts + 1):
                 try:
                     return await func(*args, **kwargs)
-                except Exception:
-                    print(f"Waiting for a connection - {t}, sec.")
-                    time.sleep(t)
-                t = t * (factor**2)
+                except Exception as e:
+                    if attempt == max_attempts:
+                        raise RetryLimitExceeded(
+                            f"{func.__name__} failed after {attempt} attempts"
+                        ) from e
+
+                    retry_counts[func.__name__] += 1
+                    RETRIES.labels(func.__name__).inc()
+                    t = random.uniform(
+                        0,
+                        min(
+                            border_sleep_time_sec,
+                            start_sleep_time_sec * (factor**attempt),
+                        ),
+                    )
+                    print(
+                        f"{func.__name__} failed ({e!r}), "
+                        f"attempt {attempt}/{max_attempts}, "
+                        f"retrying in {t:.2f} sec."
+                    )
+                    await asyncio.sleep(t)
 
         return inner
 
     return func_wrapper
 
 
-@backoff()
-async def load_data_to_clickhouse_from_async_api_kafka_topics(
+async def send_dead_letter(
+    producer: AIOKafkaProducer,
+    offset_tracker: OffsetTracker,
     message: ConsumerRecord,
-    temporal_storage: list,
+    reason: DeadLetterReason,
+    error: Exception | None = None,
+):
+    '''
+    Send the message to the dead letter topic with the retries. When the
+    retries run out the consumer is stopped, so the offset of the message
+    is not committed before it is stored anywhere
+    '''
+    # The message is tracked as buffered before the send: the partition may
+    # be revoked and forgotten by the tracker while the send is retried
+    tp = TopicPartition(message.topic, message.partition)
+    offset_tracker.consumed(tp, message.offset)
+    try:
+        await backoff()(send_to_dead_letter_topic)(
+            producer,
+            message,
+            reason,
+            error,
+        )
+    except RetryLimitExceeded as e:
+        raise DeadLetterNotSent(
+            f"Message {message.topic}:{message.partition}:{message.offset} "
+            f"is not sent to the dead letter topic, stopping the consumer"
+        ) from e
+    offset_tracker.inserted([(tp, message.offset)])
+
+
+async def load_data_to_clickhouse(
+    message: ConsumerRecord,
+    sink: Sink | None,
     kafka_consumer: AIOKafkaConsumer,
     clickhouse_client: ChClient,
-    insert_query: str,
-    batch_size: int = 10,
+    offset_tracker: OffsetTracker,
+    dead_letter_producer: AIOKafkaProducer,
+    sessionizer: Sessionizer | None = None,
 ):
-    user_id, query_parameters, visited_at = tuple(
-        json.loads(message.value.decode("utf-8")).values()
-    )
-    visited_at = datetime.strptime(visited_at, "%Y-%m-%d %H:%M:%S %z")
-    temporal_storage.append(
-        tuple([user_id, *query_parameters.values(), visited_at])
-    )
-
-    if len(temporal_storage) > batch_size:
-        await clickhouse_client.execute(insert_query, *temporal_storage)
-        await kafka_consumer.commit()
-        temporal_storage.clear()
-
-
-# @backoff()
-async def load_data_to_clickhouse_from_video_events_kafka_topics(
-    message: ConsumerRecord,
-    temporal_storage: list,
+    tp = TopicPartition(message.topic, message.partition)
+    if sink is None:
+        await send_dead_letter(
+            dead_letter_producer,
+            offset_tracker,
+            message,
+            DeadLetterReason.UNKNOWN_ROUTE,
+        )
+        return
+
+    try:
+        row = sink.decode_row(message.value, message.headers)
+    except Exception as e:
+        await send_dead_letter(
+            dead_letter_producer,
+            offset_tracker,
+            message,
+            classify_decode_error(e),
+            e,
+        )
+        return
+
+    MESSAGES_DECODED.labels(sink.table).inc()
+    sink.append(row, len(message.value), tp, message.offset)
+    offset_tracker.consumed(tp, message.offset)
+    # The offset is held back until the session row is inserted as well
+    if sessionizer is not None and sessionizer.add(
+        sink.table, row, message.key, tp, message.offset
+    ):
+        offset_tracker.consumed(tp, message.offset)
+
+    reason = sink.reason_to_flush()
+    if reason is not None:
+        if await flush_sink(sink, clickhouse_client, offset_tracker, reason):
+            await commit_offsets(kafka_consumer, offset_tracker)
+
+
+async def flush_sink(
+    sink: Sink,
+    clickhouse_client: ChClient,
+    offset_tracker: OffsetTracker,
+    reason: FlushReason,
+) -> bool:
+    async with sink.lock:
+        rows, size_bytes, offsets = sink.take_batch()
+        if not rows:
+            return False
+
+        started_at = time.monotonic()
+        try:
+            await insert_rows(clickhouse_client, sink.insert_query, rows)
+        except RetryLimitExceeded as e:
+            # The rows are lost from the buffer, so the offsets must not be
+            # committed anymore: the messages are consumed again on restart
+            offset_tracker.halt(e)
+            raise
+        offset_tracker.inserted(offsets)
+        duration_sec = time.monotonic() - started_at
+        sink.stats.record(len(rows), size_bytes, duration_sec, reason)
+        ROWS_PER_INSERT.labels(sink.table).observe(len(rows))
+        INSERT_DURATION.labels(sink.table).observe(duration_sec)
+        return True
+
+
+@backoff()
+async def insert_rows(clickhouse_client: ChClient, insert_query: str, rows: list):
+    await clickhouse_client.execute(insert_query, *rows)
+
+
+async def flush_on_timer(
+    routing_table: RoutingTable,
     kafka_consumer: AIOKafkaConsumer,
     clickhouse_client: ChClient,
-    insert_query: str,
-    batch_size: int = 10,
+    offset_tracker: OffsetTracker,
+    sessionizer: Sessionizer | None = None,
 ):
-    temporal_storage.append(
-        tuple(json.loads(message.value.decode("utf-8")).values())
-    )
-    if len(temporal_storage) > batch_size:
-        await clickhouse_client.execute(insert_query, *temporal_storage)
-        await kafka_consumer.commit()
-        temporal_storage.clear()
+    '''
+    Background task flushing the buffers whose rows wait longer than the
+    max linger time, so quiet tables are not left unflushed, committing
+    the offsets of the dead letters, closing and checkpointing the watch
+    sessions, updating the consumer lag and reporting the per-table flush
+    metrics
+    '''
+    sinks = list(routing_table.values())
+    if sessionizer is not None:
+        sinks.append(sessionizer.sink)
+
+    reported_at = time.monotonic()
+    while True:
+        await asyncio.sleep(settings.FLUSH_CHECK_INTERVAL_SEC)
+
+        if sessionizer is not None:
+            sessionizer.tick()
+        for sink in sinks:
+            reason = sink.reason_to_flush()
+            if reason is not None:
+                await flush_sink(sink, clickhouse_client, offset_tracker, reason)
+        await commit_offsets(kafka_consumer, offset_tracker)
+        await update_consumer_lag(kafka_consumer)
+
+        if time.monotonic() - reported_at >= settings.FLUSH_STATS_REPORT_INTERVAL_SEC:
+            reported_at = time.monotonic()
+            for sink in sinks:
+                print(f"Flush stats - {sink.stats.report(sink.table)}")
+            print(f"Retry counts - {dict(retry_counts)}")
+            print(f"Dead letter counts - {dict(dead_letter_counts)}")
+
+
+class FlushOnRebalance(ConsumerRebalanceListener):
+    '''
+    Flushes every sink and commits the offsets before the partitions are
+    revoked, so the consumer the partitions are reassigned to resumes
+    right after the rows inserted by this one. The watch sessions of the
+    revoked partitions are closed and flushed with the other sinks
+    '''
+
+    def __init__(
+        self,
+        routing_table: RoutingTable,
+        kafka_consumer: AIOKafkaConsumer,
+        clickhouse_client: ChClient,
+        offset_tracker: OffsetTracker,
+        sessionizer: Sessionizer | None = None,
+    ):
+        self.routing_table = routing_table
+        self.kafka_consumer = kafka_consumer
+        self.clickhouse_client = clickhouse_client
+        self.offset_tracker = offset_tracker
+        self.sessionizer = sessionizer
+
+    async def on_partitions_revoked(self, revoked):
+        sinks = list(self.routing_table.values())
+        if self.sessionizer is not None:
+            self.sessionizer.revoke(revoked)
+            sinks.append(self.sessionizer.sink)
+        for sink in sinks:
+            await flush_sink(
+                sink,
+                self.clickhouse_client,
+                self.offset_tracker,
+                FlushReason.REBALANCE,
+            )
+        await commit_offsets(self.kafka_consumer, self.offset_tracker)
+        self.offset_tracker.forget(revoked)
+
+    async def on_partitions_assigned(self, assigned):
+        pass
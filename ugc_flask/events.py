@@ -0,0 +1,183 @@
+'''
+Module has the validation and the enrichment of the click tracking events
+and their serialization into Kafka messages
+'''
+import json
+import struct
+import time
+from numbers import Number
+from uuid import UUID
+
+from click_codecs import (
+    FULL_VIEW_V2,
+    PAUSE_V2,
+    QUALITY_CHANGE_V2,
+    SCHEMA_ID_HEADER,
+)
+from settings import (
+    CLICK_EVENT_ENCODING,
+    CLICK_EVENT_SCHEMA_VERSION,
+    ClickEventTypes,
+    ClickTrackingTopics,
+    SCHEMA_VERSION_HEADER,
+)
+
+
+# Event type -> (topic, fields sent by the player with their types).
+# UUID fields are strings holding a UUID
+EVENT_SCHEMAS = {
+    ClickEventTypes.QUALITY_CHANGE.value: (
+        ClickTrackingTopics.QUALITY_CHANGE_CLICK.value,
+        {
+            'quality_before': str,
+            'quality_after': str,
+            'changed_at': Number,
+            'timestamp': int,
+            'film_id': UUID,
+        },
+    ),
+    ClickEventTypes.PAUSE.value: (
+        ClickTrackingTopics.PAUSE_CLICK.value,
+        {
+            'pause_at': Number,
+            'timestamp': int,
+            'film_id': UUID,
+        },
+    ),
+    ClickEventTypes.FULL_VIEW.value: (
+        ClickTrackingTopics.FULL_VIEW.value,
+        {
+            'timestamp': int,
+            'film_id': UUID,
+        },
+    ),
+}
+
+# User ID of the events of anonymous users
+ANONYMOUS_USER_ID = str(UUID(int=0))
+
+
+class InvalidEvent(Exception):
+    pass
+
+
+def serialize_key(key: str | None) -> bytes | None:
+    '''
+    Serialize the partition key, the events of the anonymous users without
+    a viewing session are sent without a key
+    '''
+    return key.encode('utf-8') if key is not None else None
+
+
+def receive_time_ms() -> int:
+    '''
+    Return the server receive time in milliseconds, the same unit as the
+    timestamp set by the player
+    '''
+    return time.time_ns() // 1_000_000
+
+
+def validate_event(
+    event_type: str,
+    event: dict,
+    user_id: str | None,
+    received_at: int,
+) -> tuple[str, dict]:
+    '''
+    Validate the event and return the topic and the body of its message
+    enriched with the ID of the user and the server receive time
+    '''
+    if not isinstance(event, dict):
+        raise InvalidEvent('Event must be an object')
+
+    schema = EVENT_SCHEMAS.get(event_type)
+    if schema is None:
+        raise InvalidEvent(f'Unknown event type: {event_type}')
+
+    topic, fields = schema
+    body = {}
+    for field, field_type in fields.items():
+        value = event.get(field)
+        if field_type is UUID:
+            try:
+                value = str(UUID(value))
+            except (TypeError, ValueError, AttributeError):
+                raise InvalidEvent(f'Invalid field: {field}') from None
+        # bool is a subclass of int, but is not a valid value
+        elif not isinstance(value, field_type) or isinstance(value, bool):
+            raise InvalidEvent(f'Invalid field: {field}')
+        body[field] = value
+
+    body['user_id'] = user_id or ANONYMOUS_USER_ID
+    body['received_at'] = received_at
+    return topic, body
+
+
+def validate_events(
+    events: list,
+    user_id: str | None,
+    received_at: int,
+) -> tuple[list[tuple[str, dict]], list[dict]]:
+    '''
+    Validate the events in one pass and return the (topic, body) pairs of
+    the messages to send and the errors with the indexes of the events
+    '''
+    messages = []
+    errors = []
+    for index, event in enumerate(events):
+        try:
+            messages.append(
+                validate_event(
+                    event.get('type') if isinstance(event, dict) else None,
+                    event,
+                    user_id,
+                    received_at,
+                )
+            )
+        except InvalidEvent as e:
+            errors.append({'index': index, 'message': str(e)})
+
+    return messages, errors
+
+
+# Topic -> binary schema of its events
+TOPIC_BINARY_SCHEMAS = {
+    ClickTrackingTopics.QUALITY_CHANGE_CLICK.value: QUALITY_CHANGE_V2,
+    ClickTrackingTopics.PAUSE_CLICK.value: PAUSE_V2,
+    ClickTrackingTopics.FULL_VIEW.value: FULL_VIEW_V2,
+}
+
+_SCHEMA_VERSION = (
+    SCHEMA_VERSION_HEADER,
+    str(CLICK_EVENT_SCHEMA_VERSION).encode('utf-8'),
+)
+
+
+def serialize_event(
+    topic: str,
+    body: dict,
+) -> tuple[bytes, list[tuple[str, bytes]]]:
+    '''
+    Serialize the event into the value and the headers of the message.
+    With the binary encoding an event not matching its schema (e.g. with
+    a malformed user ID claim) is sent as JSON
+    '''
+    schema = TOPIC_BINARY_SCHEMAS.get(topic)
+    if CLICK_EVENT_ENCODING == 'binary' and schema is not None:
+        try:
+            value = schema.encode(body)
+        except (
+            KeyError,
+            TypeError,
+            AttributeError,
+            ValueError,
+            struct.error,
+            UnicodeEncodeError,
+        ):
+            pass
+        else:
+            return value, [
+                _SCHEMA_VERSION,
+                (SCHEMA_ID_HEADER, schema.header_value),
+            ]
+    return json.dumps(body).encode('utf-8'), [_SCHEMA_VERSION]
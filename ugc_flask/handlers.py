@@ -0,0 +1,87 @@
+'''
+Module has the handling of the /api/* requests shared by the Flask app and
+the ASGI app. The apps only parse the request and send the messages with
+their own producer, so the contract of the endpoints is defined once
+'''
+from http import HTTPStatus
+
+from delivery import DeliveryFailed, ProducerBufferFull
+from events import (
+    InvalidEvent,
+    receive_time_ms,
+    validate_event,
+    validate_events,
+)
+from settings import EVENT_BATCH_MAX_SIZE
+
+
+# Body and status of the response
+Response = tuple[dict, HTTPStatus]
+
+
+class RequestRejected(Exception):
+    '''
+    Request is not valid and is answered with the response
+    '''
+
+    def __init__(self, body: dict, status: HTTPStatus):
+        super().__init__(body, status)
+        self.response: Response = (body, status)
+
+
+def error(message: str, status: HTTPStatus) -> Response:
+    return {'status': 'error', 'message': message}, status
+
+
+def event_messages(
+    event_type: str,
+    event,
+    user_id: str | None,
+) -> list[tuple[str, dict]]:
+    '''
+    Validate the event posted to the single event endpoint, enrich it with
+    the ID of the user and the receive time and return its message
+    '''
+    try:
+        return [validate_event(event_type, event, user_id, receive_time_ms())]
+    except InvalidEvent as e:
+        raise RequestRejected(*error(str(e), HTTPStatus.BAD_REQUEST)) from e
+
+
+def batch_messages(events, user_id: str | None) -> list[tuple[str, dict]]:
+    '''
+    Validate the array of mixed typed events buffered by the video player,
+    e.g. [{"type": "pause", "pause_at": 12.5, "timestamp": 1731350520000,
+    "film_id": "..."}], and return their messages
+    '''
+    if not isinstance(events, list) or not events:
+        raise RequestRejected(*error(
+            'Request body must be a non-empty array of events',
+            HTTPStatus.BAD_REQUEST,
+        ))
+    if len(events) > EVENT_BATCH_MAX_SIZE:
+        raise RequestRejected(*error(
+            f'Batch must have at most {EVENT_BATCH_MAX_SIZE} events',
+            HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+        ))
+
+    messages, errors = validate_events(events, user_id, receive_time_ms())
+    if errors:
+        raise RequestRejected(
+            {'status': 'error', 'errors': errors},
+            HTTPStatus.BAD_REQUEST,
+        )
+    return messages
+
+
+def sent(**fields) -> Response:
+    return {'status': 'success', **fields}, HTTPStatus.OK
+
+
+def not_sent(e: Exception) -> Response:
+    '''
+    Response to the messages the producer failed to send
+    '''
+    if isinstance(e, (ProducerBufferFull, DeliveryFailed)):
+        return error(str(e), HTTPStatus.SERVICE_UNAVAILABLE)
+    return error(str(e), HTTPStatus.INTERNAL_SERVER_ERROR)
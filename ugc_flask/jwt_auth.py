@@ -0,0 +1,47 @@
+'''
+Module has the optional JWT verification of the ASGI ingestion service,
+it accepts and rejects the same tokens as flask_jwt_extended with
+jwt_required(optional=True) and answers with the same errors
+'''
+import jwt
+
+from settings import JWT_ALGORITHM, JWT_PUBLIC_KEY
+
+
+PUBLIC_KEY = JWT_PUBLIC_KEY.read_text()
+
+
+class InvalidJWT(Exception):
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def decode_optional_jwt(authorization: str | None) -> dict:
+    '''
+    Return the claims of the access token from the Authorization header or
+    an empty dict when the header is missing
+    '''
+    if not authorization:
+        return {}
+
+    scheme, _, token = authorization.partition(' ')
+    if scheme != 'Bearer' or not token:
+        raise InvalidJWT(
+            "Bad Authorization header. Expected 'Authorization: Bearer <JWT>'",
+            422,
+        )
+
+    try:
+        claims = jwt.decode(token, key=PUBLIC_KEY, algorithms=[JWT_ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise InvalidJWT('Token has expired', 401)
+    except jwt.InvalidTokenError as e:
+        raise InvalidJWT(str(e), 422)
+
+    if 'sub' not in claims:
+        raise InvalidJWT('Missing claim: sub', 422)
+    if claims.get('type', 'access') != 'access':
+        raise InvalidJWT('Only non-refresh tokens are allowed', 422)
+    return claims
@@ -0,0 +1,314 @@
+'''
+Load test of the click ingestion pipeline: UGC service -> Kafka -> ETL ->
+ClickHouse.
+
+Players replay the generated viewing sessions against /api/* while the lag
+probe measures the time from the HTTP accept of an event to its row being
+visible in ClickHouse. The results are written to a JSON file, so the runs
+of different releases can be compared
+'''
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from uuid import uuid4
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from aiochclient import ChClient
+
+import settings
+from sessions import generate_session
+
+
+SINGLE_EVENT_URLS = {
+    'pause': '/api/pause',
+    'quality_change': '/api/quality-change',
+    'full_view': '/api/full-view',
+}
+
+
+class Results:
+    def __init__(self):
+        self.statuses = Counter()
+        self.latencies_ms = []
+        self.events_sent = 0
+        self.events_accepted = 0
+        self.sessions = 0
+        self.lags_ms = []
+        self.lost_probes = 0
+
+    def request_done(self, status: str, latency_ms: float, events: int):
+        self.statuses[status] += 1
+        self.latencies_ms.append(latency_ms)
+        self.events_sent += events
+        if status == '200':
+            self.events_accepted += events
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def percentile(q: float) -> float:
+        return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+
+    return {
+        'p50': percentile(0.5),
+        'p90': percentile(0.9),
+        'p99': percentile(0.99),
+        'max': round(values[-1], 3),
+    }
+
+
+async def post(
+    session: ClientSession,
+    results: Results,
+    url: str,
+    body: dict | list,
+    events: int,
+    session_id: str | None = None,
+) -> bool:
+    # The players share the connection pool, so the cookie of the viewing
+    # session is sent with every request instead of the cookie jar
+    headers = {'Cookie': f'ugc_session_id={session_id}'} if session_id else {}
+    started_at = time.monotonic()
+    try:
+        async with session.post(
+            settings.SERVICE_URL + url,
+            json=body,
+            headers=headers,
+        ) as r:
+            await r.read()
+            status = str(r.status)
+    except Exception as e:
+        status = type(e).__name__
+    results.request_done(
+        status,
+        (time.monotonic() - started_at) * 1000,
+        events,
+    )
+    return status == '200'
+
+
+async def play(
+    session: ClientSession,
+    results: Results,
+    rng: random.Random,
+    deadline: float,
+):
+    '''
+    Replay the sessions one after another until the deadline, buffering
+    the events as the video player does in the batch mode
+    '''
+    while time.monotonic() < deadline:
+        session_id = str(uuid4())
+        buffer = []
+        buffer_started_at = None
+        for action in generate_session(rng):
+            await asyncio.sleep(
+                action.think_time_sec * settings.LOAD_TEST_TIME_SCALE
+            )
+            if time.monotonic() >= deadline:
+                break
+
+            event = {
+                **action.data,
+                'timestamp': time.time_ns() // 1_000_000,
+            }
+            if settings.LOAD_TEST_MODE == 'single':
+                await post(
+                    session,
+                    results,
+                    SINGLE_EVENT_URLS[action.event_type],
+                    event,
+                    1,
+                    session_id,
+                )
+                continue
+
+            buffer.append({'type': action.event_type, **event})
+            if buffer_started_at is None:
+                buffer_started_at = time.monotonic()
+            if (
+                len(buffer) >= settings.EVENT_BATCH_MAX_SIZE
+                or time.monotonic() - buffer_started_at
+                >= settings.EVENT_BATCH_WINDOW_SEC
+            ):
+                await post(
+                    session,
+                    results,
+                    '/api/events/batch',
+                    buffer,
+                    len(buffer),
+                    session_id,
+                )
+                buffer = []
+                buffer_started_at = None
+
+        # The player flushes the buffer when the page is closed
+        if buffer:
+            await post(
+                session,
+                results,
+                '/api/events/batch',
+                buffer,
+                len(buffer),
+                session_id,
+            )
+        results.sessions += 1
+
+
+async def probe_lag(
+    session: ClientSession,
+    clickhouse_client: ChClient,
+    results: Results,
+):
+    '''
+    Send a full view of a film unique to the probe and poll ClickHouse
+    until its row is visible
+    '''
+    film_id = str(uuid4())
+    # Every probe is a viewing session of its own, as a player without
+    # the login would send
+    accepted = await post(
+        session,
+        results,
+        SINGLE_EVENT_URLS['full_view'],
+        {'timestamp': time.time_ns() // 1_000_000, 'film_id': film_id},
+        1,
+        session_id=str(uuid4()),
+    )
+    if not accepted:
+        results.lost_probes += 1
+        return
+
+    accepted_at = time.monotonic()
+    while time.monotonic() - accepted_at < settings.LAG_PROBE_TIMEOUT_SEC:
+        visible = await clickhouse_client.fetchval(
+            f'''
+            SELECT count()
+            FROM {settings.CLICKHOUSE_DATABASE_NAME}.{settings.FULL_VIEWS_TABLE}
+            WHERE film_id = {{film_id}}
+            ''',
+            params={'film_id': film_id},
+        )
+        if visible:
+            results.lags_ms.append((time.monotonic() - accepted_at) * 1000)
+            return
+        await asyncio.sleep(settings.LAG_PROBE_POLL_INTERVAL_SEC)
+    results.lost_probes += 1
+
+
+async def probe_lag_periodically(
+    session: ClientSession,
+    clickhouse_client: ChClient,
+    results: Results,
+    deadline: float,
+):
+    probes = []
+    while time.monotonic() < deadline:
+        probes.append(
+            asyncio.create_task(probe_lag(session, clickhouse_client, results))
+        )
+        await asyncio.sleep(settings.LAG_PROBE_INTERVAL_SEC)
+    # The probes sent at the end of the run wait for the ETL to catch up
+    await asyncio.gather(*probes)
+
+
+async def run_load_test() -> dict:
+    results = Results()
+    rng = random.Random(settings.LOAD_TEST_SEED)
+    started_at = datetime.now(timezone.utc)
+    deadline = time.monotonic() + settings.LOAD_TEST_DURATION_SEC
+
+    async with (
+        ClientSession(
+            connector=TCPConnector(limit=settings.LOAD_TEST_PLAYERS),
+            timeout=ClientTimeout(total=settings.REQUEST_TIMEOUT_SEC),
+        ) as session,
+        ClientSession() as clickhouse_session,
+    ):
+        clickhouse_client = ChClient(
+            session=clickhouse_session,
+            url=settings.CLICKHOUSE_HOST,
+        )
+        await asyncio.gather(
+            *(
+                # Every player has its own random generator, so a run with
+                # the same seed replays the same sessions
+                play(
+                    session,
+                    results,
+                    random.Random(rng.getrandbits(64)),
+                    deadline,
+                )
+                for _ in range(settings.LOAD_TEST_PLAYERS)
+            ),
+            probe_lag_periodically(
+                session,
+                clickhouse_client,
+                results,
+                deadline,
+            ),
+        )
+
+    return {
+        'started_at': started_at.isoformat(),
+        'config': {
+            'service_url': settings.SERVICE_URL,
+            'mode': settings.LOAD_TEST_MODE,
+            'players': settings.LOAD_TEST_PLAYERS,
+            'duration_sec': settings.LOAD_TEST_DURATION_SEC,
+            'time_scale': settings.LOAD_TEST_TIME_SCALE,
+            'seed': settings.LOAD_TEST_SEED,
+        },
+        'sessions': results.sessions,
+        'requests': {
+            'total': sum(results.statuses.values()),
+            'per_sec': round(
+                sum(results.statuses.values())
+                / settings.LOAD_TEST_DURATION_SEC,
+                1,
+            ),
+            'statuses': dict(results.statuses),
+            'latency_ms': percentiles(results.latencies_ms),
+        },
+        'events': {
+            'sent': results.events_sent,
+            'accepted': results.events_accepted,
+            'accepted_per_sec': round(
+                results.events_accepted / settings.LOAD_TEST_DURATION_SEC,
+                1,
+            ),
+        },
+        'end_to_end_lag_ms': {
+            'probes': len(results.lags_ms) + results.lost_probes,
+            'samples': len(results.lags_ms),
+            'lost': results.lost_probes,
+            **percentiles(results.lags_ms),
+        },
+    }
+
+
+def main():
+    report = asyncio.run(run_load_test())
+    results_dir = Path(settings.RESULTS_DIR)
+    results_dir.mkdir(parents=True, exist_ok=True)
+    results_path = results_dir / (
+        f"load_test_{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json"
+    )
+    results_path.write_text(json.dumps(report, indent=2))
+    print(json.dumps(report, indent=2))
+    print(f"Results are written to {results_path}")
+    # A run without lag samples measured nothing end to end
+    if not report['end_to_end_lag_ms']['samples']:
+        sys.exit("No lag probe reached ClickHouse, the lag is not measured")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+'''
+Module has the generator of the viewing sessions replayed by the load test.
+A session is the sequence of the events a viewer produces while watching
+a film with the think time before every one of them
+'''
+import random
+from dataclasses import dataclass
+from uuid import NAMESPACE_URL, uuid5
+
+
+QUALITIES = ('360', '720')
+
+# Films the sessions are spread over, a few popular ones get most of the
+# views as on the real service
+FILMS = [
+    str(uuid5(NAMESPACE_URL, f'load-test-film-{rank}')) for rank in range(100)
+]
+FILM_WEIGHTS = [1 / (rank + 1) for rank in range(len(FILMS))]
+
+
+@dataclass
+class Action:
+    think_time_sec: float
+    event_type: str
+    data: dict
+
+
+def generate_session(rng: random.Random) -> list[Action]:
+    '''
+    Return the actions of one viewing session: pauses and quality changes
+    while watching and a full view for the sessions watched to the end
+    '''
+    film_id = rng.choices(FILMS, weights=FILM_WEIGHTS)[0]
+    film_duration_sec = rng.uniform(20 * 60, 150 * 60)
+    watched_sec = film_duration_sec * rng.betavariate(2, 1)
+    quality = rng.choice(QUALITIES)
+
+    actions = []
+    position_sec = 0.0
+    while True:
+        think_time_sec = rng.expovariate(1 / 300)
+        if position_sec + think_time_sec >= watched_sec:
+            break
+        position_sec += think_time_sec
+
+        if rng.random() < 0.8:
+            actions.append(
+                Action(
+                    think_time_sec,
+                    'pause',
+                    {'pause_at': round(position_sec, 3), 'film_id': film_id},
+                )
+            )
+        else:
+            quality_after = QUALITIES[1 - QUALITIES.index(quality)]
+            actions.append(
+                Action(
+                    think_time_sec,
+                    'quality_change',
+                    {
+                        'quality_before': quality,
+                        'quality_after': quality_after,
+                        'changed_at': round(position_sec, 3),
+                        'film_id': film_id,
+                    },
+                )
+            )
+            quality = quality_after
+
+    if watched_sec >= film_duration_sec * 0.95:
+        actions.append(
+            Action(
+                watched_sec - position_sec,
+                'full_view',
+                {'film_id': film_id},
+            )
+        )
+    return actions
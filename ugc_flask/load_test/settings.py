@@ -0,0 +1,37 @@
+import os
+
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+# Click ingestion service under test and the ClickHouse it is loaded into
+SERVICE_URL = os.getenv('SERVICE_URL', 'http://ugc_click_tracking:5000')
+CLICKHOUSE_HOST = os.getenv('CLICKHOUSE_HOST', 'http://clickhouse:8123/')
+CLICKHOUSE_DATABASE_NAME = 'tracking_user_events'
+FULL_VIEWS_TABLE = 'clicks_on_video_full_views'
+
+# Number of players replaying sessions at the same time
+LOAD_TEST_PLAYERS = int(os.getenv('LOAD_TEST_PLAYERS', 200))
+LOAD_TEST_DURATION_SEC = float(os.getenv('LOAD_TEST_DURATION_SEC', 60))
+# Players send the events buffered in batches ('batch') as the video player
+# does or one request per event ('single')
+LOAD_TEST_MODE = os.getenv('LOAD_TEST_MODE', 'batch')
+# Pauses between the actions of a player are multiplied by it, so a session
+# of minutes is replayed in seconds
+LOAD_TEST_TIME_SCALE = float(os.getenv('LOAD_TEST_TIME_SCALE', 0.001))
+# Same as in static/script.js
+EVENT_BATCH_MAX_SIZE = 50
+EVENT_BATCH_WINDOW_SEC = 2
+REQUEST_TIMEOUT_SEC = float(os.getenv('REQUEST_TIMEOUT_SEC', 10))
+LOAD_TEST_SEED = int(os.getenv('LOAD_TEST_SEED', 42))
+
+# End-to-end lag probes: a full view of a unique film is sent and ClickHouse
+# is polled until its row is visible
+LAG_PROBE_INTERVAL_SEC = float(os.getenv('LAG_PROBE_INTERVAL_SEC', 5))
+LAG_PROBE_POLL_INTERVAL_SEC = float(
+    os.getenv('LAG_PROBE_POLL_INTERVAL_SEC', 0.1)
+)
+LAG_PROBE_TIMEOUT_SEC = float(os.getenv('LAG_PROBE_TIMEOUT_SEC', 120))
+
+RESULTS_DIR = os.getenv('RESULTS_DIR', 'results')
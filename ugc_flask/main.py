@@ -1,6 +1,8 @@
 from flask import (
     Flask,
+    jsonify,
     render_template,
+    request,
 )
 
 from flask_jwt_extended import (
@@ -10,8 +12,9 @@ from flask_jwt_extended import (
     # get_jwt,
 )
 
-from settings import JWT_PUBLIC_KEY, JWT_ALGORITHM
+from settings import DEMO_FILM_ID, JWT_PUBLIC_KEY, JWT_ALGORITHM
 from api.v1.api import api
+from producer import get_delivery_stats
 
 
 app = Flask(__name__)
@@ -26,7 +29,17 @@ jwt = JWTManager(app)
 @app.route("/")
 @jwt_required(optional=True)
 def index():
-    return render_template('index.html')
+    # The tracked events are attributed to the film of the player
+    return render_template(
+        'index.html',
+        film_id=request.args.get('film_id', DEMO_FILM_ID),
+    )
+
+
+@app.route("/metrics/producer")
+def producer_metrics():
+    # Per-topic delivery counters and latencies of the Kafka producer
+    return jsonify(get_delivery_stats())
 
 
 if __name__ == '__main__':
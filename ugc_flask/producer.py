@@ -1,19 +1,105 @@
-import json
+import time
 
 from kafka import KafkaProducer
+from kafka.errors import KafkaError, KafkaTimeoutError
 
-from settings import BOOTSTRAP_SERVERS
+from delivery import DeliveryFailed, DeliveryTracker, ProducerBufferFull
+from events import serialize_event, serialize_key
+from settings import (
+    BOOTSTRAP_SERVERS,
+    PRODUCER_ACKS,
+    PRODUCER_BATCH_SIZE,
+    PRODUCER_BUFFER_MEMORY,
+    PRODUCER_COMPRESSION_TYPE,
+    PRODUCER_DELIVERY_TIMEOUT_SEC,
+    PRODUCER_LINGER_MS,
+    PRODUCER_MAX_BLOCK_MS,
+    PRODUCER_MAX_IN_FLIGHT,
+)
 
 
 producer = KafkaProducer(
     bootstrap_servers=BOOTSTRAP_SERVERS,
-    value_serializer=lambda v: json.dumps(v).encode('utf-8')
+    key_serializer=serialize_key,
+    acks=PRODUCER_ACKS if PRODUCER_ACKS == 'all' else int(PRODUCER_ACKS),
+    linger_ms=PRODUCER_LINGER_MS,
+    batch_size=PRODUCER_BATCH_SIZE,
+    compression_type=PRODUCER_COMPRESSION_TYPE,
+    buffer_memory=PRODUCER_BUFFER_MEMORY,
+    max_block_ms=PRODUCER_MAX_BLOCK_MS,
 )
 
+delivery_tracker = DeliveryTracker(PRODUCER_MAX_IN_FLIGHT)
+
+
+def _send(topic: str, body: dict, key: str | None):
+    try:
+        value, headers = serialize_event(topic, body)
+        # Records with the same key go to the same partition, the ones
+        # without a key are spread across the partitions
+        future = producer.send(
+            topic,
+            value=value,
+            key=key,
+            headers=headers,
+        )
+    except KafkaTimeoutError as e:
+        # No free buffer memory within max_block_ms
+        delivery_tracker.release(1)
+        raise ProducerBufferFull(
+            'Producer buffer is full, try again later'
+        ) from e
+    except Exception:
+        delivery_tracker.release(1)
+        raise
 
-def send_message_to_kafka(topic: str, body: dict):
-    producer.send(
-        topic,
-        value=body,
-        partition=None,
+    sent_at = delivery_tracker.sent(topic)
+    future.add_callback(
+        lambda _: delivery_tracker.delivered(topic, sent_at)
     )
+    future.add_errback(
+        lambda exception: delivery_tracker.failed(topic, exception)
+    )
+    return future
+
+
+def _wait_for_delivery(futures: list):
+    # The delivery timeout is for the whole batch, not for every message
+    deadline = time.monotonic() + PRODUCER_DELIVERY_TIMEOUT_SEC
+    for future in futures:
+        try:
+            future.get(timeout=max(deadline - time.monotonic(), 0))
+        except KafkaError as e:
+            raise DeliveryFailed(
+                f'Message is not delivered to Kafka: {e!r}'
+            ) from e
+
+
+def send_message_to_kafka(topic: str, body: dict, key: str | None = None):
+    delivery_tracker.reserve(1)
+    _wait_for_delivery([_send(topic, body, key)])
+
+
+def send_messages_to_kafka(
+    messages: list[tuple[str, dict]],
+    key: str | None = None,
+):
+    '''
+    Send the batch of messages and wait for the delivery of all of them
+    '''
+    delivery_tracker.reserve(len(messages))
+    futures = []
+    try:
+        for topic, body in messages:
+            futures.append(_send(topic, body, key))
+    except Exception:
+        # Release the room reserved for the messages that were not sent
+        delivery_tracker.release(len(messages) - len(futures) - 1)
+        raise
+    # Only the own messages are waited for, the producer is shared by the
+    # concurrent requests
+    _wait_for_delivery(futures)
+
+
+def get_delivery_stats() -> dict:
+    return delivery_tracker.snapshot()
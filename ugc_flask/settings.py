@@ -14,8 +14,60 @@ JWT_ALGORITHM = 'RS256'
 
 BOOTSTRAP_SERVERS = os.getenv('BOOTSTRAP_SERVERS')
 
+# Number of worker processes of the ASGI ingestion service
+ASGI_WORKERS = int(os.getenv('ASGI_WORKERS', 4))
+
+# Kafka producer tuning: records are batched for up to linger ms or until
+# the batch size in bytes is reached and compressed as a whole
+PRODUCER_LINGER_MS = int(os.getenv('PRODUCER_LINGER_MS', 20))
+PRODUCER_BATCH_SIZE = int(os.getenv('PRODUCER_BATCH_SIZE', 64 * 1024))
+PRODUCER_COMPRESSION_TYPE = os.getenv('PRODUCER_COMPRESSION_TYPE', 'gzip')
+PRODUCER_ACKS = os.getenv('PRODUCER_ACKS', 'all')
+PRODUCER_BUFFER_MEMORY = int(
+    os.getenv('PRODUCER_BUFFER_MEMORY', 32 * 1024 * 1024)
+)
+# How long a send waits for free buffer memory before the request is
+# answered with 503
+PRODUCER_MAX_BLOCK_MS = int(os.getenv('PRODUCER_MAX_BLOCK_MS', 100))
+# Max number of records sent but not yet acknowledged by the broker,
+# requests above it are answered with 503
+PRODUCER_MAX_IN_FLIGHT = int(os.getenv('PRODUCER_MAX_IN_FLIGHT', 10_000))
+# How long a request waits for the broker to acknowledge its records
+PRODUCER_DELIVERY_TIMEOUT_SEC = float(
+    os.getenv('PRODUCER_DELIVERY_TIMEOUT_SEC', 5)
+)
+
 
 class ClickTrackingTopics(Enum):
     QUALITY_CHANGE_CLICK = 'tracking.clicks_on_video.quality_changes'
     PAUSE_CLICK = 'tracking.clicks_on_video.pauses'
     FULL_VIEW = 'tracking.clicks_on_video.full_views'
+
+
+# Version of the click event schema, it is sent in the header of every
+# message, so consumers can tell the layouts apart
+CLICK_EVENT_SCHEMA_VERSION = 2
+SCHEMA_VERSION_HEADER = 'schema_version'
+# Encoding of the click events: 'json' or 'binary' (compact encoding with
+# the ID of the schema in the header, see click_codecs.py)
+CLICK_EVENT_ENCODING = os.getenv('CLICK_EVENT_ENCODING', 'json')
+
+# Cookie with the ID of the viewing session set by the video player, it is
+# the partition key of the events of anonymous users
+SESSION_ID_COOKIE = 'ugc_session_id'
+
+# Film played on the demo page when no film_id query parameter is given
+DEMO_FILM_ID = os.getenv(
+    'DEMO_FILM_ID',
+    '3d825f60-9fff-4dfe-b294-1a45fa1e115d',
+)
+
+
+class ClickEventTypes(Enum):
+    QUALITY_CHANGE = 'quality_change'
+    PAUSE = 'pause'
+    FULL_VIEW = 'full_view'
+
+
+# Max number of events accepted in one batch request
+EVENT_BATCH_MAX_SIZE = int(os.getenv('EVENT_BATCH_MAX_SIZE', 500))
@@ -1,3 +1,66 @@
+// Buffer of the tracked player events, they are sent to the UGC service
+// in batches instead of one request per event
+const EVENT_BATCH_URL = '/api/events/batch';
+const EVENT_BATCH_MAX_SIZE = 50;
+const EVENT_BATCH_WINDOW_MS = 2000;
+
+// ID of the viewing session, the events of anonymous users are partitioned
+// by it in Kafka
+const SESSION_ID_COOKIE = 'ugc_session_id';
+
+if (!document.cookie.split('; ').some(c => c.startsWith(SESSION_ID_COOKIE + '='))) {
+  document.cookie = `${SESSION_ID_COOKIE}=${crypto.randomUUID()}; path=/; SameSite=Lax`;
+}
+
+const eventBuffer = {
+  events: [],
+  timer: null,
+
+  push(type, data) {
+    this.events.push({ type: type, ...data });
+    if (this.events.length >= EVENT_BATCH_MAX_SIZE) {
+      this.flush();
+    } else if (this.timer === null) {
+      this.timer = setTimeout(() => this.flush(), EVENT_BATCH_WINDOW_MS);
+    }
+  },
+
+  flush(useBeacon = false) {
+    clearTimeout(this.timer);
+    this.timer = null;
+    if (this.events.length === 0) {
+      return;
+    }
+    const body = JSON.stringify(this.events);
+    this.events = [];
+
+    // The beacon is delivered even when the page is being closed
+    if (useBeacon && navigator.sendBeacon) {
+      navigator.sendBeacon(
+        EVENT_BATCH_URL,
+        new Blob([body], { type: 'application/json' })
+      );
+      return;
+    }
+    fetch(EVENT_BATCH_URL, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json'
+      },
+      body: body,
+      keepalive: true
+    })
+    .then(response => response.json())
+  }
+};
+
+document.addEventListener("visibilitychange", () => {
+  if (document.visibilityState === "hidden") {
+    eventBuffer.flush(true);
+  }
+});
+window.addEventListener("pagehide", () => eventBuffer.flush(true));
+
 // let's select all required tags or elements
 const video_players = document.querySelectorAll(".video_player");
 video_players.forEach(video_player => {
@@ -199,17 +262,11 @@ video_players.forEach(video_player => {
 
     const data = {
       pause_at: pause_at,
-      timestamp: new Date().getTime()
+      timestamp: new Date().getTime(),
+      film_id: video_player.dataset.filmId
     };
 
-    fetch('/api/pause', {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json'
-      },
-      body: JSON.stringify(data)
-    })
-    .then(response => response.json())
+    eventBuffer.push('pause', data);
   }
 
   mainVideo.addEventListener("pause", () => {
@@ -404,17 +461,11 @@ video_players.forEach(video_player => {
   function sendFullVeiwEvent() {
 
     const data = {
-      timestamp: new Date().getTime()
+      timestamp: new Date().getTime(),
+      film_id: video_player.dataset.filmId
     };
 
-    fetch('/api/full-view', {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json'
-      },
-      body: JSON.stringify(data)
-    })
-    .then(response => response.json())
+    eventBuffer.push('full_view', data);
   }
 
   mainVideo.addEventListener("ended", () => {
@@ -539,16 +590,10 @@ video_players.forEach(video_player => {
       quality_after: quality_after,
       changed_at: changed_at,
       timestamp: new Date().getTime(),
+      film_id: video_player.dataset.filmId
     };
 
-    fetch('/api/quality-change', {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json'
-      },
-      body: JSON.stringify(data)
-    })
-    .then(response => response.json())
+    eventBuffer.push('quality_change', data);
   }
 
   var quality_before
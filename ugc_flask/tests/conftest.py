@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+
+# The modules of the service are imported by their names, as in the container
+sys.path.insert(0, str(Path(__file__).parent.parent))
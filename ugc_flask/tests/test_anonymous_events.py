@@ -0,0 +1,55 @@
+'''
+Events of the anonymous users without the viewing session cookie have no
+partition key and are sent to Kafka without a key
+'''
+import socket
+import time
+from http import HTTPStatus
+from uuid import uuid4
+
+import pytest
+
+from events import serialize_key
+from settings import BOOTSTRAP_SERVERS
+
+
+def kafka_is_available() -> bool:
+    if not BOOTSTRAP_SERVERS:
+        return False
+    host, _, port = BOOTSTRAP_SERVERS.split(',')[0].rpartition(':')
+    try:
+        socket.create_connection((host, int(port)), timeout=1).close()
+    except OSError:
+        return False
+    return True
+
+
+def test_serialize_key():
+    assert serialize_key('user') == b'user'
+    assert serialize_key(None) is None
+
+
+@pytest.mark.skipif(not kafka_is_available(), reason='Kafka is not available')
+@pytest.mark.parametrize('path, event', [
+    ('/api/full-view', {}),
+    ('/api/pause', {'pause_at': 12.5}),
+    ('/api/quality-change', {
+        'quality_before': '720p',
+        'quality_after': '1080p',
+        'changed_at': 30,
+    }),
+])
+def test_anonymous_event_without_session(path: str, event: dict):
+    from fastapi.testclient import TestClient
+
+    from asgi_app import app
+
+    event = {
+        **event,
+        'timestamp': int(time.time() * 1000),
+        'film_id': str(uuid4()),
+    }
+    with TestClient(app) as client:
+        response = client.post(path, json=event)
+
+    assert response.status_code == HTTPStatus.OK, response.text